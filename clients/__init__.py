@@ -1,7 +1,9 @@
 from .replicate_client import (
     ReplicateClient,
+    StyleTransferCircuitOpen,
     StyleTransferError,
     StyleTransferRateLimit,
+    StyleTransferRetryLater,
     StyleTransferTimeout,
 )
 from .openai_stylize_client import OpenAIStylizeClient
@@ -2,6 +2,7 @@
 OpenAI image edit API client for style transfer.
 Uses POST /v1/images/edits with text prompts (no reference image).
 """
+import asyncio
 import base64
 import logging
 import time
@@ -9,7 +10,13 @@ from typing import Any, Dict, Optional, Tuple
 
 import httpx
 
-from .replicate_client import StyleTransferError, StyleTransferRateLimit
+from .replicate_client import (
+    StyleTransferCircuitOpen,
+    StyleTransferError,
+    StyleTransferRateLimit,
+    StyleTransferRetryLater,
+    retry_after_seconds,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +37,7 @@ class OpenAIStylizeClient:
         input_fidelity: str = "high",
         rate_limit_retries: int = 4,
         rate_limit_base_wait: float = 15.0,
+        circuit_breaker: Optional[Any] = None,
     ):
         self.api_key = api_key
         self.base_url = (base_url or DEFAULT_BASE_URL).rstrip("/")
@@ -40,6 +48,8 @@ class OpenAIStylizeClient:
         self.input_fidelity = input_fidelity
         self.rate_limit_retries = rate_limit_retries
         self.rate_limit_base_wait = rate_limit_base_wait
+        # services.circuit_breaker.CircuitBreaker: transient errors are reported to it and retries stop once it opens
+        self.circuit_breaker = circuit_breaker
 
     def _headers(self) -> dict:
         return {
@@ -47,18 +57,15 @@ class OpenAIStylizeClient:
             "Content-Type": "application/json",
         }
 
-    def stylize(
+    def _build_request(
         self,
         image_url: str,
         prompt: str,
-        quality: Optional[str] = None,
-        output_format: Optional[str] = None,
-        input_fidelity: Optional[str] = None,
-    ) -> Tuple[bytes, str]:
-        """
-        Apply style transfer using image edit API. Returns (image_bytes, content_type).
-        GPT models return b64_json; we decode and return raw bytes.
-        """
+        quality: Optional[str],
+        output_format: Optional[str],
+        input_fidelity: Optional[str],
+    ) -> Tuple[str, dict, str]:
+        """Validate inputs and build (url, payload, output_format) for /v1/images/edits."""
         if not image_url.startswith("https://"):
             raise StyleTransferError(
                 "Image URL must be public HTTPS (set PUBLIC_BASE_URL on the server)."
@@ -82,76 +89,147 @@ class OpenAIStylizeClient:
             "n": 1,
             "size": "1024x1024",
         }
+        return url, payload, output_format
+
+    def _check_status(self, r: httpx.Response, attempt: int) -> Optional[float]:
+        """Return seconds to wait before retrying, or None if the response is usable. Raises when out of retries
+        (StyleTransferRetryLater for transient errors; with rate_limit_retries=1 that is the first one)."""
+        if r.status_code in (429, 500, 502, 503, 504):
+            wait = self.rate_limit_base_wait * (2**attempt)
+            self._report_transient_error(f"HTTP {r.status_code}")
+            if attempt < self.rate_limit_retries - 1:
+                logger.warning(
+                    "OpenAI image edit transient error (%s), waiting %.0fs before retry %d/%d",
+                    r.status_code,
+                    wait,
+                    attempt + 1,
+                    self.rate_limit_retries,
+                )
+                return wait
+            if r.status_code == 429:
+                raise StyleTransferRateLimit("Rate limit exceeded after retries", retry_after=retry_after_seconds(r))
+            raise StyleTransferRetryLater(
+                f"OpenAI image edit transient error {r.status_code} after retries: {r.text[:500]}",
+                retry_after=retry_after_seconds(r),
+            )
+        if r.status_code >= 400:
+            raise StyleTransferError(
+                f"OpenAI image edit API error {r.status_code}: {r.text[:500]}"
+            )
+        return None
+
+    def _parse_result(self, r: httpx.Response, output_format: str) -> Tuple[Optional[bytes], str, Optional[str]]:
+        """Return (content, content_type, None) for b64 results or (None, "", result_url) when the image must be fetched."""
+        resp = r.json()
+        data = resp.get("data") or []
+        if not data:
+            err = resp.get("error", {})
+            msg = err.get("message", str(err)) if isinstance(err, dict) else str(resp)
+            raise StyleTransferError(f"OpenAI image edit failed: {msg}")
+
+        first = data[0]
+        b64_json = first.get("b64_json")
+        if b64_json:
+            content = base64.b64decode(b64_json)
+            content_type = f"image/{output_format}" if output_format != "jpeg" else "image/jpeg"
+            logger.info("OpenAI image edit completed (b64 decoded)")
+            return content, content_type, None
+
+        result_url = first.get("url")
+        if result_url:
+            return None, "", result_url
+
+        raise StyleTransferError(f"Unexpected OpenAI response format: {first}")
+
+    @staticmethod
+    def _fetched_image(img_r: httpx.Response) -> Tuple[bytes, str]:
+        if img_r.status_code >= 400:
+            raise StyleTransferError(f"Failed to fetch result image: {img_r.status_code}")
+        content_type = img_r.headers.get("content-type", "image/jpeg").split(";")[0].strip()
+        return img_r.content, content_type
+
+    def _report_transient_error(self, reason: str) -> None:
+        """Count a transient error against the breaker; once it is open, give up instead of backing off."""
+        if self.circuit_breaker is None:
+            return
+        self.circuit_breaker.record_failure(reason)
+        if self.circuit_breaker.is_open():
+            raise StyleTransferCircuitOpen(f"OpenAI circuit open after {reason}")
+
+    def _network_retry_wait(self, attempt: int, e: httpx.RequestError) -> float:
+        wait = self.rate_limit_base_wait * (2**attempt)
+        self._report_transient_error(f"network error: {e}")
+        if attempt < self.rate_limit_retries - 1:
+            logger.warning(
+                "OpenAI image edit network error, waiting %.0fs before retry %d/%d: %s",
+                wait,
+                attempt + 1,
+                self.rate_limit_retries,
+                e,
+            )
+            return wait
+        raise StyleTransferRetryLater(f"OpenAI request failed after retries: {e}")
 
+    def stylize(
+        self,
+        image_url: str,
+        prompt: str,
+        quality: Optional[str] = None,
+        output_format: Optional[str] = None,
+        input_fidelity: Optional[str] = None,
+    ) -> Tuple[bytes, str]:
+        """
+        Apply style transfer using image edit API. Returns (image_bytes, content_type).
+        GPT models return b64_json; we decode and return raw bytes.
+        """
+        url, payload, output_format = self._build_request(image_url, prompt, quality, output_format, input_fidelity)
         for attempt in range(self.rate_limit_retries):
             try:
                 with httpx.Client(timeout=self.timeout_seconds) as client:
                     r = client.post(url, json=payload, headers=self._headers())
-
-                if r.status_code in (429, 500, 502, 503, 504):
-                    wait = self.rate_limit_base_wait * (2**attempt)
-                    if attempt < self.rate_limit_retries - 1:
-                        logger.warning(
-                            "OpenAI image edit transient error (%s), waiting %.0fs before retry %d/%d",
-                            r.status_code,
-                            wait,
-                            attempt + 1,
-                            self.rate_limit_retries,
-                        )
-                        time.sleep(wait)
-                        continue
-                    if r.status_code == 429:
-                        raise StyleTransferRateLimit("Rate limit exceeded after retries")
-                    raise StyleTransferError(
-                        f"OpenAI image edit transient error {r.status_code} after retries: {r.text[:500]}"
-                    )
-                if r.status_code >= 400:
-                    raise StyleTransferError(
-                        f"OpenAI image edit API error {r.status_code}: {r.text[:500]}"
-                    )
-
-                resp = r.json()
-                data = resp.get("data") or []
-                if not data:
-                    err = resp.get("error", {})
-                    msg = err.get("message", str(err)) if isinstance(err, dict) else str(resp)
-                    raise StyleTransferError(f"OpenAI image edit failed: {msg}")
-
-                first = data[0]
-                b64_json = first.get("b64_json")
-                if b64_json:
-                    content = base64.b64decode(b64_json)
-                    content_type = f"image/{output_format}" if output_format != "jpeg" else "image/jpeg"
-                    logger.info("OpenAI image edit completed (b64 decoded)")
+                wait = self._check_status(r, attempt)
+                if wait is not None:
+                    time.sleep(wait)
+                    continue
+                content, content_type, result_url = self._parse_result(r, output_format)
+                if content is not None:
                     return content, content_type
+                with httpx.Client(timeout=45) as client:
+                    return self._fetched_image(client.get(result_url))
+            except httpx.RequestError as e:
+                time.sleep(self._network_retry_wait(attempt, e))
 
-                result_url = first.get("url")
-                if result_url:
-                    with httpx.Client(timeout=45) as client:
-                        img_r = client.get(result_url)
-                    if img_r.status_code >= 400:
-                        raise StyleTransferError(f"Failed to fetch result image: {img_r.status_code}")
-                    content_type = img_r.headers.get("content-type", "image/jpeg").split(";")[0].strip()
-                    return img_r.content, content_type
-
-                raise StyleTransferError(f"Unexpected OpenAI response format: {first}")
+        raise StyleTransferRateLimit("Rate limit exceeded")
 
+    async def astylize(
+        self,
+        image_url: str,
+        prompt: str,
+        quality: Optional[str] = None,
+        output_format: Optional[str] = None,
+        input_fidelity: Optional[str] = None,
+    ) -> Tuple[bytes, str]:
+        """Async stylize() on httpx.AsyncClient; backoff waits use asyncio.sleep so no thread is held."""
+        url, payload, output_format = self._build_request(image_url, prompt, quality, output_format, input_fidelity)
+        for attempt in range(self.rate_limit_retries):
+            try:
+                async with httpx.AsyncClient(timeout=self.timeout_seconds) as client:
+                    r = await client.post(url, json=payload, headers=self._headers())
+                    wait = self._check_status(r, attempt)
+                    if wait is None:
+                        content, content_type, result_url = self._parse_result(r, output_format)
+                        if content is not None:
+                            return content, content_type
+                        return self._fetched_image(await client.get(result_url, timeout=45))
+                await asyncio.sleep(wait)
             except httpx.RequestError as e:
-                wait = self.rate_limit_base_wait * (2**attempt)
-                if attempt < self.rate_limit_retries - 1:
-                    logger.warning(
-                        "OpenAI image edit network error, waiting %.0fs before retry %d/%d: %s",
-                        wait,
-                        attempt + 1,
-                        self.rate_limit_retries,
-                        e,
-                    )
-                    time.sleep(wait)
-                    continue
-                raise StyleTransferError(f"OpenAI request failed after retries: {e}")
+                await asyncio.sleep(self._network_retry_wait(attempt, e))
 
         raise StyleTransferRateLimit("Rate limit exceeded")
 
     def get_prediction(self, job_id: str) -> Dict[str, Any]:
         """OpenAI edit is synchronous; no prediction object. Return minimal dict for compatibility."""
         return {"id": job_id, "status": "succeeded", "result_url": job_id}
+
+    async def aget_prediction(self, job_id: str) -> Dict[str, Any]:
+        return self.get_prediction(job_id)
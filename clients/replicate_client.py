@@ -1,6 +1,7 @@
 """
 Replicate API client for style transfer.
 """
+import asyncio
 import logging
 import time
 from typing import Any, Dict, List, Optional
@@ -9,16 +10,40 @@ import httpx
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_BASE_URL = "https://api.replicate.com/v1"
+TERMINAL_STATUSES = ("succeeded", "failed", "canceled")
+
 
 class StyleTransferError(Exception):
     pass
 
-class StyleTransferRateLimit(StyleTransferError):
+class StyleTransferRetryLater(StyleTransferError):
+    """Transient provider error (429/5xx/network) left after the client's own retries; worth another try later.
+    retry_after is the provider's Retry-After hint in seconds, if it sent one."""
+
+    def __init__(self, message: str = "", retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class StyleTransferRateLimit(StyleTransferRetryLater):
     pass
 
 class StyleTransferTimeout(StyleTransferError):
     pass
 
+class StyleTransferCircuitOpen(StyleTransferError):
+    """The provider's circuit breaker is open: fail over instead of waiting on it."""
+    pass
+
+
+def retry_after_seconds(r: httpx.Response) -> Optional[float]:
+    """Retry-After header in seconds (numeric form only), or None."""
+    try:
+        value = float(r.headers.get("retry-after", ""))
+    except ValueError:
+        return None
+    return value if value >= 0 else None
+
 
 class ReplicateClient:
     def __init__(
@@ -29,14 +54,18 @@ class ReplicateClient:
         polling_interval_seconds: int = 5,
         rate_limit_retries: int = 4,
         rate_limit_base_wait: float = 15.0,
+        base_url: Optional[str] = None,
+        circuit_breaker: Optional[Any] = None,
     ):
         self.api_token = api_token
-        self.base_url = "https://api.replicate.com/v1"
+        self.base_url = (base_url or DEFAULT_BASE_URL).rstrip("/")
         self.timeout_seconds = timeout_seconds
         self.polling_timeout = polling_timeout_seconds
         self.polling_interval = polling_interval_seconds
         self.rate_limit_retries = rate_limit_retries
         self.rate_limit_base_wait = rate_limit_base_wait
+        # services.circuit_breaker.CircuitBreaker: transient errors are reported to it and retries stop once it opens
+        self.circuit_breaker = circuit_breaker
 
     def _headers(self) -> dict:
         return {
@@ -47,15 +76,15 @@ class ReplicateClient:
     # fofr/style-transfer: structure_image = pose/face to keep, style_image = artistic style
     STYLE_TRANSFER_VERSION = "fofr/style-transfer:f1023890703bc0a5a3a2c21b5e498833be5f6ef6e70e9daf6b9b3a4fd8309cf0"
 
-    def submit_style_transfer(
+    def _build_submit_payload(
         self,
         image_url: str,
         style_image_url: str,
-        structure_denoising_strength: float = 0.7,
-        prompt_suffix: Optional[str] = None,
-        output_quality: Optional[int] = None,
-    ) -> str:
-        """Submit a style transfer job. Returns prediction ID."""
+        structure_denoising_strength: float,
+        prompt_suffix: Optional[str],
+        output_quality: Optional[int],
+        webhook: Optional[str] = None,
+    ) -> dict:
         if not image_url.startswith("https://") or not style_image_url.startswith("https://"):
             raise StyleTransferError(
                 "Image URLs must be public HTTPS URLs (set PUBLIC_BASE_URL on the server that creates orders)."
@@ -69,7 +98,6 @@ class ReplicateClient:
         )
         if prompt_suffix:
             base_prompt = base_prompt + " " + prompt_suffix.strip()
-        url = f"{self.base_url}/predictions"
         payload = {
             "version": self.STYLE_TRANSFER_VERSION,
             "input": {
@@ -86,46 +114,117 @@ class ReplicateClient:
                 "number_of_images": 1,
             },
         }
+        if webhook:
+            payload["webhook"] = webhook
+            payload["webhook_events_filter"] = ["completed"]
+        return payload
+
+    def _submit_retry_wait(self, r: httpx.Response, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying the submit, or None if the response is usable. Raises when out of retries
+        (StyleTransferRetryLater for transient errors; with rate_limit_retries=1 that is the first one)."""
+        if r.status_code in (429, 500, 502, 503, 504):
+            wait = self.rate_limit_base_wait * (2 ** attempt)
+            self._report_transient_error(f"HTTP {r.status_code}")
+            if attempt < self.rate_limit_retries - 1:
+                logger.warning(
+                    "Replicate transient error (%s), waiting %.0fs before retry %d/%d",
+                    r.status_code,
+                    wait,
+                    attempt + 1,
+                    self.rate_limit_retries,
+                )
+                return wait
+            if r.status_code == 429:
+                raise StyleTransferRateLimit("Rate limit exceeded after retries", retry_after=retry_after_seconds(r))
+            raise StyleTransferRetryLater(
+                f"Replicate transient error {r.status_code} after retries: {r.text}", retry_after=retry_after_seconds(r)
+            )
+        if r.status_code >= 400:
+            raise StyleTransferError(f"Replicate API error {r.status_code}: {r.text}")
+        return None
+
+    def _network_retry_wait(self, attempt: int, e: httpx.RequestError) -> float:
+        wait = self.rate_limit_base_wait * (2 ** attempt)
+        self._report_transient_error(f"network error: {e}")
+        if attempt < self.rate_limit_retries - 1:
+            logger.warning(
+                "Replicate network error, waiting %.0fs before retry %d/%d: %s",
+                wait,
+                attempt + 1,
+                self.rate_limit_retries,
+                e,
+            )
+            return wait
+        raise StyleTransferRetryLater(f"Replicate request failed after retries: {e}")
+
+    def _report_transient_error(self, reason: str) -> None:
+        """Count a transient error against the breaker; once it is open, give up instead of backing off."""
+        if self.circuit_breaker is None:
+            return
+        self.circuit_breaker.record_failure(reason)
+        if self.circuit_breaker.is_open():
+            raise StyleTransferCircuitOpen(f"Replicate circuit open after {reason}")
+
+    @staticmethod
+    def _prediction_id(r: httpx.Response) -> str:
+        data = r.json()
+        prediction_id = data.get("id")
+        if not prediction_id:
+            raise StyleTransferError("No prediction ID returned")
+        logger.info(f"Style transfer job submitted: {prediction_id}")
+        return prediction_id
+
+    def submit_style_transfer(
+        self,
+        image_url: str,
+        style_image_url: str,
+        structure_denoising_strength: float = 0.7,
+        prompt_suffix: Optional[str] = None,
+        output_quality: Optional[int] = None,
+        webhook: Optional[str] = None,
+    ) -> str:
+        """Submit a style transfer job. Returns prediction ID. With webhook, Replicate POSTs the finished prediction there."""
+        payload = self._build_submit_payload(
+            image_url, style_image_url, structure_denoising_strength, prompt_suffix, output_quality, webhook
+        )
+        url = f"{self.base_url}/predictions"
         for attempt in range(self.rate_limit_retries):
             try:
                 with httpx.Client(timeout=self.timeout_seconds) as client:
                     r = client.post(url, json=payload, headers=self._headers())
-                if r.status_code in (429, 500, 502, 503, 504):
-                    wait = self.rate_limit_base_wait * (2 ** attempt)
-                    if attempt < self.rate_limit_retries - 1:
-                        logger.warning(
-                            "Replicate transient error (%s), waiting %.0fs before retry %d/%d",
-                            r.status_code,
-                            wait,
-                            attempt + 1,
-                            self.rate_limit_retries,
-                        )
-                        time.sleep(wait)
-                        continue
-                    if r.status_code == 429:
-                        raise StyleTransferRateLimit("Rate limit exceeded after retries")
-                    raise StyleTransferError(f"Replicate transient error {r.status_code} after retries: {r.text}")
-                if r.status_code >= 400:
-                    raise StyleTransferError(f"Replicate API error {r.status_code}: {r.text}")
-                data = r.json()
-                prediction_id = data.get("id")
-                if not prediction_id:
-                    raise StyleTransferError("No prediction ID returned")
-                logger.info(f"Style transfer job submitted: {prediction_id}")
-                return prediction_id
-            except httpx.RequestError as e:
-                wait = self.rate_limit_base_wait * (2 ** attempt)
-                if attempt < self.rate_limit_retries - 1:
-                    logger.warning(
-                        "Replicate network error, waiting %.0fs before retry %d/%d: %s",
-                        wait,
-                        attempt + 1,
-                        self.rate_limit_retries,
-                        e,
-                    )
+                wait = self._submit_retry_wait(r, attempt)
+                if wait is not None:
                     time.sleep(wait)
                     continue
-                raise StyleTransferError(f"Replicate request failed after retries: {e}")
+                return self._prediction_id(r)
+            except httpx.RequestError as e:
+                time.sleep(self._network_retry_wait(attempt, e))
+        raise StyleTransferRateLimit("Rate limit exceeded")
+
+    async def asubmit_style_transfer(
+        self,
+        image_url: str,
+        style_image_url: str,
+        structure_denoising_strength: float = 0.7,
+        prompt_suffix: Optional[str] = None,
+        output_quality: Optional[int] = None,
+        webhook: Optional[str] = None,
+    ) -> str:
+        """Async submit_style_transfer(); backoff uses asyncio.sleep."""
+        payload = self._build_submit_payload(
+            image_url, style_image_url, structure_denoising_strength, prompt_suffix, output_quality, webhook
+        )
+        url = f"{self.base_url}/predictions"
+        for attempt in range(self.rate_limit_retries):
+            try:
+                async with httpx.AsyncClient(timeout=self.timeout_seconds) as client:
+                    r = await client.post(url, json=payload, headers=self._headers())
+                wait = self._submit_retry_wait(r, attempt)
+                if wait is None:
+                    return self._prediction_id(r)
+                await asyncio.sleep(wait)
+            except httpx.RequestError as e:
+                await asyncio.sleep(self._network_retry_wait(attempt, e))
         raise StyleTransferRateLimit("Rate limit exceeded")
 
     def get_prediction(self, prediction_id: str) -> Dict[str, Any]:
@@ -137,6 +236,43 @@ class ReplicateClient:
                 raise StyleTransferError(f"Get prediction error {r.status_code}: {r.text}")
             return r.json()
 
+    async def aget_prediction(self, prediction_id: str, http: Optional[httpx.AsyncClient] = None) -> Dict[str, Any]:
+        """Async get_prediction(). Pass http to reuse a pooled connection."""
+        url = f"{self.base_url}/predictions/{prediction_id}"
+        if http is not None:
+            r = await http.get(url, headers=self._headers())
+        else:
+            async with httpx.AsyncClient(timeout=self.timeout_seconds) as client:
+                r = await client.get(url, headers=self._headers())
+        if r.status_code >= 400:
+            raise StyleTransferError(f"Get prediction error {r.status_code}: {r.text}")
+        return r.json()
+
+    async def acancel_prediction(self, prediction_id: str) -> None:
+        """Cancel a running prediction (e.g. it lost a hedge). Errors are logged, not raised."""
+        url = f"{self.base_url}/predictions/{prediction_id}/cancel"
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout_seconds) as client:
+                r = await client.post(url, headers=self._headers())
+            if r.status_code >= 400:
+                logger.warning("Cancel prediction %s error %s: %s", prediction_id, r.status_code, r.text[:200])
+        except httpx.RequestError as e:
+            logger.warning("Cancel prediction %s failed: %s", prediction_id, e)
+
+    async def alist_predictions_page(
+        self, http: Optional[httpx.AsyncClient] = None, url: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """One page of recent predictions ({"results": [...], "next": url or None}); url continues from a previous "next"."""
+        url = url or f"{self.base_url}/predictions"
+        if http is not None:
+            r = await http.get(url, headers=self._headers())
+        else:
+            async with httpx.AsyncClient(timeout=self.timeout_seconds) as client:
+                r = await client.get(url, headers=self._headers())
+        if r.status_code >= 400:
+            raise StyleTransferError(f"List predictions error {r.status_code}: {r.text}")
+        return r.json()
+
     def list_predictions(self) -> List[Dict[str, Any]]:
         """List recent predictions (most recent first, 100 per page). Returns list of prediction objects."""
         url = f"{self.base_url}/predictions"
@@ -147,49 +283,64 @@ class ReplicateClient:
             data = r.json()
             return data.get("results", [])
 
+    @staticmethod
+    def terminal_output(data: Dict[str, Any]) -> Optional[str]:
+        """Output URL for a succeeded prediction, None while still running. Raises on failed/canceled."""
+        status = data.get("status", "")
+        if status == "succeeded":
+            output = data.get("output")
+            if isinstance(output, list) and len(output) > 0:
+                first = output[0]
+                if isinstance(first, str):
+                    return first
+                if isinstance(first, dict) and first.get("url"):
+                    return first["url"]
+            if isinstance(output, str):
+                return output
+            raise StyleTransferError(f"Unexpected output format: {output}")
+        if status == "failed":
+            error = data.get("error", "Unknown error")
+            raise StyleTransferError(f"Style transfer failed: {error}")
+        if status == "canceled":
+            raise StyleTransferError("Style transfer was canceled")
+        return None
+
+    def _poll_response_data(self, prediction_id: str, r: httpx.Response) -> Optional[Dict[str, Any]]:
+        """Prediction JSON, or None for a transient status that should be retried."""
+        if r.status_code in (429, 500, 502, 503, 504):
+            logger.warning(
+                "Replicate poll transient status %s for %s; retrying",
+                r.status_code,
+                prediction_id,
+            )
+            return None
+        if r.status_code >= 400:
+            raise StyleTransferError(f"Poll error {r.status_code}: {r.text}")
+        return r.json()
+
+    def _check_poll_timeout(self, start: float) -> None:
+        if time.time() - start > self.polling_timeout:
+            # Replicate didn't finish the job within the limit: server busy, cold start, or job stuck.
+            raise StyleTransferTimeout(
+                f"Polling timed out after {self.polling_timeout}s"
+            )
+
     def poll_result(self, prediction_id: str) -> str:
         """Poll until prediction completes. Returns output URL."""
         url = f"{self.base_url}/predictions/{prediction_id}"
         start = time.time()
         with httpx.Client(timeout=self.timeout_seconds) as client:
             while True:
-                if time.time() - start > self.polling_timeout:
-                    # Replicate didn't finish the job within the limit: server busy, cold start, or job stuck.
-                    raise StyleTransferTimeout(
-                        f"Polling timed out after {self.polling_timeout}s"
-                    )
+                self._check_poll_timeout(start)
                 try:
                     r = client.get(url, headers=self._headers())
                 except httpx.RequestError as e:
                     logger.warning("Replicate poll request error for %s: %s; retrying", prediction_id, e)
                     time.sleep(self.polling_interval)
                     continue
-                if r.status_code in (429, 500, 502, 503, 504):
-                    logger.warning(
-                        "Replicate poll transient status %s for %s; retrying",
-                        r.status_code,
-                        prediction_id,
-                    )
-                    time.sleep(self.polling_interval)
-                    continue
-                if r.status_code >= 400:
-                    raise StyleTransferError(f"Poll error {r.status_code}: {r.text}")
-                data = r.json()
-                status = data.get("status", "")
-                if status == "succeeded":
-                    output = data.get("output")
-                    if isinstance(output, list) and len(output) > 0:
-                        first = output[0]
-                        if isinstance(first, str):
-                            return first
-                        if isinstance(first, dict) and first.get("url"):
-                            return first["url"]
-                    if isinstance(output, str):
-                        return output
-                    raise StyleTransferError(f"Unexpected output format: {output}")
-                if status == "failed":
-                    error = data.get("error", "Unknown error")
-                    raise StyleTransferError(f"Style transfer failed: {error}")
-                if status == "canceled":
-                    raise StyleTransferError("Style transfer was canceled")
+                data = self._poll_response_data(prediction_id, r)
+                if data is not None:
+                    result_url = self.terminal_output(data)
+                    if result_url:
+                        return result_url
                 time.sleep(self.polling_interval)
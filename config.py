@@ -27,14 +27,21 @@ class Settings(BaseSettings):
 
     # Replicate API (when style_transfer_provider=replicate)
     replicate_api_token: str = ""
+    replicate_base_url: Optional[str] = None  # default: https://api.replicate.com/v1 (point at scripts/fake_replicate_server.py locally)
+    replicate_webhooks_enabled: bool = False  # Submit with webhook=PUBLIC_BASE_URL/api/replicate/webhook instead of polling
+    replicate_webhook_secret: Optional[str] = None  # whsec_... from GET /v1/webhooks/default/secret; required for webhook mode
+    replicate_webhook_safety_poll_seconds: int = 60  # Webhook mode: slow GET per prediction in case a delivery is lost
 
     # Timeouts and retries
     api_timeout_seconds: int = 120
     polling_timeout_seconds: int = 600
     polling_interval_seconds: int = 5
     max_retries: int = 3
-    replicate_rate_limit_retries: int = 8
+    replicate_rate_limit_retries: int = 8  # In-client backoff for interactive calls (marketing); queued images never wait in the client
     replicate_rate_limit_base_wait_seconds: int = 40
+    job_max_attempts: int = 6  # Claims per image before a failing image fails its order
+    job_retry_base_seconds: int = 10  # A failed image is due again after base × 2^(attempt-1) (jittered, capped)
+    job_retry_max_seconds: int = 600
 
     # File upload
     upload_dir: Optional[str] = None
@@ -47,10 +54,74 @@ class Settings(BaseSettings):
     db_pool_size: int = 10
     db_max_overflow: int = 15
     result_image_ttl_days: int = 14  # Delete result image blobs from DB after this many days
-
-    # Order processing concurrency (per process; total = this × number of Uvicorn workers)
+    result_cache_enabled: bool = True  # Reuse images generated (within the TTL) for the same photo + style + mode
+    style_variants_enabled: bool = True  # Send providers the capped style images built by scripts/build_style_variants.py
+
+    # Where result/source image bytes live (services/blob_store.py): "db" (bytea columns), "local" or "s3".
+    # Existing rows move with scripts/migrate_blobs.py.
+    blob_store_backend: str = "db"
+    blob_store_dir: Optional[str] = None  # local backend; default: artify_blobs next to the upload dir (use a persistent disk)
+    blob_store_s3_endpoint: Optional[str] = None  # e.g. https://s3.eu-central-1.amazonaws.com or http://127.0.0.1:9000
+    blob_store_s3_bucket: Optional[str] = None
+    blob_store_s3_access_key_id: Optional[str] = None
+    blob_store_s3_secret_access_key: Optional[str] = None
+    blob_store_s3_region: str = "us-east-1"
+    blob_store_s3_prefix: str = ""  # key prefix inside the bucket, e.g. "artify/"
+
+    # Upload preprocessing (Pillow, process pool): EXIF-rotate, strip metadata, downscale for providers
+    provider_image_max_side: int = 1024  # Longest side of the provider-facing source (OpenAI edits run at 1024x1024)
+    provider_image_jpeg_quality: int = 90
+    upload_preprocess_workers: int = 2  # Process pool shared with the result variants below
+
+    # Gallery derivatives of each result (WebP, built in the preprocessing pool at persist time): ?variant=thumb|medium
+    result_variants_enabled: bool = True
+    result_thumb_max_side: int = 320
+    result_medium_max_side: int = 768
+    result_variant_webp_quality: int = 80
+
+    # Order processing concurrency (per process; total = this × number of Uvicorn workers, see global_* caps below)
     max_concurrent_orders: int = 8
-    style_image_delay_seconds: int = 30  # Delay between style images in a pack (provider throttle)
+    order_image_concurrency: int = 5  # Images of one order generated in parallel (still bounded by provider limiters)
+    job_poll_interval_seconds: int = 5  # How often the dispatcher polls art_jobs for due work
+    job_lease_seconds: int = 120  # A claimed job returns to the queue if its worker stops renewing the lease this long
+    job_heartbeat_seconds: int = 30  # How often a worker renews the leases of the jobs it is running
+    scheduler_aging_seconds: int = 60  # Fair scheduler: each minute waiting counts as one marketing-image quantum
+
+    # Cluster-wide caps shared by all web and worker processes through the database (0 = per-process limits only)
+    global_max_concurrent_orders: int = 0  # Orders generating at once across all workers (soft cap at claim time)
+    global_max_concurrent_images: int = 0  # Images at providers at once across all processes (slot leases in art_leases)
+    global_slot_poll_seconds: float = 2.0  # How often an image waiting for a global slot checks for a free one
+
+    # Standalone worker (python -m worker). Set EMBEDDED_WORKER=false on the web service once a worker runs.
+    embedded_worker: bool = True  # Web process also drains the job queue (single-process deploys)
+    worker_max_concurrent_orders: Optional[int] = None  # Worker's own order cap; default: max_concurrent_orders
+    worker_health_port: int = 8081  # GET / on this port returns 200 while the worker is healthy
+    worker_shutdown_grace_seconds: int = 120  # On SIGTERM: stop claiming, wait this long for in-flight jobs
+
+    # Provider throttle shared by all orders in the process (token bucket + in-flight cap; rpm 0 = no bucket)
+    openai_requests_per_minute: int = 20
+    openai_max_concurrent_requests: int = 8
+    replicate_requests_per_minute: int = 30
+    replicate_max_concurrent_requests: int = 8
+
+    # Hedging (OpenAI primary): start the same image on Replicate if OpenAI is slower than its recent pN latency
+    hedging_enabled: bool = False  # Needs REPLICATE_API_TOKEN; first success wins, the other call is cancelled
+    hedging_latency_percentile: float = 90.0
+    hedging_min_samples: int = 20  # Recent OpenAI calls needed before the learned percentile is used
+    hedging_default_delay_seconds: int = 90  # Hedge delay until enough samples exist
+    hedging_min_delay_seconds: int = 20  # Never hedge sooner than this
+
+    # Circuit breaker per provider: trips on error rate or slow-call rate over recent calls; while open,
+    # images go straight to the other provider (OpenAI → Replicate fallback) and client backoff stops
+    circuit_breaker_enabled: bool = True
+    circuit_breaker_window: int = 20  # Most recent calls considered
+    circuit_breaker_min_calls: int = 5  # Calls needed in the window before it can trip
+    circuit_breaker_failure_rate: float = 0.5  # 429/5xx/network errors, failed or timed-out predictions
+    circuit_breaker_slow_call_rate: float = 0.8
+    openai_slow_call_seconds: int = 150  # An OpenAI edit slower than this counts as slow
+    replicate_slow_call_seconds: int = 300  # Submit → finished prediction
+    circuit_breaker_open_seconds: int = 60  # Open → half-open after this long
+    circuit_breaker_half_open_probes: int = 2  # Successful probes needed to close again
 
     # Stripe payments
     stripe_secret_key: Optional[str] = None        # sk_live_... or sk_test_...
@@ -102,3 +173,14 @@ def get_order_results_dir() -> Path:
     p = base / "artify_order_results"
     p.mkdir(parents=True, exist_ok=True)
     return p
+
+
+def get_blob_store_dir() -> Path:
+    """Root of the local blob store (BLOB_STORE_BACKEND=local)."""
+    s = get_settings()
+    if s.blob_store_dir:
+        p = Path(s.blob_store_dir)
+    else:
+        p = get_upload_dir().parent / "artify_blobs"
+    p.mkdir(parents=True, exist_ok=True)
+    return p
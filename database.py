@@ -6,9 +6,9 @@ from datetime import datetime
 from enum import Enum
 from typing import Optional
 
-from sqlalchemy import Column, DateTime, Float, Integer, LargeBinary, String, Text, create_engine, text
+from sqlalchemy import BigInteger, Column, DateTime, Float, Integer, LargeBinary, String, Text, UniqueConstraint, create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import deferred, sessionmaker
 from sqlalchemy import Index
 
 from config import get_settings
@@ -25,6 +25,13 @@ class OrderStatus(str, Enum):
     CANCELLED = "cancelled"
 
 
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
 class Order(Base):
     __tablename__ = "art_orders"
 
@@ -73,20 +80,91 @@ class OrderResultImage(Base):
     order_id = Column(String(50), primary_key=True, nullable=False)
     image_index = Column(Integer, primary_key=True, nullable=False)  # 1-based
     content_type = Column(String(32), nullable=False, default="image/jpeg")
-    data = Column(LargeBinary, nullable=False)
+    data = deferred(Column(LargeBinary))  # image bytes; NULL when they live in the blob store. Loaded on access only
+    blob_key = Column(String(64), index=True)  # services.blob_store key (sha256 of the bytes) when not stored in data
+    sha256 = Column(String(64))  # hex digest of the image bytes; the HTTP ETag (filled on first serve for older rows)
+    byte_size = Column(Integer)
+    crc32 = Column(BigInteger)  # zlib.crc32 of the bytes (unsigned), so the ZIP download can stream without a second read
+    width = Column(Integer)  # pixels, set when variants are built (srcset)
+    height = Column(Integer)
+    cache_key = Column(String(64), index=True)  # services.result_cache key; reused by later orders for the same photo
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class OrderResultVariant(Base):
+    """Downscaled WebP copy of a result image for the gallery (?variant=thumb|medium). Same storage and TTL as the result."""
+    __tablename__ = "art_order_result_variants"
+
+    order_id = Column(String(50), primary_key=True, nullable=False)
+    image_index = Column(Integer, primary_key=True, nullable=False)
+    variant = Column(String(16), primary_key=True, nullable=False)  # thumb | medium
+    content_type = Column(String(32), nullable=False, default="image/webp")
+    data = deferred(Column(LargeBinary))  # NULL when the bytes live in the blob store
+    blob_key = Column(String(64), index=True)
+    sha256 = Column(String(64), nullable=False)
+    byte_size = Column(Integer, nullable=False)
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
 
 class OrderSourceImage(Base):
-    """Customer upload stored at order creation so style transfer works after redeploy."""
+    """Customer upload stored at order creation so style transfer works after redeploy.
+    data is the provider-facing image (preprocessed upload); original_* keep the file as uploaded.
+    With a blob store, data/original_data are NULL and blob_key/original_blob_key point at the bytes."""
     __tablename__ = "art_order_source_images"
 
     order_id = Column(String(50), primary_key=True, nullable=False)
     content_type = Column(String(32), nullable=False, default="image/jpeg")
-    data = Column(LargeBinary, nullable=False)
+    data = deferred(Column(LargeBinary))
+    blob_key = Column(String(64))
+    sha256 = Column(String(64))  # hex digest of data; part of the result cache key and the HTTP ETag
+    byte_size = Column(Integer)
+    original_content_type = Column(String(32))
+    original_data = deferred(Column(LargeBinary))  # upload as sent (None when data is the original); loaded on access only
+    original_blob_key = Column(String(64))
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
 
+class ImageJob(Base):
+    """One unit of generation work: a single (order, style image) pair. Claimed by workers with a lease."""
+    __tablename__ = "art_jobs"
+
+    id = Column(Integer, primary_key=True)
+    order_id = Column(String(50), nullable=False, index=True)
+    image_index = Column(Integer, nullable=False)  # 1-based, same numbering as art_order_result_images
+    style_image_url = Column(Text, nullable=False)
+    status = Column(String(20), default=JobStatus.QUEUED.value, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)  # number of times a worker claimed this job
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    locked_by = Column(String(64))  # worker id holding the lease while status=running
+    locked_until = Column(DateTime)  # lease expiry; expired running jobs are claimable again
+    result_url = Column(Text)  # permanent result URL once done
+    provider_job_id = Column(Text)  # OpenAI marker or Replicate prediction id
+    provider_submitted_at = Column(DateTime)  # when provider_job_id was submitted; a reclaimed job resumes it
+    prediction_details = Column(Text)  # JSON object, same shape as one replicate_prediction_details entry
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("order_id", "image_index", name="uq_art_jobs_order_image"),
+        Index("ix_art_jobs_due", "status", "next_attempt_at"),
+        Index("ix_art_jobs_provider_job_id", "provider_job_id"),
+    )
+
+
+class Lease(Base):
+    """Named cross-process lock: held by owner until expires_at unless renewed (services/leases.py)."""
+    __tablename__ = "art_leases"
+
+    name = Column(String(128), primary_key=True)  # e.g. "order:ART-…"
+    owner = Column(String(64), nullable=False)  # worker id (services.job_queue.WORKER_ID)
+    acquired_at = Column(DateTime, default=datetime.utcnow, nullable=False)  # when owner took it over
+    heartbeat_at = Column(DateTime, default=datetime.utcnow, nullable=False)  # last acquire/renew by owner
+    expires_at = Column(DateTime, nullable=False)  # free for anyone once this has passed
+
+
 class AnalyticsEvent(Base):
     """Persistent analytics events for dashboard: page views, time on page, sessions, drop-off, referrer/UTM."""
     __tablename__ = "art_analytics_events"
@@ -138,7 +216,7 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
 def init_db():
-    # Creates art_orders, art_order_result_images, art_order_source_images
+    # Creates art_orders, art_order_result_images, art_order_result_variants, art_order_source_images, art_jobs, art_leases
     Base.metadata.create_all(bind=engine)
     # Ensure style_image_urls exists for Masters pack (existing DBs from before this column)
     for col_sql in (
@@ -147,6 +225,25 @@ def init_db():
         "ALTER TABLE art_orders ADD COLUMN IF NOT EXISTS replicate_prediction_details TEXT",
         "ALTER TABLE art_orders ALTER COLUMN style_transfer_job_id TYPE TEXT",
         "ALTER TABLE art_orders ADD COLUMN IF NOT EXISTS retry_count INTEGER NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS ix_art_jobs_provider_job_id ON art_jobs (provider_job_id)",
+        "ALTER TABLE art_order_source_images ADD COLUMN IF NOT EXISTS sha256 VARCHAR(64)",
+        "ALTER TABLE art_order_source_images ADD COLUMN IF NOT EXISTS original_content_type VARCHAR(32)",
+        "ALTER TABLE art_order_source_images ADD COLUMN IF NOT EXISTS original_data BYTEA",
+        "ALTER TABLE art_order_result_images ADD COLUMN IF NOT EXISTS cache_key VARCHAR(64)",
+        "ALTER TABLE art_jobs ADD COLUMN IF NOT EXISTS provider_submitted_at TIMESTAMP",
+        "CREATE INDEX IF NOT EXISTS ix_art_order_result_images_cache_key ON art_order_result_images (cache_key)",
+        "ALTER TABLE art_order_result_images ADD COLUMN IF NOT EXISTS blob_key VARCHAR(64)",
+        "ALTER TABLE art_order_result_images ALTER COLUMN data DROP NOT NULL",
+        "CREATE INDEX IF NOT EXISTS ix_art_order_result_images_blob_key ON art_order_result_images (blob_key)",
+        "ALTER TABLE art_order_source_images ADD COLUMN IF NOT EXISTS blob_key VARCHAR(64)",
+        "ALTER TABLE art_order_source_images ADD COLUMN IF NOT EXISTS original_blob_key VARCHAR(64)",
+        "ALTER TABLE art_order_source_images ALTER COLUMN data DROP NOT NULL",
+        "ALTER TABLE art_order_result_images ADD COLUMN IF NOT EXISTS sha256 VARCHAR(64)",
+        "ALTER TABLE art_order_result_images ADD COLUMN IF NOT EXISTS byte_size INTEGER",
+        "ALTER TABLE art_order_source_images ADD COLUMN IF NOT EXISTS byte_size INTEGER",
+        "ALTER TABLE art_order_result_images ADD COLUMN IF NOT EXISTS width INTEGER",
+        "ALTER TABLE art_order_result_images ADD COLUMN IF NOT EXISTS height INTEGER",
+        "ALTER TABLE art_order_result_images ADD COLUMN IF NOT EXISTS crc32 BIGINT",
     ):
         try:
             with engine.connect() as conn:
@@ -2,7 +2,6 @@
 FastAPI application for AI art style transfer.
 """
 import asyncio
-import io
 import json
 import logging
 import re
@@ -10,11 +9,12 @@ import shutil
 import sys
 import time
 import uuid
-import zipfile
+import zlib
 from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
+from functools import partial
 from pathlib import Path
 from typing import AsyncGenerator, Optional
 from urllib.parse import urlparse
@@ -23,16 +23,17 @@ import httpx
 import stripe
 import secrets
 from fastapi import BackgroundTasks, Depends, FastAPI, File, Form, HTTPException, Request, UploadFile
-from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, RedirectResponse, Response
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from starlette.middleware.base import BaseHTTPMiddleware
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy import func, text
+from sqlalchemy import exists, func
 from sqlalchemy.orm import Session
 
 from clients import (
     OpenAIStylizeClient,
     ReplicateClient,
+    StyleTransferCircuitOpen,
     StyleTransferError,
     StyleTransferRateLimit,
     StyleTransferTimeout,
@@ -53,6 +54,11 @@ def _resolve_style_image_url(style_image_url: Optional[str]) -> Optional[str]:
     return url
 
 
+def _provider_style_url(style_path: Optional[str]) -> Optional[str]:
+    """Public URL of the provider variant of a pack style image (original if none was built)."""
+    return _resolve_style_image_url(provider_style_path(style_path))
+
+
 def _fetch_one_result_url(index: int, url: str, order_id: str) -> tuple[int, bytes | None, str | None]:
     """Fetch a single result URL; returns (index, content, content_type) or (index, None, None) on failure."""
     try:
@@ -68,23 +74,49 @@ def _fetch_one_result_url(index: int, url: str, order_id: str) -> tuple[int, byt
         return (index, None, None)
 
 
-def _persist_result_images(order_id: str, result_items: list) -> list[str]:
+class ResultPersistError(Exception):
+    """A generated image could not be stored (blob store or DB write failed); its job is retried."""
+
+
+def _persist_result_images(
+    order_id: str,
+    result_items: list,
+    indices: Optional[list[int]] = None,
+    cache_keys: Optional[list[Optional[str]]] = None,
+) -> list[str]:
     """
-    Persist result images to DB and disk. Fetches URLs in parallel, then writes in order.
-    Each item can be: str (URL), or dict with "content" (bytes) and "content_type".
-    Returns list of permanent URLs.
+    Persist result images to the blob store (or DB + disk without one), with their gallery variants (thumb/medium
+    WebP, art_order_result_variants). Fetches URLs in parallel, then writes in order.
+    Each item can be: str (URL), dict with "content" (bytes) and "content_type", or dict with "blob_key" and
+    "content_type" (bytes already in the blob store, e.g. a result cache hit).
+    indices gives the 1-based image_index of each item (default 1..len(result_items)).
+    cache_keys (same order) tags each row for the result cache (services/result_cache.py).
+    Returns list of permanent URLs (same order as result_items).
     """
     base_url = (get_settings().public_base_url or "").rstrip("/")
     if not base_url:
         logger.warning("PUBLIC_BASE_URL not set; cannot create permanent result URLs")
         return [str(x) if isinstance(x, str) else "" for x in result_items]
+    if indices is None:
+        indices = list(range(1, len(result_items) + 1))
     try:
+        store = get_blob_store()
         results_dir = get_order_results_dir() / order_id
-        results_dir.mkdir(parents=True, exist_ok=True)
+        if store is None:
+            results_dir.mkdir(parents=True, exist_ok=True)
         # Phase 1: collect in-memory items and URL fetch tasks
-        resolved: dict[int, tuple[bytes, str]] = {}
+        resolved: dict[int, tuple[Optional[bytes], str]] = {}
+        blob_keys: dict[int, str] = {}
         url_tasks: list[tuple[int, str]] = []
         for i, item in enumerate(result_items, start=1):
+            if isinstance(item, dict) and "blob_key" in item:
+                content_type = item.get("content_type", "image/jpeg").split(";")[0].strip()
+                if store is None:
+                    item = {"content": read_blob(item["blob_key"]), "content_type": content_type}
+                else:
+                    resolved[i] = (None, content_type)
+                    blob_keys[i] = item["blob_key"]
+                    continue
             if isinstance(item, dict) and "content" in item:
                 content = item["content"]
                 content_type = item.get("content_type", "image/jpeg").split(";")[0].strip()
@@ -105,7 +137,39 @@ def _persist_result_images(order_id: str, result_items: list) -> list[str]:
                         if ct not in ("image/jpeg", "image/png", "image/webp"):
                             ct = "image/jpeg"
                         resolved[idx] = (content, ct)
-        # Phase 3: write to DB and disk in index order
+        # Phase 2a: gallery variants (WebP thumb/medium) in the process pool and the CRC-32 for the ZIP download;
+        # a cache hit's bytes come from the store
+        sizes: dict[int, tuple[int, int]] = {}
+        variants: dict[int, dict[str, tuple[bytes, int, int]]] = {}
+        checksums: dict[int, tuple[int, int]] = {}  # index -> (byte_size, crc32)
+        hit_bytes: dict[int, bytes] = {}  # cache hits: put again below in case a TTL cleanup just removed the blob
+        for i, (content, _) in resolved.items():
+            try:
+                data = content if content is not None else read_blob(blob_keys[i])
+            except BlobNotFoundError:
+                continue
+            if content is None:
+                hit_bytes[i] = data
+            checksums[i] = (len(data), zlib.crc32(data))
+            built = result_variants_sync(data)
+            if built:
+                sizes[i], variants[i] = built
+        # Phase 2b: upload bytes to the blob store before taking a DB connection
+        digests = {i: blob_keys.get(i) or blob_key(content) for i, (content, _) in resolved.items()}
+        variant_keys: dict[tuple[int, str], str] = {}
+        if store is not None:
+            try:
+                for i, (content, _) in resolved.items():
+                    if i not in blob_keys:
+                        blob_keys[i] = store.put(content)
+                    elif i in hit_bytes:
+                        store.put(hit_bytes[i])  # idempotent; same key
+                    for name, (variant_bytes, _, _) in variants.get(i, {}).items():
+                        variant_keys[i, name] = store.put(variant_bytes)
+            except Exception as e:
+                logger.warning("Blob store put for result images of %s failed: %s", order_id, e)
+                return [str(x) if isinstance(x, str) else "" for x in result_items]
+        # Phase 3: write to DB (and disk without a blob store) in index order
         permanent: list[str] = [""] * len(result_items)
         db = SessionLocal()
         write_ok = True
@@ -116,28 +180,59 @@ def _persist_result_images(order_id: str, result_items: list) -> list[str]:
                     continue
                 try:
                     content, content_type = resolved[i]
+                    image_index = indices[i - 1]
                     row = OrderResultImage(
                         order_id=order_id,
-                        image_index=i,
+                        image_index=image_index,
                         content_type=content_type,
-                        data=content,
+                        data=content if store is None else None,
+                        blob_key=blob_keys.get(i),
+                        sha256=digests[i],
+                        byte_size=checksums[i][0] if i in checksums else None,  # missing blob: filled on first serve
+                        crc32=checksums[i][1] if i in checksums else None,
+                        width=sizes[i][0] if i in sizes else None,
+                        height=sizes[i][1] if i in sizes else None,
+                        cache_key=cache_keys[i - 1] if cache_keys else None,
                     )
                     db.merge(row)
-                    ext = "jpg"
-                    if "png" in content_type:
-                        ext = "png"
-                    elif "webp" in content_type:
-                        ext = "webp"
-                    path = results_dir / f"{i}.{ext}"
-                    path.write_bytes(content)
-                    permanent[i - 1] = f"{base_url}/api/orders/{order_id}/result/{i}"
+                    # Drop variants of an earlier attempt at this index that this one did not rebuild
+                    db.query(OrderResultVariant).filter(
+                        OrderResultVariant.order_id == order_id,
+                        OrderResultVariant.image_index == image_index,
+                        OrderResultVariant.variant.notin_(list(variants.get(i, {}))),
+                    ).delete(synchronize_session=False)
+                    for name, (variant_bytes, width, height) in variants.get(i, {}).items():
+                        db.merge(OrderResultVariant(
+                            order_id=order_id,
+                            image_index=image_index,
+                            variant=name,
+                            content_type="image/webp",
+                            data=variant_bytes if store is None else None,
+                            blob_key=variant_keys.get((i, name)),
+                            sha256=variant_keys.get((i, name)) or blob_key(variant_bytes),
+                            byte_size=len(variant_bytes),
+                            width=width,
+                            height=height,
+                        ))
+                    if store is None:
+                        ext = "jpg"
+                        if "png" in content_type:
+                            ext = "png"
+                        elif "webp" in content_type:
+                            ext = "webp"
+                        path = results_dir / f"{image_index}.{ext}"
+                        path.write_bytes(content)
+                    permanent[i - 1] = f"{base_url}/api/orders/{order_id}/result/{image_index}"
                 except Exception as e:
                     logger.warning("Persist result image %s for %s failed: %s", i, order_id, e)
                     permanent[i - 1] = str(result_items[i - 1]) if isinstance(result_items[i - 1], str) else ""
                     write_ok = False
             if write_ok:
                 db.commit()
-                logger.info("Persisted %d result images for order %s (DB + disk)", len([p for p in permanent if p]), order_id)
+                logger.info(
+                    "Persisted %d result images for order %s (%s)",
+                    len([p for p in permanent if p]), order_id, f"blob store: {store.name}" if store else "DB + disk",
+                )
                 return permanent
             db.rollback()
         finally:
@@ -147,18 +242,87 @@ def _persist_result_images(order_id: str, result_items: list) -> list[str]:
     return [str(x) if isinstance(x, str) else "" for x in result_items]
 
 
-from database import AnalyticsEvent, Order, OrderResultImage, OrderSourceImage, OrderStatus, get_db, SessionLocal, init_db
+from database import (
+    AnalyticsEvent,
+    ImageJob,
+    JobStatus,
+    Order,
+    OrderResultImage,
+    OrderResultVariant,
+    OrderSourceImage,
+    OrderStatus,
+    engine,
+    get_db,
+    SessionLocal,
+    init_db,
+)
 from models import StyleTransferResponse
 from models.order_schemas import (
     AnalyticsEventPayload,
     AnalyticsEventsRequest,
     OrderCreateRequest,
     OrderResponse,
+    OrderImageStatus,
     OrderStatusResponse,
     DashboardOrderSummary,
 )
 from services import StyleTransferService
 from services.email_service import EmailService
+from services.global_slots import GlobalSlots
+from services.scheduler import (
+    PRIORITY_FRESH,
+    PRIORITY_MARKETING,
+    PRIORITY_RESUMED,
+    PRIORITY_RETRY,
+    FairScheduler,
+)
+from services.circuit_breaker import circuit_breaker_stats, get_circuit_breaker, provider_accepting
+from services.hedging import get_latency_tracker, hedge_delay, hedged_call, hedging_stats
+from services.image_preprocess import (
+    PROVIDER_IMAGE_FILENAME,
+    UnreadableImage,
+    preprocess_upload,
+    result_variants_sync,
+    shutdown_preprocess_pool,
+)
+from services.result_cache import find_cached_result, result_cache_key, source_digest
+from services.blob_store import (
+    BlobNotFoundError,
+    blob_key,
+    blob_size,
+    delete_unreferenced_blobs,
+    get_blob_store,
+    open_blob,
+    read_blob,
+)
+from services.http_cache import (
+    PRIVATE_IMMUTABLE_CACHE_CONTROL,
+    REVALIDATE_CACHE_CONTROL,
+    RangeNotSatisfiable,
+    etag_matches,
+    parse_byte_range,
+    strong_etag,
+)
+from services.zip_stream import ZipMember, stream_zip, zip_length
+from services.style_variants import provider_style_path
+from services.prediction_poller import poller_stats, recent_prediction
+from services.rate_limiter import get_provider_limiter
+from services.replicate_webhooks import TERMINAL_STATUSES, verify_signature, waiters as prediction_waiters
+from services.job_queue import (
+    WORKER_ID,
+    claim_jobs,
+    enqueue_order_jobs,
+    fail_pending_jobs,
+    mark_job_done,
+    mark_job_failed,
+    order_jobs,
+    release_job,
+    renew_job_leases,
+    requeue_order_jobs,
+    retry_delay,
+)
+from services.leases import acquire_lease, release_lease
+from services.order_events import hub as order_event_hub, notify_order_changed, start_listener, stop_listener
 
 logging.basicConfig(
     level=logging.INFO,
@@ -172,12 +336,18 @@ logging.getLogger("httpcore").setLevel(logging.WARNING)
 
 STATIC_DIR = Path(__file__).parent / "static"
 IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
-_ACTIVE_ORDER_TASKS: set[str] = set()
+# art_jobs ids currently being generated by this process
+_ACTIVE_JOB_IDS: dict[int, str] = {}  # job id -> order id, for jobs this process is running
+_dispatch_wakeup: asyncio.Event | None = None
+_DISPATCHED_TASKS: set[asyncio.Task] = set()
+_last_dispatch_tick: float = 0.0
 _DB_INIT_STARTED = False
 
-# Max number of orders processed at the same time (backend-only; no UX change).
-# If you run multiple Uvicorn workers, this limit is per process (e.g. 2 workers => up to 16 concurrent).
-_order_concurrency_semaphore: asyncio.Semaphore | None = None
+# Image-level fair scheduler: MAX_CONCURRENT_ORDERS × ORDER_IMAGE_CONCURRENCY generation slots per process
+# (e.g. 2 Uvicorn workers => twice that), shared fairly across orders and priority classes.
+_scheduler: FairScheduler | None = None
+# Cluster-wide image cap (GLOBAL_MAX_CONCURRENT_IMAGES) shared with every other web/worker process via art_leases
+_global_slots: GlobalSlots | None = None
 
 # Orders older than this are deleted by the TTL cleanup job
 ORDER_TTL_DAYS = 14
@@ -186,18 +356,40 @@ ORDER_TTL_DAYS = 14
 FAILED_ORDER_RETRY_DAYS = 3
 FAILED_ORDER_RETRY_COOLDOWN_MINUTES = 30
 
+# How often the dispatcher looks for paid orders without jobs and failed orders to retry
+ORDER_SWEEP_INTERVAL_SECONDS = 60
+
+# Periodic jobs run in one process per interval, cluster-wide: each run takes an art_leases row for the
+# interval (see _claim_periodic_run_sync). Processes check every *_CHECK_SECONDS whether a run is due.
+ORDER_SWEEP_LEASE = "periodic:order-sweep"
+ORDER_SWEEP_CHECK_SECONDS = 15
+TTL_CLEANUP_LEASE = "periodic:ttl-cleanup"
+TTL_CLEANUP_INTERVAL_SECONDS = 24 * 3600
+TTL_CLEANUP_CHECK_SECONDS = 3600
+
+# art_leases lock held while an order's jobs are enqueued (webhook, sweep and retries can race); expires if the holder dies
+ORDER_LOCK_TTL_SECONDS = 60
+
+# Claims of an image that try OpenAI first; later claims (and a failure on this one) use the Replicate fallback
+OPENAI_ATTEMPTS_BEFORE_FALLBACK = 3
+
 
-def get_provider() -> ReplicateClient | OpenAIStylizeClient:
+def get_provider(defer_retries: bool = False) -> ReplicateClient | OpenAIStylizeClient:
+    """Client for STYLE_TRANSFER_PROVIDER. defer_retries: transient errors raise StyleTransferRetryLater at once
+    instead of backing off inside the client (queued images are rescheduled via art_jobs.next_attempt_at)."""
     settings = get_settings()
     provider = (settings.style_transfer_provider or "openai").strip().lower()
+    rate_limit_retries = 1 if defer_retries else settings.replicate_rate_limit_retries
     if provider == "replicate":
         return ReplicateClient(
             api_token=settings.replicate_api_token,
             timeout_seconds=settings.api_timeout_seconds,
             polling_timeout_seconds=settings.polling_timeout_seconds,
             polling_interval_seconds=settings.polling_interval_seconds,
-            rate_limit_retries=settings.replicate_rate_limit_retries,
+            rate_limit_retries=rate_limit_retries,
             rate_limit_base_wait=float(settings.replicate_rate_limit_base_wait_seconds),
+            base_url=settings.replicate_base_url,
+            circuit_breaker=get_circuit_breaker("replicate"),
         )
     return OpenAIStylizeClient(
         api_key=settings.openai_api_key,
@@ -205,16 +397,17 @@ def get_provider() -> ReplicateClient | OpenAIStylizeClient:
         timeout_seconds=settings.api_timeout_seconds,
         model=settings.openai_stylize_model or "gpt-image-1.5",
         quality=settings.openai_stylize_quality or "low",
-        rate_limit_retries=settings.replicate_rate_limit_retries,
+        rate_limit_retries=rate_limit_retries,
         rate_limit_base_wait=float(settings.replicate_rate_limit_base_wait_seconds),
+        circuit_breaker=get_circuit_breaker("openai"),
     )
 
 
-def get_service() -> StyleTransferService:
-    return StyleTransferService(provider=get_provider())
+def get_service(defer_retries: bool = False) -> StyleTransferService:
+    return StyleTransferService(provider=get_provider(defer_retries), prediction_lookup=_stored_webhook_prediction)
 
 
-def get_replicate_service() -> Optional[StyleTransferService]:
+def get_replicate_service(defer_retries: bool = False) -> Optional[StyleTransferService]:
     """Replicate service for fallback when OpenAI fails. Returns None if replicate_api_token is not set."""
     settings = get_settings()
     if not (settings.replicate_api_token or "").strip():
@@ -225,19 +418,49 @@ def get_replicate_service() -> Optional[StyleTransferService]:
             timeout_seconds=settings.api_timeout_seconds,
             polling_timeout_seconds=settings.polling_timeout_seconds,
             polling_interval_seconds=settings.polling_interval_seconds,
-            rate_limit_retries=settings.replicate_rate_limit_retries,
+            rate_limit_retries=1 if defer_retries else settings.replicate_rate_limit_retries,
             rate_limit_base_wait=float(settings.replicate_rate_limit_base_wait_seconds),
-        )
+            base_url=settings.replicate_base_url,
+            circuit_breaker=get_circuit_breaker("replicate"),
+        ),
+        prediction_lookup=_stored_webhook_prediction,
     )
 
 
-def _get_order_semaphore() -> asyncio.Semaphore:
-    """Lazy-init semaphore so it's created inside the event loop."""
-    global _order_concurrency_semaphore
-    if _order_concurrency_semaphore is None:
-        n = get_settings().max_concurrent_orders
-        _order_concurrency_semaphore = asyncio.Semaphore(n)
-    return _order_concurrency_semaphore
+def _get_scheduler(max_concurrent_orders: Optional[int] = None) -> FairScheduler:
+    """Lazy-init scheduler so it's created inside the event loop. Passing max_concurrent_orders resizes it."""
+    global _scheduler
+    if _scheduler is None or max_concurrent_orders:
+        s = get_settings()
+        n = max_concurrent_orders or s.max_concurrent_orders
+        _scheduler = FairScheduler(
+            slots=n * s.order_image_concurrency,
+            per_flow_limit=s.order_image_concurrency,
+            aging_seconds=s.scheduler_aging_seconds,
+        )
+    return _scheduler
+
+
+def _get_global_slots() -> GlobalSlots:
+    """Lazy-init so the slot pool is created inside the event loop."""
+    global _global_slots
+    if _global_slots is None:
+        s = get_settings()
+        _global_slots = GlobalSlots(
+            "images",
+            s.global_max_concurrent_images,
+            ttl_seconds=s.job_lease_seconds,
+            poll_seconds=s.global_slot_poll_seconds,
+        )
+    return _global_slots
+
+
+@asynccontextmanager
+async def _generation_slot(flow: str, priority: str) -> AsyncGenerator[None, None]:
+    """Fair per-process slot first, then a cluster-wide one (when GLOBAL_MAX_CONCURRENT_IMAGES is set)."""
+    async with _get_scheduler().slot(flow, priority):
+        async with _get_global_slots().slot():
+            yield
 
 
 _dashboard_basic = HTTPBasic(auto_error=False)
@@ -281,19 +504,32 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
         logger.warning("Email: No provider configured (set RESEND_API_KEY in Render env)")
     get_upload_dir().mkdir(parents=True, exist_ok=True)
     _start_db_init_once()
-    supervisor_task = asyncio.create_task(_processing_supervisor_loop())
+    # SSE order streams: wake on changes from this process and, via LISTEN/NOTIFY, from the worker
+    start_listener(engine, asyncio.get_running_loop())
+    # With EMBEDDED_WORKER=false a separate `python -m worker` drains the queue; this process only enqueues.
+    supervisor_task = asyncio.create_task(_job_dispatch_loop()) if s.embedded_worker else None
+    # Also without the embedded worker: marketing previews hold global slots in this process
+    heartbeat_task = asyncio.create_task(_job_lease_heartbeat_loop())
+    if not s.embedded_worker:
+        logger.info("Embedded worker disabled; orders are processed by the standalone worker")
     cleanup_task = asyncio.create_task(_ttl_cleanup_loop())
     yield
-    supervisor_task.cancel()
+    for task in (supervisor_task, heartbeat_task):
+        if task:
+            task.cancel()
     cleanup_task.cancel()
-    try:
-        await supervisor_task
-    except asyncio.CancelledError:
-        pass
+    for task in (supervisor_task, heartbeat_task):
+        if task:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
     try:
         await cleanup_task
     except asyncio.CancelledError:
         pass
+    shutdown_preprocess_pool()
+    stop_listener()
     logger.info("Artify service shutting down")
 
 
@@ -648,7 +884,7 @@ async def get_dashboard_orders(
         if o.result_urls:
             try:
                 arr = json.loads(o.result_urls) if isinstance(o.result_urls, str) else (o.result_urls or [])
-                result_count = len(arr) if isinstance(arr, list) else None
+                result_count = len([u for u in arr if u]) if isinstance(arr, list) else None  # "" = not done yet
             except Exception:
                 pass
         out.append(
@@ -686,6 +922,30 @@ async def get_dashboard_orders(
     return out
 
 
+@app.get("/api/dashboard/scheduler")
+async def get_dashboard_scheduler(_: None = Depends(require_dashboard)) -> JSONResponse:
+    """Generation scheduler and provider limiter snapshot for this process: queue depth and waits per priority class."""
+    return JSONResponse({
+        **_dispatch_status(),
+        "providers": [get_provider_limiter(name).stats() for name in ("openai", "replicate")],
+        "replicate_pollers": poller_stats(),
+        "hedging": hedging_stats(),
+        "circuit_breakers": circuit_breaker_stats(),
+        "order_streams": order_event_hub.stats(),
+    })
+
+
+@app.get("/api/dashboard/providers")
+async def get_dashboard_providers(_: None = Depends(require_dashboard)) -> JSONResponse:
+    """Provider health for the dashboard card: circuit breaker state and limiter load per provider (this process)."""
+    breakers = {b["provider"]: b for b in circuit_breaker_stats()}
+    providers = []
+    for name in ("openai", "replicate"):
+        breaker = breakers.get(name) or {"provider": name, "state": "closed" if get_settings().circuit_breaker_enabled else "disabled"}
+        providers.append({**breaker, "limiter": get_provider_limiter(name).stats()})
+    return JSONResponse({"providers": providers})
+
+
 @app.get("/api/dashboard/traffic")
 async def get_dashboard_traffic(
     _: None = Depends(require_dashboard),
@@ -1009,7 +1269,7 @@ async def get_last_order_results(db: Session = Depends(get_db)) -> JSONResponse:
 
 @app.post("/api/debug/resume-order/{order_id}")
 async def resume_order(order_id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    """Resume a stuck processing order (e.g. after host killed the worker). Picks up from last saved result."""
+    """Resume a stuck processing order (e.g. after host killed the worker). Enqueues missing jobs; expired leases are reclaimed."""
     order = db.query(Order).filter(Order.order_id == order_id).first()
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -1075,60 +1335,157 @@ def _last_order_with_result_urls(db: Session):
     return order, urls
 
 
-def _target_image_count(order: Order) -> int:
-    """How many style outputs this order should produce."""
+def _style_urls_for_order(order: Order) -> list[str]:
+    """Style reference URLs this order should produce, in result order (pack list or single style)."""
+    style_urls = []
     if order.style_image_urls:
         try:
-            arr = json.loads(order.style_image_urls) if isinstance(order.style_image_urls, str) else (order.style_image_urls or [])
-            if isinstance(arr, list):
-                return len(arr)
-        except Exception:
-            pass
-    return 1 if order.style_image_url else 0
+            style_urls = json.loads(order.style_image_urls) if isinstance(order.style_image_urls, str) else (order.style_image_urls or [])
+        except (json.JSONDecodeError, TypeError):
+            style_urls = []
+    if not isinstance(style_urls, list):
+        style_urls = []
+    if not style_urls and order.style_image_url:
+        style_urls = [order.style_image_url]
+    return style_urls
 
 
-def _done_image_count(order: Order) -> int:
-    if not order.result_urls:
-        return 0
-    try:
-        arr = json.loads(order.result_urls) if isinstance(order.result_urls, str) else (order.result_urls or [])
-        return len(arr) if isinstance(arr, list) else 0
-    except Exception:
-        return 0
+def _get_dispatch_wakeup() -> asyncio.Event:
+    global _dispatch_wakeup
+    if _dispatch_wakeup is None:
+        _dispatch_wakeup = asyncio.Event()
+    return _dispatch_wakeup
+
 
+def _wake_dispatcher() -> None:
+    """Let the dispatch loop claim new work now instead of at its next poll."""
+    _get_dispatch_wakeup().set()
 
-async def _processing_supervisor_loop() -> None:
-    """Self-heal stuck orders without external cron.
-    Scans paid/processing orders and re-queues unfinished ones.
+
+async def _job_dispatch_loop(
+    max_concurrent_orders: Optional[int] = None,
+    stop_event: Optional[asyncio.Event] = None,
+) -> None:
+    """Drain the art_jobs queue without external cron.
+    Claims due image jobs (SKIP LOCKED) with a lookahead of twice the generation slots, so the
+    fair scheduler sees several orders at once; runs them grouped per order, and periodically
+    enqueues paid orders that have no jobs yet plus failed orders eligible for retry (one process
+    per ORDER_SWEEP_INTERVAL_SECONDS across the cluster does that sweep).
+    Runs in the web process (EMBEDDED_WORKER) or in the standalone worker (python -m worker),
+    which passes its own concurrency and a stop_event for graceful shutdown.
     """
+    global _last_dispatch_tick
+    scheduler = _get_scheduler(max_concurrent_orders or get_settings().max_concurrent_orders)
     # Let app finish startup before first DB scan.
     await asyncio.sleep(2)
-    while True:
+    last_sweep_check = 0.0
+    while not (stop_event and stop_event.is_set()):
         _start_db_init_once()
+        settings = get_settings()
         try:
-            order_ids = await asyncio.to_thread(_get_unfinished_order_ids_sync)
-            for order_id in order_ids:
-                if order_id in _ACTIVE_ORDER_TASKS:
-                    continue
-                asyncio.create_task(process_order_style_transfer(order_id))
+            if time.time() - last_sweep_check >= ORDER_SWEEP_CHECK_SECONDS:
+                last_sweep_check = time.time()
+                if await asyncio.to_thread(_claim_periodic_run_sync, ORDER_SWEEP_LEASE, ORDER_SWEEP_INTERVAL_SECONDS):
+                    for order_id in await asyncio.to_thread(_get_orders_needing_jobs_sync):
+                        await process_order_style_transfer(order_id)
+            capacity = 2 * scheduler.slots - len(_ACTIVE_JOB_IDS)
+            claimed = await asyncio.to_thread(_claim_due_jobs_sync, capacity, 2 * scheduler.per_flow_limit)
+            for order_id, job_ids in claimed.items():
+                _ACTIVE_JOB_IDS.update(dict.fromkeys(job_ids, order_id))
+                task = asyncio.create_task(_process_claimed_jobs(order_id, job_ids))
+                _DISPATCHED_TASKS.add(task)
+                task.add_done_callback(_DISPATCHED_TASKS.discard)
+            _last_dispatch_tick = time.time()
+        except Exception as e:
+            logger.warning("Job dispatch loop temporary DB/error: %s", e)
+        wakeup = _get_dispatch_wakeup()
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=settings.job_poll_interval_seconds)
+        except asyncio.TimeoutError:
+            pass
+        wakeup.clear()
+
+
+def _dispatch_status() -> dict:
+    """Snapshot for health probes: in-flight work and age of the last successful dispatch tick."""
+    return {
+        "worker_id": WORKER_ID,
+        "in_flight_jobs": len(_ACTIVE_JOB_IDS),
+        "in_flight_orders": len(_DISPATCHED_TASKS),
+        "last_tick_age_seconds": round(time.time() - _last_dispatch_tick, 1) if _last_dispatch_tick else None,
+        "scheduler": _get_scheduler().stats(),
+        "global_slots": _get_global_slots().stats(),
+    }
+
+
+async def _job_lease_heartbeat_loop() -> None:
+    """Renew the leases of the jobs (and global slots) this process holds every JOB_HEARTBEAT_SECONDS. Leases stay
+    short (JOB_LEASE_SECONDS), so the jobs and slots of a worker that died are free again within minutes."""
+    while True:
+        await asyncio.sleep(get_settings().job_heartbeat_seconds)
+        job_ids = list(_ACTIVE_JOB_IDS)
+        try:
+            lost = await asyncio.to_thread(_renew_job_leases_sync, job_ids) if job_ids else []
+            lost_slots = await asyncio.to_thread(_get_global_slots().renew_sync)
         except Exception as e:
-            logger.warning("Supervisor loop temporary DB/error: %s", e)
-        await asyncio.sleep(20)
+            logger.warning("Job lease heartbeat failed: %s", e)
+            continue
+        if lost:
+            logger.warning("Lease on job(s) %s lapsed and was claimed by another worker", lost)
+        if lost_slots:
+            logger.warning("Global slot(s) %s lapsed and were taken by another process", lost_slots)
+
+
+def _renew_job_leases_sync(job_ids: list[int]) -> list[int]:
+    db = SessionLocal()
+    try:
+        return renew_job_leases(db, job_ids, get_settings().job_lease_seconds)
+    finally:
+        db.close()
+
+
+def _claim_due_jobs_sync(limit: int, per_order_limit: int) -> dict[str, list[int]]:
+    """Blocking claim run in thread; returns {order_id: [job ids]} newly leased to this worker.
+    Each order holds at most per_order_limit jobs here, so the scheduler always sees several orders."""
+    if limit <= 0:
+        return {}
+    held: dict[str, int] = defaultdict(int)
+    for order_id in list(_ACTIVE_JOB_IDS.values()):
+        held[order_id] += 1
+    db = SessionLocal()
+    try:
+        s = get_settings()
+        jobs = claim_jobs(
+            db,
+            limit,
+            s.job_lease_seconds,
+            per_order_limit=per_order_limit,
+            held=held,
+            max_running_orders=s.global_max_concurrent_orders or None,
+        )
+        claimed: dict[str, list[int]] = defaultdict(list)
+        for job in jobs:
+            # A job we are still running whose lease lapsed: the running group keeps it.
+            if job.id in _ACTIVE_JOB_IDS:
+                continue
+            claimed[job.order_id].append(job.id)
+        return dict(claimed)
+    finally:
+        db.close()
 
 
-def _get_unfinished_order_ids_sync() -> list[str]:
-    """Blocking DB scan run in thread; returns orders needing work (including eligible failed orders for retry)."""
+def _get_orders_needing_jobs_sync() -> list[str]:
+    """Blocking DB scan run in thread: paid/processing orders without jobs (e.g. paid before a crash)
+    and eligible failed orders for retry. Both filters are plain indexed SQL; no JSON parsing."""
     db = SessionLocal()
     try:
-        orders = db.query(Order).filter(
-            Order.status.in_([OrderStatus.PAID.value, OrderStatus.PROCESSING.value])
-        ).all()
-        order_ids = []
-        for o in orders:
-            target = _target_image_count(o)
-            done = _done_image_count(o)
-            if target > 0 and done < target:
-                order_ids.append(o.order_id)
+        has_jobs = exists().where(ImageJob.order_id == Order.order_id)
+        order_ids = [
+            oid for (oid,) in db.query(Order.order_id).filter(
+                Order.status.in_([OrderStatus.PAID.value, OrderStatus.PROCESSING.value]),
+                ~has_jobs,
+            ).all()
+        ]
 
         # Re-queue eligible failed orders (failed within last 3 days, past 30-min cooldown, max 1 retry)
         now = datetime.utcnow()
@@ -1150,6 +1507,8 @@ def _get_unfinished_order_ids_sync() -> list[str]:
             o.failed_at = None
             o.retry_count = (o.retry_count or 0) + 1
             o.style_transfer_error = None
+            requeue_order_jobs(db, o.order_id)
+            notify_order_changed(db, o.order_id)
             db.commit()
             order_ids.append(o.order_id)
 
@@ -1165,6 +1524,7 @@ def _cleanup_expired_orders_sync() -> int:
         cutoff = datetime.utcnow() - timedelta(days=ORDER_TTL_DAYS)
         expired = db.query(Order).filter(Order.created_at < cutoff).all()
         deleted = 0
+        blob_keys = []
         results_dir = get_order_results_dir()
         for order in expired:
             try:
@@ -1173,12 +1533,21 @@ def _cleanup_expired_orders_sync() -> int:
                     shutil.rmtree(order_dir, ignore_errors=True)
             except Exception as e:
                 logger.warning("TTL cleanup: failed to remove result dir for %s: %s", order.order_id, e)
+            blob_keys += [
+                k for (k,) in db.query(OrderResultImage.blob_key).filter(OrderResultImage.order_id == order.order_id)
+            ]
+            blob_keys += [
+                k for (k,) in db.query(OrderResultVariant.blob_key).filter(OrderResultVariant.order_id == order.order_id)
+            ]
             db.query(OrderResultImage).filter(OrderResultImage.order_id == order.order_id).delete()
+            db.query(OrderResultVariant).filter(OrderResultVariant.order_id == order.order_id).delete()
+            db.query(ImageJob).filter(ImageJob.order_id == order.order_id).delete()
             db.delete(order)
             deleted += 1
         if deleted:
             db.commit()
             logger.info("TTL cleanup: deleted %d order(s) older than %d days", deleted, ORDER_TTL_DAYS)
+            delete_unreferenced_blobs(db, blob_keys)
         return deleted
     except Exception as e:
         logger.warning("TTL cleanup failed: %s", e)
@@ -1189,15 +1558,21 @@ def _cleanup_expired_orders_sync() -> int:
 
 
 def _cleanup_expired_result_images_sync() -> int:
-    """Delete OrderResultImage rows older than result_image_ttl_days. Returns count deleted."""
+    """Delete OrderResultImage rows older than result_image_ttl_days (and their unshared blobs). Returns count deleted."""
     db = SessionLocal()
     try:
         ttl_days = get_settings().result_image_ttl_days
         cutoff = datetime.utcnow() - timedelta(days=ttl_days)
-        deleted = db.query(OrderResultImage).filter(OrderResultImage.created_at < cutoff).delete()
-        if deleted:
+        expired = db.query(OrderResultImage).filter(OrderResultImage.created_at < cutoff)
+        expired_variants = db.query(OrderResultVariant).filter(OrderResultVariant.created_at < cutoff)
+        blob_keys = [k for (k,) in expired.with_entities(OrderResultImage.blob_key)]
+        blob_keys += [k for (k,) in expired_variants.with_entities(OrderResultVariant.blob_key)]
+        deleted = expired.delete()
+        deleted_variants = expired_variants.delete()
+        if deleted or deleted_variants:
             db.commit()
             logger.info("TTL cleanup: deleted %d result image blob(s) older than %d days", deleted, ttl_days)
+            delete_unreferenced_blobs(db, blob_keys)
         return deleted
     except Exception as e:
         logger.warning("Result images TTL cleanup failed: %s", e)
@@ -1213,17 +1588,31 @@ def _run_ttl_cleanup_sync() -> None:
     _cleanup_expired_result_images_sync()
 
 
+def _claim_periodic_run_sync(name: str, interval_seconds: float) -> bool:
+    """Leader check for a periodic job: True in exactly one process per interval across all web and worker
+    processes. The winner's lease on `name` lasts the interval and is not released; once it lapses the next
+    process to check runs the job, so a dead leader is replaced automatically."""
+    db = SessionLocal()
+    try:
+        return acquire_lease(db, name, interval_seconds)
+    finally:
+        db.close()
+
+
 async def _ttl_cleanup_loop() -> None:
-    """Run TTL cleanup at startup (after delay) and then every 24 hours."""
+    """Run TTL cleanup once every 24 hours across the cluster: each process checks hourly (first after a
+    startup delay) and the one that takes the lease runs it."""
     await asyncio.sleep(120)
     while True:
         try:
-            await asyncio.to_thread(_run_ttl_cleanup_sync)
+            if await asyncio.to_thread(_claim_periodic_run_sync, TTL_CLEANUP_LEASE, TTL_CLEANUP_INTERVAL_SECONDS):
+                logger.info("TTL cleanup: running (lease %s)", TTL_CLEANUP_LEASE)
+                await asyncio.to_thread(_run_ttl_cleanup_sync)
         except asyncio.CancelledError:
             break
         except Exception as e:
             logger.warning("TTL cleanup loop error: %s", e)
-        await asyncio.sleep(24 * 3600)
+        await asyncio.sleep(TTL_CLEANUP_CHECK_SECONDS)
 
 
 # ── Upload API ───────────────────────────────────────────────
@@ -1242,11 +1631,33 @@ def _upload_to_litterbox(file_path: str, filename: str) -> str:
     raise HTTPException(status_code=502, detail="Failed to upload to temporary hosting")
 
 
-def _build_public_upload_url(upload_id: str, ext: str) -> str:
+def _build_public_upload_url(upload_id: str, ext: str, name: str = "photo") -> str:
     base = (get_settings().public_base_url or "").rstrip("/")
     if not base:
         return ""
-    return f"{base}/api/uploads/{upload_id}/photo{ext}"
+    return f"{base}/api/uploads/{upload_id}/{name}{ext}"
+
+
+async def _save_upload(content: bytes, ext: str) -> tuple[str, Path, Optional[Path]]:
+    """Store an upload as photo{ext} plus its provider-facing derivative (EXIF-rotated, no metadata, downscaled;
+    built in the preprocessing process pool). Returns (upload_id, original path, derivative path or None)."""
+    try:
+        derivative = await preprocess_upload(content)
+    except UnreadableImage as e:
+        logger.info("Rejected unreadable upload (%d bytes): %s", len(content), e)
+        raise HTTPException(status_code=400, detail="Could not read image")
+    upload_id = uuid.uuid4().hex[:12]
+    upload_dir = get_upload_dir() / upload_id
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    file_path = upload_dir / f"photo{ext}"
+    file_path.write_bytes(content)
+    logger.info(f"Image saved: {file_path} ({len(content)} bytes)")
+    if derivative is None:
+        return upload_id, file_path, None
+    provider_path = upload_dir / PROVIDER_IMAGE_FILENAME
+    provider_path.write_bytes(derivative[0])
+    logger.info("Provider image for upload %s: %d bytes (original %d)", upload_id, len(derivative[0]), len(content))
+    return upload_id, file_path, provider_path
 
 
 def _is_our_upload_url(url: str) -> bool:
@@ -1301,22 +1712,19 @@ async def upload_image(file: UploadFile = File(...)) -> JSONResponse:
     if ext not in IMAGE_EXTENSIONS:
         raise HTTPException(status_code=400, detail=f"Unsupported format: {ext}")
 
-    upload_id = uuid.uuid4().hex[:12]
-    upload_dir = get_upload_dir() / upload_id
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    file_path = upload_dir / f"photo{ext}"
-
     content = await file.read()
     if len(content) > 10 * 1024 * 1024:
         raise HTTPException(status_code=400, detail="File must be under 10 MB")
 
-    file_path.write_bytes(content)
-    logger.info(f"Image saved: {file_path} ({len(content)} bytes)")
+    upload_id, file_path, provider_path = await _save_upload(content, ext)
 
     settings = get_settings()
     if settings.public_base_url:
         # Prefer self-hosted HTTPS URL for reliability; avoids litterbox outages/expiry.
+        # Orders persist the provider derivative next to it (create_order), so this can stay the original.
         image_url = _build_public_upload_url(upload_id, ext)
+    elif provider_path:
+        image_url = _upload_to_litterbox(str(provider_path), provider_path.name)
     else:
         image_url = _upload_to_litterbox(str(file_path), f"photo{ext}")
 
@@ -1790,12 +2198,13 @@ def _style_url_to_prompt(style_url: str, style_id: int) -> str:
     paths = _STYLE_ID_TO_PATHS.get(style_id)
     if paths and style_url:
         try:
-            url_name = style_url.rsplit("/", 1)[-1].lower()
+            # Compare stems: provider variants (<pack>/provider/<name>.jpg) keep the pack image's stem.
+            url_name = style_url.rsplit("/", 1)[-1].rsplit(".", 1)[0].lower()
         except Exception:  # pragma: no cover - very defensive
             url_name = ""
         if url_name:
             for i, p in enumerate(paths):
-                pack_name = (p or "").rsplit("/", 1)[-1].lower()
+                pack_name = (p or "").rsplit("/", 1)[-1].rsplit(".", 1)[0].lower()
                 if pack_name == url_name and 0 <= i < len(prompts):
                     base = prompts[i]
                     return base.replace(". Preserve", "." + _BRUSHWORK_PHRASE + "Preserve")
@@ -1857,16 +2266,27 @@ def _build_result_labels(
     return [(title, artist)] * n
 
 
+_styles_data_cache: tuple[float, list] | None = None  # (styles-data.js mtime, parsed list)
+
+
 def _load_styles_data() -> list:
+    """Parsed styles-data.js, re-read only when the file changes. Callers must not mutate the result."""
+    global _styles_data_cache
     styles_file = Path(__file__).parent / "static" / "landing" / "styles-data.js"
-    if not styles_file.exists():
+    try:
+        mtime = styles_file.stat().st_mtime
+    except OSError:
         return []
+    if _styles_data_cache and _styles_data_cache[0] == mtime:
+        return _styles_data_cache[1]
     content = styles_file.read_text(encoding="utf-8")
     start = content.find("[")
     end = content.rfind("]") + 1
     if start < 0 or end <= start:
         return []
-    return json.loads(content[start:end])
+    styles = json.loads(content[start:end])
+    _styles_data_cache = (mtime, styles)
+    return styles
 
 
 # ── Marketing API ─────────────────────────────────────────────
@@ -1929,23 +2349,21 @@ async def marketing_style_transfer(
     if len(content) > 10 * 1024 * 1024:
         raise HTTPException(status_code=400, detail="File must be under 10 MB")
 
-    upload_id = uuid.uuid4().hex[:12]
-    upload_dir = get_upload_dir() / upload_id
-    upload_dir.mkdir(parents=True, exist_ok=True)
-    file_path = upload_dir / f"photo{ext}"
-    file_path.write_bytes(content)
+    upload_id, file_path, provider_path = await _save_upload(content, ext)
+    if provider_path:
+        file_path, ext = provider_path, provider_path.suffix
 
     settings = get_settings()
     if settings.public_base_url:
-        image_url = _build_public_upload_url(upload_id, ext)
+        image_url = _build_public_upload_url(upload_id, ext, name=file_path.stem)
     else:
-        image_url = _upload_to_litterbox(str(file_path), f"photo{ext}")
+        image_url = _upload_to_litterbox(str(file_path), file_path.name)
 
     paths = _STYLE_ID_TO_PATHS.get(style_id)
     if not paths or style_index > len(paths):
         raise HTTPException(status_code=400, detail="Invalid style_index for pack")
     style_path = paths[style_index - 1]
-    style_url = _resolve_style_image_url(style_path)
+    style_url = _provider_style_url(style_path)
     if not style_url or not style_url.startswith("https://"):
         raise HTTPException(
             status_code=500,
@@ -1955,8 +2373,8 @@ async def marketing_style_transfer(
     style_prompt = _style_url_to_prompt(style_url, style_id)
     service = get_service()
 
-    def _run_transfer() -> tuple:
-        return service.transfer_style_sync(
+    async with _generation_slot(f"marketing:{upload_id}", PRIORITY_MARKETING):
+        result, job_id = await service.transfer_style(
             image_url=image_url,
             style_image_url=style_url,
             structure_denoising_strength=0.7,
@@ -1966,8 +2384,6 @@ async def marketing_style_transfer(
             output_quality=95,
         )
 
-    result, job_id = await asyncio.to_thread(_run_transfer)
-
     if isinstance(result, dict) and "content" in result:
         image_bytes = result["content"]
         content_type = result.get("content_type", "image/jpeg")
@@ -1987,6 +2403,38 @@ async def marketing_style_transfer(
 
 # ── Order endpoints ──────────────────────────────────────────
 
+def _source_image_row_sync(order_id: str, file_path: Path) -> OrderSourceImage:
+    """OrderSourceImage for an upload: the provider derivative (if preprocessed) plus the upload as sent, with the
+    bytes put in the blob store when one is configured."""
+    content = file_path.read_bytes()
+    ext = file_path.suffix.lower()
+    content_type = "image/jpeg" if ext in (".jpg", ".jpeg") else f"image/{ext[1:]}"
+    if ext == ".png":
+        content_type = "image/png"
+    elif ext == ".webp":
+        content_type = "image/webp"
+    row = OrderSourceImage(
+        order_id=order_id,
+        content_type=content_type,
+        data=content,
+        sha256=source_digest(content),
+    )
+    # Providers get the preprocessed derivative; the upload as sent is kept alongside.
+    provider_path = file_path.parent / PROVIDER_IMAGE_FILENAME
+    if provider_path.is_file():
+        provider_bytes = provider_path.read_bytes()
+        row.original_content_type, row.original_data = content_type, content
+        row.content_type, row.data = "image/jpeg", provider_bytes
+        row.sha256 = source_digest(provider_bytes)
+    row.byte_size = len(row.data)
+    store = get_blob_store()
+    if store is not None:
+        row.blob_key, row.data = store.put(row.data), None
+        if row.original_data is not None:
+            row.original_blob_key, row.original_data = store.put(row.original_data), None
+    return row
+
+
 @app.post("/api/orders", response_model=OrderResponse, status_code=201)
 async def create_order(
     order_data: OrderCreateRequest,
@@ -2009,32 +2457,32 @@ async def create_order(
 
     order_id = f"ART-{int(datetime.utcnow().timestamp() * 1000)}-{uuid.uuid4().hex[:8].upper()}"
 
-    style_image_url = _resolve_style_image_url(style_data.get("styleImageUrl") if style_data else None)
+    style_image_url = _provider_style_url(style_data.get("styleImageUrl") if style_data else None)
     style_image_urls = None
     if order_data.style_id == STYLE_ID_MASTERS_PACK:
-        style_image_urls = json.dumps([_resolve_style_image_url(p) for p in MASTERS_PACK_PATHS])
+        style_image_urls = json.dumps([_provider_style_url(p) for p in MASTERS_PACK_PATHS])
         if not style_image_url:
-            style_image_url = _resolve_style_image_url(MASTERS_PACK_PATHS[0])
+            style_image_url = _provider_style_url(MASTERS_PACK_PATHS[0])
     elif order_data.style_id == STYLE_ID_IMPRESSION_COLOR_PACK:
-        style_image_urls = json.dumps([_resolve_style_image_url(p) for p in IMPRESSION_COLOR_PACK_PATHS])
+        style_image_urls = json.dumps([_provider_style_url(p) for p in IMPRESSION_COLOR_PACK_PATHS])
         if not style_image_url:
-            style_image_url = _resolve_style_image_url(IMPRESSION_COLOR_PACK_PATHS[0])
+            style_image_url = _provider_style_url(IMPRESSION_COLOR_PACK_PATHS[0])
     elif order_data.style_id == STYLE_ID_MODERN_ABSTRACT_PACK:
-        style_image_urls = json.dumps([_resolve_style_image_url(p) for p in MODERN_ABSTRACT_PACK_PATHS])
+        style_image_urls = json.dumps([_provider_style_url(p) for p in MODERN_ABSTRACT_PACK_PATHS])
         if not style_image_url:
-            style_image_url = _resolve_style_image_url(MODERN_ABSTRACT_PACK_PATHS[0])
+            style_image_url = _provider_style_url(MODERN_ABSTRACT_PACK_PATHS[0])
     elif order_data.style_id == STYLE_ID_ANCIENT_WORLDS_PACK:
-        style_image_urls = json.dumps([_resolve_style_image_url(p) for p in ANCIENT_WORLDS_PACK_PATHS])
+        style_image_urls = json.dumps([_provider_style_url(p) for p in ANCIENT_WORLDS_PACK_PATHS])
         if not style_image_url:
-            style_image_url = _resolve_style_image_url(ANCIENT_WORLDS_PACK_PATHS[0])
+            style_image_url = _provider_style_url(ANCIENT_WORLDS_PACK_PATHS[0])
     elif order_data.style_id == STYLE_ID_EVOLUTION_PORTRAITS_PACK:
-        style_image_urls = json.dumps([_resolve_style_image_url(p) for p in EVOLUTION_PORTRAITS_PACK_PATHS])
+        style_image_urls = json.dumps([_provider_style_url(p) for p in EVOLUTION_PORTRAITS_PACK_PATHS])
         if not style_image_url:
-            style_image_url = _resolve_style_image_url(EVOLUTION_PORTRAITS_PACK_PATHS[0])
+            style_image_url = _provider_style_url(EVOLUTION_PORTRAITS_PACK_PATHS[0])
     elif order_data.style_id == STYLE_ID_ROYALTY_PORTRAITS_PACK:
-        style_image_urls = json.dumps([_resolve_style_image_url(p) for p in ROYALTY_PORTRAITS_PACK_PATHS])
+        style_image_urls = json.dumps([_provider_style_url(p) for p in ROYALTY_PORTRAITS_PACK_PATHS])
         if not style_image_url:
-            style_image_url = _resolve_style_image_url(ROYALTY_PORTRAITS_PACK_PATHS[0])
+            style_image_url = _provider_style_url(ROYALTY_PORTRAITS_PACK_PATHS[0])
     # Limit to first 5 images for pack_tier 5 (9.99 Lei)
     pack_tier = order_data.pack_tier if order_data.pack_tier in (5, 15) else 5
     if style_image_urls and pack_tier == 5:
@@ -2102,18 +2550,8 @@ async def create_order(
             file_path = get_upload_dir() / upload_id / filename
             if file_path.exists() and file_path.is_file():
                 try:
-                    content = file_path.read_bytes()
-                    ext = Path(filename).suffix.lower()
-                    content_type = "image/jpeg" if ext in (".jpg", ".jpeg") else f"image/{ext[1:]}"
-                    if ext == ".png":
-                        content_type = "image/png"
-                    elif ext == ".webp":
-                        content_type = "image/webp"
-                    row = OrderSourceImage(
-                        order_id=order_id,
-                        content_type=content_type,
-                        data=content,
-                    )
+                    # File reads and blob store puts (an S3 request with BLOB_STORE_BACKEND=s3) block: off the event loop
+                    row = await asyncio.to_thread(_source_image_row_sync, order_id, file_path)
                     db.merge(row)
                     db.commit()
                     logger.info("Order %s: persisted source image from upload %s", order_id, upload_id)
@@ -2138,7 +2576,127 @@ async def get_order_status(order_id: str, db: Session = Depends(get_db)) -> Orde
     order = db.query(Order).filter(Order.order_id == order_id).first()
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-        
+    return _order_status_response(db, order)
+
+
+# SSE stream: comment line this often so proxies keep the connection open, and a re-read this often
+# in case a notification was lost (listener reconnecting).
+ORDER_EVENTS_KEEPALIVE_SECONDS = 15
+ORDER_EVENTS_RESYNC_SECONDS = 60
+
+
+@app.get("/api/orders/{order_id}/events")
+async def stream_order_events(order_id: str, request: Request) -> StreamingResponse:
+    """Server-Sent Events: `status` events carrying the same JSON as /status, sent now and after every change of the
+    order (services/order_events), until it is completed or failed. Waiting clients cost no DB work between changes."""
+    terminal = (OrderStatus.COMPLETED.value, OrderStatus.FAILED.value)
+    changed = order_event_hub.subscribe(order_id)  # before the first read, so a change in between is not missed
+    try:
+        status = await asyncio.to_thread(_order_status_sync, order_id)
+    except BaseException:
+        order_event_hub.unsubscribe(order_id, changed)
+        raise
+    if status is None:
+        order_event_hub.unsubscribe(order_id, changed)
+        raise HTTPException(status_code=404, detail="Order not found")
+
+    async def events() -> AsyncGenerator[str, None]:
+        nonlocal status
+        try:
+            sent = None
+            last_read = time.monotonic()
+            while True:
+                payload = status.model_dump_json()
+                if payload != sent:
+                    yield f"event: status\ndata: {payload}\n\n"
+                    sent = payload
+                if status.status in terminal:
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=ORDER_EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    if time.monotonic() - last_read < ORDER_EVENTS_RESYNC_SECONDS:
+                        yield ": keepalive\n\n"
+                        continue
+                changed.clear()
+                status = await asyncio.to_thread(_order_status_sync, order_id) or status
+                last_read = time.monotonic()
+        finally:
+            order_event_hub.unsubscribe(order_id, changed)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _order_status_sync(order_id: str) -> Optional[OrderStatusResponse]:
+    db = SessionLocal()
+    try:
+        order = db.query(Order).filter(Order.order_id == order_id).first()
+        return _order_status_response(db, order) if order else None
+    finally:
+        db.close()
+
+
+def _order_images(db: Session, order: Order, styles: list) -> list[OrderImageStatus]:
+    """Per-image state in pack (label) order. Each image carries its URL as soon as its job is done, so the
+    page can show finished portraits while the rest of the pack is still generating, plus thumb/srcset URLs
+    of its gallery variants when they were built."""
+    style_urls = _style_urls_for_order(order)
+    jobs = {job.image_index: job for job in order_jobs(db, order.order_id)}
+    legacy_urls = []
+    if not jobs and order.result_urls:  # not enqueued yet, or legacy order from before the job queue
+        try:
+            legacy_urls = json.loads(order.result_urls)
+        except (json.JSONDecodeError, TypeError):
+            pass
+    labels = _build_result_labels(order, style_urls or [""], styles)
+    total = max(len(style_urls), max(jobs, default=0))
+    widths = dict(
+        db.query(OrderResultImage.image_index, OrderResultImage.width)
+        .filter(OrderResultImage.order_id == order.order_id, OrderResultImage.width.isnot(None))
+        .all()
+    )
+    variants: dict[int, list[tuple[int, str]]] = {}
+    for image_index, name, width in (
+        db.query(OrderResultVariant.image_index, OrderResultVariant.variant, OrderResultVariant.width)
+        .filter(OrderResultVariant.order_id == order.order_id)
+        .order_by(OrderResultVariant.width)
+    ):
+        variants.setdefault(image_index, []).append((width, name))
+    images = []
+    for index in range(1, total + 1):
+        job = jobs.get(index)
+        if job is not None:
+            state, url = job.status, job.result_url if job.status == JobStatus.DONE.value else None
+        elif not jobs and index <= len(legacy_urls) and legacy_urls[index - 1]:
+            state, url = JobStatus.DONE.value, legacy_urls[index - 1]
+        else:
+            state, url = JobStatus.QUEUED.value, None
+        label = labels[index - 1] if index <= len(labels) else None
+        thumb_url = srcset = None
+        if url and index in variants and index in widths:
+            sources = [(width, f"{url}?variant={name}") for width, name in variants[index]] + [(widths[index], url)]
+            srcset = ", ".join(f"{src} {width}w" for width, src in sources)
+            thumb_url = sources[0][1]
+        images.append(OrderImageStatus(
+            index=index,
+            state=state,
+            url=url,
+            style_image_url=job.style_image_url if job is not None else (style_urls[index - 1] if index <= len(style_urls) else None),
+            label=list(label) if label else None,
+            thumb_url=thumb_url,
+            srcset=srcset,
+        ))
+    return images
+
+
+def _order_status_response(db: Session, order: Order) -> OrderStatusResponse:
+    styles = _load_styles_data()
     labels = None
     style_name = order.style_name
     style_image_urls_out = order.style_image_urls
@@ -2146,7 +2704,6 @@ async def get_order_status(order_id: str, db: Session = Depends(get_db)) -> Orde
         try:
             urls = json.loads(order.result_urls)
             if urls:
-                styles = _load_styles_data()
                 labels_tuples = _build_result_labels(order, urls, styles)
                 labels = [[t[0], t[1]] for t in labels_tuples]
                 if not style_name and order.style_id and styles:
@@ -2173,23 +2730,105 @@ async def get_order_status(order_id: str, db: Session = Depends(get_db)) -> Orde
         style_image_urls=style_image_urls_out,
         replicate_prediction_details=order.replicate_prediction_details,
         error=order.style_transfer_error,
+        images=_order_images(db, order, styles),
+    )
+
+
+def _row_digest_and_size_sync(row: OrderResultImage | OrderResultVariant | OrderSourceImage) -> tuple[str, int]:
+    data = row.data
+    return row.sha256 or blob_key(data), len(data)
+
+
+async def _ensure_image_validators(db: Session, row: OrderResultImage | OrderResultVariant | OrderSourceImage) -> None:
+    """Fill sha256/byte_size of rows stored before they existed (or cache hits sharing a blob); once per row."""
+    if row.sha256 and row.byte_size is not None:
+        return
+    if row.blob_key:
+        row.sha256 = row.blob_key
+        row.byte_size = await asyncio.to_thread(blob_size, row.blob_key)
+    else:
+        # Loading the deferred bytes (a DB read) and hashing them block: off the event loop
+        row.sha256, row.byte_size = await asyncio.to_thread(_row_digest_and_size_sync, row)
+    db.commit()
+
+
+async def _image_response(
+    request: Request, row: OrderResultImage | OrderResultVariant | OrderSourceImage, cache_control: str
+) -> Response:
+    """Serve an image row with a content-hash ETag: 304 on If-None-Match without reading the bytes, 206 for a single
+    Range (honouring If-Range), otherwise the whole image; blob store rows are streamed."""
+    etag = strong_etag(row.sha256)
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    size = row.byte_size
+    byte_range = None
+    if request.headers.get("if-range") in (None, etag):
+        try:
+            byte_range = parse_byte_range(request.headers.get("range"), size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    start, end = byte_range or (0, size - 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    status_code = 206 if byte_range else 200
+    if row.blob_key:
+        chunks = await asyncio.to_thread(open_blob, row.blob_key, start, end if byte_range else None)
+        return StreamingResponse(chunks, status_code=status_code, media_type=row.content_type, headers=headers)
+    data = row.data
+    return Response(
+        content=data[start : end + 1] if byte_range else data,
+        status_code=status_code,
+        media_type=row.content_type,
+        headers=headers,
     )
 
 
+RESULT_VARIANTS = ("thumb", "medium")
+
+
 @app.get("/api/orders/{order_id}/result/{index}")
-async def get_order_result_image(order_id: str, index: int, db: Session = Depends(get_db)):
-    """Single entry point for result images: DB first (14-day access, survives redeploy), then disk fallback."""
+async def get_order_result_image(
+    order_id: str,
+    index: int,
+    request: Request,
+    variant: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """Single entry point for result images: DB row first (bytes or blob store; 14-day access, survives redeploy), then disk fallback.
+    Images of a completed order never change and are cached as immutable, by the browser only (private portraits);
+    earlier they are revalidated by ETag.
+    ?variant=thumb|medium serves the downscaled WebP built at persist time, or the original if there is none."""
     if index < 1 or index > 20:
         raise HTTPException(status_code=400, detail="Invalid index")
     if "/" in order_id or "\\" in order_id or order_id in (".", ".."):
         raise HTTPException(status_code=400, detail="Invalid order id")
-    # Prefer DB (survives redeploy)
-    row = db.query(OrderResultImage).filter(
-        OrderResultImage.order_id == order_id,
-        OrderResultImage.image_index == index,
-    ).first()
+    if variant is not None and variant not in RESULT_VARIANTS:
+        raise HTTPException(status_code=400, detail="Invalid variant")
+    # Prefer DB / blob store (survives redeploy)
+    row = None
+    if variant:
+        row = db.query(OrderResultVariant).filter(
+            OrderResultVariant.order_id == order_id,
+            OrderResultVariant.image_index == index,
+            OrderResultVariant.variant == variant,
+        ).first()
+    if row is None:
+        row = db.query(OrderResultImage).filter(
+            OrderResultImage.order_id == order_id,
+            OrderResultImage.image_index == index,
+        ).first()
     if row:
-        return Response(content=row.data, media_type=row.content_type)
+        try:
+            await _ensure_image_validators(db, row)
+            order_status = db.query(Order.status).filter(Order.order_id == order_id).scalar()
+            cache_control = (
+                PRIVATE_IMMUTABLE_CACHE_CONTROL if order_status == OrderStatus.COMPLETED.value else REVALIDATE_CACHE_CONTROL
+            )
+            return await _image_response(request, row, cache_control)
+        except BlobNotFoundError:
+            logger.warning("Order %s image %d: blob %s missing", order_id, index, row.blob_key)
     # Fallback: disk (legacy or if DB was cleared by TTL)
     results_dir = get_order_results_dir() / order_id
     for ext in ("jpg", "jpeg", "png", "webp"):
@@ -2200,19 +2839,51 @@ async def get_order_result_image(order_id: str, index: int, db: Session = Depend
 
 
 @app.get("/api/orders/{order_id}/source-image")
-async def get_order_source_image(order_id: str, db: Session = Depends(get_db)):
-    """Serve the customer's uploaded photo for this order (persisted at order creation; survives redeploy)."""
+async def get_order_source_image(order_id: str, request: Request, db: Session = Depends(get_db)):
+    """Serve the customer's uploaded photo for this order (persisted at order creation; survives redeploy).
+    It never changes, so it is cached as immutable, but only by the browser (private)."""
     if "/" in order_id or "\\" in order_id or order_id in (".", ".."):
         raise HTTPException(status_code=400, detail="Invalid order id")
     row = db.query(OrderSourceImage).filter(OrderSourceImage.order_id == order_id).first()
     if not row:
         raise HTTPException(status_code=404, detail="Source image not available")
-    return Response(content=row.data, media_type=row.content_type)
+    try:
+        await _ensure_image_validators(db, row)
+        return await _image_response(request, row, PRIVATE_IMMUTABLE_CACHE_CONTROL)
+    except BlobNotFoundError:
+        raise HTTPException(status_code=404, detail="Source image not available")
+
+
+ZIP_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp"}
+
+
+def _result_image_data_sync(order_id: str, index: int) -> list[bytes]:
+    """Bytes of a result image stored in the DB, read in a session of its own: the streamed ZIP outlives the
+    request's session."""
+    db = SessionLocal()
+    try:
+        data = db.query(OrderResultImage.data).filter(
+            OrderResultImage.order_id == order_id,
+            OrderResultImage.image_index == index,
+        ).scalar()
+    finally:
+        db.close()
+    if data is None:
+        raise LookupError(f"result image {order_id}/{index} no longer stored")
+    return [data]
+
+
+def _fetch_zip_url_sync(url: str) -> list[bytes]:
+    resp = httpx.get(url, timeout=45)
+    resp.raise_for_status()
+    return [resp.content]
 
 
 @app.get("/api/orders/{order_id}/download-all")
 async def download_all_results(order_id: str, db: Session = Depends(get_db)):
-    """Download all generated images for an order as a zip file. Reads from DB first (14-day TTL)."""
+    """Download all generated images for an order as a zip file, streamed: entries are STORED (images are already
+    compressed) and written chunk by chunk, so memory per download stays flat. Reads DB rows / blob store first
+    (14-day TTL); Content-Length is set when every entry's size is known."""
     order = db.query(Order).filter(Order.order_id == order_id).first()
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -2225,36 +2896,40 @@ async def download_all_results(order_id: str, db: Session = Depends(get_db)):
     if not isinstance(urls, list) or not urls:
         raise HTTPException(status_code=404, detail="No result images available yet")
 
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-        for i in range(1, len(urls) + 1):
+    # One query for every row's metadata; the bytes stay deferred and are streamed entry by entry
+    rows = {
+        row.image_index: row
+        for row in db.query(OrderResultImage).filter(OrderResultImage.order_id == order_id)
+    }
+    members: list[ZipMember] = []
+    for i in range(1, len(urls) + 1):
+        row = rows.get(i)
+        if row is not None:
             try:
-                # Prefer DB (same source as /result/{index}; 14-day access)
-                row = db.query(OrderResultImage).filter(
-                    OrderResultImage.order_id == order_id,
-                    OrderResultImage.image_index == i,
-                ).first()
-                if row:
-                    ext = ".jpg" if "jpeg" in row.content_type else ".png" if "png" in row.content_type else ".webp" if "webp" in row.content_type else ".jpg"
-                    zf.writestr(f"artify_{order_id}_{i:02d}{ext}", row.data)
-                    continue
-                # Fallback: fetch from URL (legacy or after TTL)
-                u = urls[i - 1] if i <= len(urls) else None
-                if not u:
-                    continue
-                resp = httpx.get(u, timeout=45)
-                if resp.status_code >= 400:
-                    continue
-                ext = Path(urlparse(u).path).suffix or ".jpg"
-                zf.writestr(f"artify_{order_id}_{i:02d}{ext}", resp.content)
-            except Exception:
+                await _ensure_image_validators(db, row)  # byte_size of older rows / cache hits, for Content-Length
+            except BlobNotFoundError:
+                logger.warning("Order %s image %d: blob %s missing, left out of ZIP", order_id, i, row.blob_key)
                 continue
-    zip_buffer.seek(0)
-    return Response(
-        content=zip_buffer.getvalue(),
-        media_type="application/zip",
-        headers={"Content-Disposition": f'attachment; filename="{order_id}-artify-images.zip"'},
-    )
+            members.append(ZipMember(
+                f"artify_{order_id}_{i:02d}{ZIP_EXTENSIONS.get(row.content_type, '.jpg')}",
+                partial(open_blob, row.blob_key) if row.blob_key else partial(_result_image_data_sync, order_id, i),
+                size=row.byte_size,
+                crc32=row.crc32,  # None for rows persisted before it existed: that entry is buffered to compute it
+                modified=row.created_at,
+            ))
+            continue
+        # Fallback: fetch from URL (legacy or after TTL); size unknown, so no Content-Length
+        u = urls[i - 1]
+        if isinstance(u, str) and u.startswith(("http://", "https://")):
+            members.append(ZipMember(
+                f"artify_{order_id}_{i:02d}{Path(urlparse(u).path).suffix or '.jpg'}",
+                partial(_fetch_zip_url_sync, u),
+            ))
+    headers = {"Content-Disposition": f'attachment; filename="{order_id}-artify-images.zip"'}
+    if all(m.size is not None for m in members):
+        headers["Content-Length"] = str(zip_length((m.name, m.size) for m in members))
+    # Sync generator: Starlette pulls each chunk in its threadpool, so blob/DB reads never block the event loop
+    return StreamingResponse(stream_zip(members), media_type="application/zip", headers=headers)
 
 
 @app.post("/api/orders/{order_id}/checkout")
@@ -2279,10 +2954,14 @@ async def create_checkout_session(
     pack_label = "15 portrete" if (order.amount and order.amount > 10) else "5 portrete"
     style_name = order.style_name or "Portret artistic"
     amount_cents = int(round(float(order.amount or 9.99) * 100))
+    customer_email = order.email or None
+    # End the read transaction so no pooled connection is held while Stripe is called
+    db.commit()
 
     try:
         # Payment currency fixed to RON only; no "Selectați o monedă" / EUR option
-        session = stripe.checkout.Session.create(
+        session = await asyncio.to_thread(
+            stripe.checkout.Session.create,
             line_items=[{
                 "price_data": {
                     "currency": "ron",
@@ -2297,7 +2976,7 @@ async def create_checkout_session(
             mode="payment",
             payment_method_types=["card"],
             adaptive_pricing={"enabled": False},  # Hide EUR/RON selector; only RON (Lei) is shown
-            customer_email=order.email or None,
+            customer_email=customer_email,
             success_url=f"{base_url}/payment/success?order_id={order_id}&session_id={{CHECKOUT_SESSION_ID}}",
             cancel_url=f"{base_url}/payment/cancel?order_id={order_id}",
             metadata={"order_id": order_id},
@@ -2310,9 +2989,11 @@ async def create_checkout_session(
             logger.error("Stripe user_message: %s", e.user_message)
         raise HTTPException(status_code=502, detail=f"Stripe error: {err_msg}")
 
-    # Store the session ID on the order so we can verify it in the webhook
-    order.payment_transaction_id = session.id
-    order.payment_provider = "stripe"
+    # Store the session ID on the order so we can verify it in the webhook. Only while still
+    # PENDING: a webhook for an earlier checkout may have marked it paid in the meantime.
+    db.query(Order).filter(
+        Order.order_id == order_id, Order.status == OrderStatus.PENDING.value
+    ).update({"payment_transaction_id": session.id, "payment_provider": "stripe"}, synchronize_session=False)
     db.commit()
 
     logger.info(
@@ -2365,6 +3046,7 @@ async def stripe_webhook(request: Request, background_tasks: BackgroundTasks, db
             order.payment_provider = "stripe"
             order.payment_transaction_id = payment_intent or session_id
             order.paid_at = datetime.utcnow()
+            notify_order_changed(db, order_id)
             db.commit()
             background_tasks.add_task(process_order_style_transfer, order_id)
             logger.info(f"Stripe payment confirmed, processing started: {order_id}")
@@ -2374,6 +3056,59 @@ async def stripe_webhook(request: Request, background_tasks: BackgroundTasks, db
     return {"status": "ok"}
 
 
+@app.post("/api/replicate/webhook")
+async def replicate_webhook(request: Request):
+    """Replicate prediction completed (REPLICATE_WEBHOOKS_ENABLED). Stores the result on the matching job and
+    wakes its waiter; the worker running the job then persists the image and marks it done."""
+    settings = get_settings()
+    payload = await request.body()
+    secret = (settings.replicate_webhook_secret or "").strip()
+    if not secret:
+        # Unverifiable: a forged delivery could hand any output URL to a customer (and make us fetch it)
+        raise HTTPException(status_code=404, detail="Webhooks not configured")
+    if not verify_signature(secret, request.headers, payload):
+        logger.warning("Replicate webhook signature failed")
+        raise HTTPException(status_code=400, detail="Invalid webhook signature")
+    try:
+        prediction = json.loads(payload)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    prediction_id = prediction.get("id") if isinstance(prediction, dict) else None
+    if not prediction_id or prediction.get("status") not in TERMINAL_STATUSES:
+        return {"status": "ignored"}
+    matched = await asyncio.to_thread(_store_webhook_prediction_sync, prediction_id, prediction)
+    prediction_waiters.resolve(prediction_id, prediction)
+    return {"status": "ok" if matched else "ignored"}
+
+
+def _store_webhook_prediction_sync(prediction_id: str, prediction: dict) -> bool:
+    """Record a terminal webhook payload on the running job that submitted it. Redeliveries overwrite idempotently."""
+    detail = {
+        "id": prediction_id,
+        "status": prediction.get("status"),
+        "output": prediction.get("output"),
+        "error": prediction.get("error"),
+        "metrics": prediction.get("metrics"),
+        "created_at": prediction.get("created_at"),
+        "started_at": prediction.get("started_at"),
+        "completed_at": prediction.get("completed_at"),
+        "delivered_by": "webhook",
+    }
+    db = SessionLocal()
+    try:
+        updated = (
+            db.query(ImageJob)
+            .filter(ImageJob.provider_job_id == prediction_id, ImageJob.status == JobStatus.RUNNING.value)
+            .update({"prediction_details": json.dumps(detail), "updated_at": datetime.utcnow()}, synchronize_session=False)
+        )
+        db.commit()
+        if not updated:
+            logger.info("Replicate webhook for %s matched no running job", prediction_id)
+        return bool(updated)
+    finally:
+        db.close()
+
+
 @app.post("/api/orders/{order_id}/pay")
 async def pay_order(
     order_id: str,
@@ -2394,6 +3129,7 @@ async def pay_order(
     order.payment_provider = body.get("payment_provider", "stripe")
     order.payment_transaction_id = body.get("transaction_id", "")
     order.paid_at = datetime.utcnow()
+    notify_order_changed(db, order_id)
     db.commit()
 
     background_tasks.add_task(process_order_style_transfer, order_id)
@@ -2402,270 +3138,644 @@ async def pay_order(
 
 
 async def process_order_style_transfer(order_id: str):
-    """Run style transfers in a worker thread so API remains responsive. Capped at MAX_CONCURRENT_ORDERS. Email sent after semaphore release."""
-    if order_id in _ACTIVE_ORDER_TASKS:
-        return
-    _ACTIVE_ORDER_TASKS.add(order_id)
+    """Enqueue the order's image jobs (idempotent) and wake the dispatcher. Generation itself runs in _process_claimed_jobs."""
+    result = await asyncio.to_thread(_enqueue_order_sync, order_id)
+    await _send_order_emails(result)
+    _wake_dispatcher()
+
+
+async def _process_claimed_jobs(order_id: str, job_ids: list[int]) -> None:
+    """Run claimed jobs of one order on the event loop (provider I/O is async). Each image waits for a fair-scheduler slot."""
+    try:
+        result = await _run_style_transfer(order_id, job_ids)
+        await _send_order_emails(result)
+    except Exception as e:
+        logger.exception("Processing claimed jobs for order %s failed: %s", order_id, e)
+    finally:
+        for job_id in job_ids:
+            _ACTIVE_JOB_IDS.pop(job_id, None)
+        _wake_dispatcher()
+
+
+async def _send_order_emails(result: None | tuple) -> None:
+    if result and result[0] == "completed":
+        await asyncio.to_thread(
+            EmailService().send_result_ready,
+            result[1], result[2], result[3], result[4],
+            result_labels=result[5] if len(result) > 5 else None,
+        )
+    elif result and result[0] == "failed":
+        await asyncio.to_thread(EmailService().send_order_failed, result[1], result[2], result[3])
+
+
+def _enqueue_order_sync(order_id: str) -> None | tuple[str, ...]:
+    """Create one art_jobs row per style image under the order's lease, so concurrent callers (Stripe webhook,
+    sweep, retry) enqueue it once. Legacy partial results (result_urls prefix) become done jobs."""
+    lock = f"order:{order_id}"
+    db = SessionLocal()
     try:
-        async with _get_order_semaphore():
-            result = await asyncio.to_thread(_run_style_transfer_sync, order_id)
-        if result and result[0] == "completed":
-            await asyncio.to_thread(
-                EmailService().send_result_ready,
-                result[1], result[2], result[3], result[4],
-                result_labels=result[5] if len(result) > 5 else None,
+        if not acquire_lease(db, lock, ORDER_LOCK_TTL_SECONDS):
+            logger.info("Order %s is being enqueued by another worker", order_id)
+            return None
+        try:
+            return _enqueue_order_locked(db, order_id)
+        finally:
+            db.rollback()
+            release_lease(db, lock)
+    finally:
+        db.close()
+
+
+def _enqueue_order_locked(db: Session, order_id: str) -> None | tuple[str, ...]:
+    order = db.query(Order).filter(Order.order_id == order_id).first()
+    if not order:
+        logger.error(f"Order not found for processing: {order_id}")
+        return None
+    if order.status not in (OrderStatus.PAID.value, OrderStatus.PROCESSING.value):
+        return None
+    style_urls = _style_urls_for_order(order)
+    if not style_urls:
+        return _fail_order_sync(db, order, "Style reference image missing")
+    done_urls = []
+    if order.result_urls:
+        try:
+            done_urls = json.loads(order.result_urls) if isinstance(order.result_urls, str) else (order.result_urls or [])
+        except (json.JSONDecodeError, TypeError):
+            done_urls = []
+    added = enqueue_order_jobs(db, order_id, style_urls, done_urls if isinstance(done_urls, list) else [])
+    db.commit()
+    if added:
+        logger.info("Order %s: enqueued %d image job(s)", order_id, added)
+        # Legacy order whose results were all generated before the job queue existed
+        return _complete_order_if_done_sync(db, order)
+    return None
+
+
+async def _generate_one_image(
+    order_id: str,
+    art_job_id: int,
+    image_number: int,
+    source_image_url: str,
+    style_url: str,
+    style_id: Optional[int],
+    artistic_suffix: Optional[str],
+    service: StyleTransferService,
+    replicate_fallback: Optional[StyleTransferService],
+    use_openai: bool,
+    resume: Optional[tuple[str, Optional[datetime]]] = None,
+    attempt: int = 1,
+) -> tuple[str | dict, str, dict]:
+    """Generate one image of an order (one task of the per-order fan-out). attempt = the job's claim count.
+    resume = (prediction id, submitted at) of a Replicate prediction an earlier lease submitted for this image.
+    Returns (result_url or {content, content_type}, job_id, prediction_detail)."""
+    result_url, job_id = None, None
+    provider_used = service
+    # Hedging: a slow OpenAI call gets a parallel Replicate job for the same image; first success wins.
+    hedge_service = replicate_fallback if use_openai and get_settings().hedging_enabled else None
+    hedge_decisions: list[dict] = []
+
+    async def record_prediction_id(prediction_id: str) -> None:
+        # Lets /api/replicate/webhook find this job by prediction id.
+        await asyncio.to_thread(_record_prediction_id_sync, art_job_id, prediction_id)
+
+    style_prompt = _style_url_to_prompt(style_url, style_id) if use_openai else None
+    fallback = (
+        lambda: replicate_fallback.transfer_style(
+            image_url=source_image_url,
+            style_image_url=style_url,
+            structure_denoising_strength=0.7,
+            style_prompt=None,
+            prompt_suffix=artistic_suffix,
+            on_submit=record_prediction_id,
+        )
+    ) if use_openai and replicate_fallback else None
+    # A reclaimed job whose Replicate prediction is still running (or finished) is picked up, not paid for twice.
+    replicate_service = replicate_fallback if use_openai else service
+    resumed = None
+    if resume and replicate_service is not None:
+        resumed = await replicate_service.resume_prediction(*resume)
+        if resumed:
+            logger.info("Order %s image %d: resumed Replicate prediction %s", order_id, image_number, resume[0])
+            result_url, job_id = resumed
+            provider_used = replicate_service
+        else:
+            logger.info("Order %s image %d: prediction %s not resumable; submitting a new one", order_id, image_number, resume[0])
+    if not resumed:
+        # One attempt per claim: an error propagates and _record_failures_sync releases the job with a jittered
+        # backoff (nothing sleeps while holding a slot). From the OPENAI_ATTEMPTS_BEFORE_FALLBACK-th claim on,
+        # a failed OpenAI call falls back to Replicate within the same claim.
+        if fallback and (attempt > OPENAI_ATTEMPTS_BEFORE_FALLBACK or not provider_accepting("openai")):
+            # OpenAI out of attempts or its circuit open: go straight to Replicate instead of queueing behind it.
+            logger.info(
+                "Order %s image %d goes to Replicate (%s)",
+                order_id, image_number, f"attempt {attempt}" if attempt > OPENAI_ATTEMPTS_BEFORE_FALLBACK else "OpenAI circuit open",
             )
-        elif result and result[0] == "failed":
-            await asyncio.to_thread(EmailService().send_order_failed, result[1], result[2], result[3])
+            result_url, job_id = await fallback()
+            provider_used = replicate_fallback
+        else:
+            try:
+                primary = lambda: service.transfer_style(
+                    image_url=source_image_url,
+                    style_image_url=style_url if not use_openai else None,
+                    structure_denoising_strength=0.7,
+                    style_prompt=style_prompt,
+                    prompt_suffix=artistic_suffix,
+                    on_submit=record_prediction_id,
+                )
+                if hedge_service is not None and provider_accepting("replicate"):
+                    (result_url, job_id), winner, _ = await hedged_call(
+                        "openai",
+                        primary,
+                        "replicate",
+                        fallback,
+                        hedge_delay("openai"),
+                        decisions=hedge_decisions,
+                    )
+                    if winner == "replicate":
+                        provider_used = hedge_service
+                else:
+                    started = time.monotonic()
+                    result_url, job_id = await primary()
+                    if use_openai:
+                        get_latency_tracker("openai").record(time.monotonic() - started)
+            except (StyleTransferTimeout, StyleTransferError) as e:
+                # An open breaker means more attempts on this provider would only wait; fail over (or give up) now.
+                circuit_open = isinstance(e, StyleTransferCircuitOpen)
+                if not fallback or not (circuit_open or attempt >= OPENAI_ATTEMPTS_BEFORE_FALLBACK):
+                    raise
+                try:
+                    logger.info(
+                        "OpenAI failed for order %s image %d (%s); falling back to Replicate",
+                        order_id, image_number, "circuit open" if circuit_open else f"attempt {attempt}",
+                    )
+                    result_url, job_id = await fallback()
+                    provider_used = replicate_fallback
+                except (StyleTransferTimeout, StyleTransferError) as fallback_err:
+                    logger.warning(
+                        "Replicate fallback also failed for order %s image %d: %s",
+                        order_id, image_number, fallback_err,
+                    )
+                    raise fallback_err from e
+    result_url_for_pred = result_url if isinstance(result_url, str) else None
+    try:
+        pred = recent_prediction(job_id) or await provider_used.provider.aget_prediction(job_id)
+        pred_detail = {
+            "id": pred.get("id"),
+            "status": pred.get("status"),
+            "error": pred.get("error"),
+            "metrics": pred.get("metrics"),
+            "created_at": pred.get("created_at"),
+            "started_at": pred.get("started_at"),
+            "completed_at": pred.get("completed_at"),
+            "result_url": result_url_for_pred,
+            "model": pred.get("model"),
+            "version": pred.get("version"),
+            "source": pred.get("source"),
+            "data_removed": pred.get("data_removed"),
+            "urls": pred.get("urls"),
+            "logs": (pred.get("logs") or "")[:500] if pred.get("logs") else None,
+        }
+    except Exception:
+        pred_detail = {"id": job_id, "status": "succeeded", "result_url": result_url_for_pred}
+    pred_detail["provider"] = provider_used.provider_name
+    if resumed:
+        pred_detail["resumed"] = True
+    if hedge_decisions:
+        pred_detail["hedging"] = hedge_decisions
+    return result_url, job_id, pred_detail
+
+
+def _record_prediction_id_sync(job_id: int, prediction_id: str) -> None:
+    """Store a just-submitted Replicate prediction id on its (still leased) job, so a worker that reclaims the
+    job after a crash resumes the prediction instead of submitting another."""
+    db = SessionLocal()
+    try:
+        db.query(ImageJob).filter(ImageJob.id == job_id, ImageJob.locked_by == WORKER_ID).update(
+            {
+                "provider_job_id": prediction_id,
+                "provider_submitted_at": datetime.utcnow(),
+                "prediction_details": None,
+                "error": None,  # this submission supersedes the error the job was last released with
+                "updated_at": datetime.utcnow(),
+            },
+            synchronize_session=False,
+        )
+        db.commit()
     finally:
-        _ACTIVE_ORDER_TASKS.discard(order_id)
+        db.close()
 
 
-def _run_style_transfer_sync(order_id: str) -> None | tuple[str, ...]:
+def _stored_webhook_prediction_sync(prediction_id: str) -> Optional[dict]:
     db = SessionLocal()
-    lock_acquired = False
     try:
-        lock_acquired = _try_acquire_order_lock_sync(db, order_id)
-        if not lock_acquired:
-            logger.info("Order %s is already being processed by another worker; skipping duplicate run", order_id)
-            return
+        row = (
+            db.query(ImageJob.prediction_details)
+            .filter(ImageJob.provider_job_id == prediction_id, ImageJob.status == JobStatus.RUNNING.value)
+            .first()
+        )
+        if not row or not row[0]:
+            return None
+        try:
+            detail = json.loads(row[0])
+        except (json.JSONDecodeError, TypeError):
+            return None
+        return detail if isinstance(detail, dict) and detail.get("status") in TERMINAL_STATUSES else None
+    finally:
+        db.close()
+
 
+async def _stored_webhook_prediction(prediction_id: str) -> Optional[dict]:
+    """Terminal prediction delivered by /api/replicate/webhook (possibly to another process), or None."""
+    return await asyncio.to_thread(_stored_webhook_prediction_sync, prediction_id)
+
+
+def _load_claimed_jobs_sync(order_id: str, job_ids: list[int]) -> Optional[dict]:
+    """Load this worker's claimed jobs and the order inputs needed to generate them; marks the order processing.
+    Returns None (after failing the jobs if needed) when there is nothing to generate."""
+    db = SessionLocal()
+    try:
+        jobs = (
+            db.query(ImageJob)
+            .filter(
+                ImageJob.id.in_(job_ids),
+                ImageJob.status == JobStatus.RUNNING.value,
+                ImageJob.locked_by == WORKER_ID,
+            )
+            .order_by(ImageJob.image_index)
+            .all()
+        )
+        if not jobs:
+            return None
         order = db.query(Order).filter(Order.order_id == order_id).first()
         if not order:
             logger.error(f"Order not found for processing: {order_id}")
-            return
-
-        style_urls = []
-        if order.style_image_urls:
-            try:
-                style_urls = json.loads(order.style_image_urls) if isinstance(order.style_image_urls, str) else (order.style_image_urls or [])
-            except (json.JSONDecodeError, TypeError):
-                style_urls = []
-        if not style_urls and order.style_image_url:
-            style_urls = [order.style_image_url]
-        if not style_urls:
-            error_msg = "Style reference image missing"
-            order.status = OrderStatus.FAILED.value
-            order.style_transfer_error = error_msg
-            order.failed_at = datetime.utcnow()
+            for job in jobs:
+                mark_job_failed(job, "Order not found")
             db.commit()
-            return ("failed", order_id, order.email, error_msg)
-
-        # Resume: if already processing with partial results, skip completed ones
-        result_urls_list = []
-        job_ids = []
-        prediction_details = []
-        skip = 0
-        # Resume from any partial progress, regardless of current state string.
-        # This prevents falling back to 1 image after restarts/retries.
-        if order.result_urls:
-            try:
-                result_urls_list = json.loads(order.result_urls) if isinstance(order.result_urls, str) else (order.result_urls or [])
-                job_ids = (order.style_transfer_job_id or "").split(",") if order.style_transfer_job_id else []
-                if order.replicate_prediction_details:
-                    prediction_details = json.loads(order.replicate_prediction_details) if isinstance(order.replicate_prediction_details, str) else (order.replicate_prediction_details or [])
-                if isinstance(result_urls_list, list):
-                    # Never reset completed/partial results; preserve deterministic ordering.
-                    if len(result_urls_list) >= len(style_urls):
-                        if order.status != OrderStatus.COMPLETED.value:
-                            order.status = OrderStatus.COMPLETED.value
-                            order.completed_at = order.completed_at or datetime.utcnow()
-                            db.commit()
-                        logger.info("Order %s already has all %d results; skipping", order_id, len(style_urls))
-                        return
-                    skip = len(result_urls_list)
-                    job_ids = [x.strip() for x in job_ids if x.strip()][:skip]
-                    prediction_details = prediction_details[:skip] if isinstance(prediction_details, list) else []
-                    logger.info(f"Resuming order {order_id}: skipping {skip} done, {len(style_urls) - skip} remaining")
-                else:
-                    result_urls_list = []
-                    job_ids = []
-                    prediction_details = []
-            except (json.JSONDecodeError, TypeError):
-                result_urls_list = []
-                job_ids = []
-                prediction_details = []
-                skip = 0
+            return None
+        if order.status not in (OrderStatus.PAID.value, OrderStatus.PROCESSING.value):
+            logger.info("Order %s is %s; dropping %d claimed job(s)", order_id, order.status, len(jobs))
+            for job in jobs:
+                mark_job_failed(job, f"Order {order.status}")
+            db.commit()
+            return None
 
-        try:
+        if order.status != OrderStatus.PROCESSING.value:
             order.status = OrderStatus.PROCESSING.value
-            db.commit()
+            notify_order_changed(db, order_id)
+        db.commit()
 
-            # Use persisted source image URL if available (survives redeploy); else order.image_url
-            source_image_url = order.image_url
-            if db.query(OrderSourceImage).filter(OrderSourceImage.order_id == order_id).first():
-                base = (get_settings().public_base_url or "").rstrip("/")
-                if base:
-                    source_image_url = f"{base}/api/orders/{order_id}/source-image"
-                    logger.info("Order %s: using persisted source image URL for style transfer", order_id)
-
-            service = get_service()
-            settings = get_settings()
-            use_openai = (settings.style_transfer_provider or "openai").strip().lower() == "openai"
-            portrait_mode = (order.portrait_mode or "realistic").strip().lower()
-            artistic_suffix = (
-                " Make the result strongly artistic and painterly. Emphasize visible brushwork, "
-                "bold impasto texture, and pronounced brushstrokes. The output must look like a "
-                "real oil painting with thick, expressive paint application—not smooth or digital. "
-                "Paint the subject fully in the style of this artwork: reimagine their clothing, "
-                "setting, lighting, and pose as if they were an original subject of this painting. "
-                "Take full artistic liberties to make the portrait feel authentically part of this "
-                "artistic tradition—do not simply apply a filter, but truly render them as a "
-                "painted subject in this style."
-                if portrait_mode == "artistic" else None
+        # Use persisted source image URL if available (survives redeploy); else order.image_url
+        source_image_url = order.image_url
+        source = (
+            db.query(OrderSourceImage.order_id, OrderSourceImage.sha256)
+            .filter(OrderSourceImage.order_id == order_id)
+            .first()
+        )
+        source_sha256 = source.sha256 if source else None
+        if source and not source_sha256:
+            # Row stored before the result cache existed: hash it once (a blob key already is the digest).
+            data, key = db.query(OrderSourceImage.data, OrderSourceImage.blob_key).filter(OrderSourceImage.order_id == order_id).one()
+            source_sha256 = key or source_digest(data)
+            db.query(OrderSourceImage).filter(OrderSourceImage.order_id == order_id).update(
+                {"sha256": source_sha256}, synchronize_session=False
             )
-            remaining_style_urls = style_urls[skip:]
-            replicate_fallback = get_replicate_service() if use_openai else None
-            style_delay = get_settings().style_image_delay_seconds
-            for i, style_url in enumerate(remaining_style_urls):
-                if i > 0 and style_delay > 0:
-                    time.sleep(style_delay)
-                result_url, job_id = None, None
-                provider_used = service
-                style_prompt = _style_url_to_prompt(style_url, order.style_id) if use_openai else None
-                max_openai_attempts = 3
-                for attempt in range(max_openai_attempts):
-                    try:
-                        result_url, job_id = service.transfer_style_sync(
-                            image_url=source_image_url,
-                            style_image_url=style_url if not use_openai else None,
-                            structure_denoising_strength=0.7,
-                            style_prompt=style_prompt,
-                            prompt_suffix=artistic_suffix,
-                        )
-                        break
-                    except (StyleTransferTimeout, StyleTransferError) as e:
-                        if attempt < max_openai_attempts - 1:
-                            logger.warning(
-                                "Style transfer failed for order %s image %d (attempt %d/%d), retrying in 10s: %s",
-                                order_id, skip + i + 1, attempt + 1, max_openai_attempts, e,
-                            )
-                            time.sleep(10)
-                            continue
-                        # After 3 OpenAI failures: try Replicate fallback if available
-                        if use_openai and replicate_fallback:
-                            try:
-                                logger.info(
-                                    "OpenAI failed 3 times for order %s image %d; falling back to Replicate",
-                                    order_id, skip + i + 1,
-                                )
-                                result_url, job_id = replicate_fallback.transfer_style_sync(
-                                    image_url=source_image_url,
-                                    style_image_url=style_url,
-                                    structure_denoising_strength=0.7,
-                                    style_prompt=None,
-                                    prompt_suffix=artistic_suffix,
-                                )
-                                provider_used = replicate_fallback
-                                break
-                            except (StyleTransferTimeout, StyleTransferError) as fallback_err:
-                                logger.warning(
-                                    "Replicate fallback also failed for order %s image %d: %s",
-                                    order_id, skip + i + 1, fallback_err,
-                                )
-                                raise fallback_err from e
-                        raise
-                result_urls_list.append(result_url)
-                job_ids.append(job_id)
-                result_url_for_pred = result_url if isinstance(result_url, str) else None
-                try:
-                    pred = provider_used.provider.get_prediction(job_id)
-                    prediction_details.append({
-                        "id": pred.get("id"),
-                        "status": pred.get("status"),
-                        "error": pred.get("error"),
-                        "metrics": pred.get("metrics"),
-                        "created_at": pred.get("created_at"),
-                        "started_at": pred.get("started_at"),
-                        "completed_at": pred.get("completed_at"),
-                        "result_url": result_url_for_pred,
-                        "model": pred.get("model"),
-                        "version": pred.get("version"),
-                        "source": pred.get("source"),
-                        "data_removed": pred.get("data_removed"),
-                        "urls": pred.get("urls"),
-                        "logs": (pred.get("logs") or "")[:500] if pred.get("logs") else None,
-                    })
-                except Exception:
-                    prediction_details.append({"id": job_id, "status": "succeeded", "result_url": result_url_for_pred})
-
-                # Store serializable version (dicts with bytes can't be JSON-serialized)
-                serializable = [x if isinstance(x, str) else "openai://pending" for x in result_urls_list]
-                order.result_urls = json.dumps(serializable)
-                order.style_transfer_job_id = ",".join(job_ids)
-                order.replicate_prediction_details = json.dumps(prediction_details)
-                db.commit()
-
-            # Persist images to our storage so URLs don't expire (Replicate links are temporary)
-            result_urls_list = _persist_result_images(order_id, result_urls_list)
-            order.result_urls = json.dumps(result_urls_list)
             db.commit()
+        if source:
+            base = (get_settings().public_base_url or "").rstrip("/")
+            if base:
+                source_image_url = f"{base}/api/orders/{order_id}/source-image"
+                logger.info("Order %s: using persisted source image URL for style transfer", order_id)
+        return {
+            "jobs": [
+                (
+                    job.id,
+                    job.image_index,
+                    job.style_image_url,
+                    _job_priority(order, job),
+                    _resumable_prediction(job),
+                    job.attempts or 1,
+                )
+                for job in jobs
+            ],
+            "source_image_url": source_image_url,
+            "style_id": order.style_id,
+            "portrait_mode": (order.portrait_mode or "realistic").strip().lower(),
+            "source_sha256": source_sha256,
+        }
+    finally:
+        db.close()
 
-            order.status = OrderStatus.COMPLETED.value
-            order.completed_at = datetime.utcnow()
-            db.commit()
 
-            styles = _load_styles_data()
-            result_labels = _build_result_labels(order, result_urls_list, styles)
-            if order_id != order.order_id:
-                order_id = order.order_id
-            return ("completed", order_id, order.email, result_urls_list, order.style_name or None, result_labels)
+def _resumable_prediction(job: ImageJob) -> Optional[tuple[str, Optional[datetime]]]:
+    """(prediction id, submitted at) of a Replicate prediction a previous lease submitted for this job and never
+    settled (worker crashed, restarted or lost the lease). Jobs released after an error start over."""
+    if job.provider_job_id and job.provider_submitted_at and not job.error:
+        return job.provider_job_id, job.provider_submitted_at
+    return None
 
-        except StyleTransferRateLimit as e:
-            order.status = OrderStatus.FAILED.value
-            order.style_transfer_error = f"Rate limit: {e}"
-            order.failed_at = datetime.utcnow()
-            db.commit()
-            return ("failed", order_id, order.email, str(e))
-        except (StyleTransferTimeout, StyleTransferError) as e:
-            msg = str(e)
-            # Transient upstream source-url failures (catbox/litterbox 504) should be retried.
-            if ("504" in msg and "Gateway Time-out" in msg) or ("litter.catbox.moe" in msg):
-                logger.warning("Transient source image error for %s, will retry automatically: %s", order_id, msg)
-                order.status = OrderStatus.PROCESSING.value
-                order.style_transfer_error = msg
-                db.commit()
-                return None
-            order.status = OrderStatus.FAILED.value
-            order.style_transfer_error = msg
-            order.failed_at = datetime.utcnow()
-            db.commit()
-            return ("failed", order_id, order.email, msg)
-        except Exception as e:
-            logger.exception(f"Unexpected error processing order {order_id}")
-            order.status = OrderStatus.FAILED.value
-            order.style_transfer_error = str(e)
-            order.failed_at = datetime.utcnow()
-            db.commit()
-            return ("failed", order_id, order.email, str(e))
+
+def _job_priority(order: Order, job: ImageJob) -> str:
+    """Scheduler class: auto-retried orders and jobs retried after an error < jobs reclaimed after a crash < fresh."""
+    if (order.retry_count or 0) > 0 or job.error:
+        return PRIORITY_RETRY
+    if (job.attempts or 0) > 1:
+        return PRIORITY_RESUMED
+    return PRIORITY_FRESH
+
+
+async def _run_style_transfer(order_id: str, job_ids: list[int]) -> None | tuple[str, ...]:
+    """Generate the claimed images of one order, persist them, and complete the order once every job is done.
+    DB work runs in short to_thread calls; provider calls are coroutines, so waiting on a provider holds no thread."""
+    ctx = await asyncio.to_thread(_load_claimed_jobs_sync, order_id, job_ids)
+    if not ctx:
+        return None
+    # Transient provider errors release the job with a backoff (_record_failures_sync) instead of
+    # sleeping in the client while this image holds a scheduler slot.
+    service = get_service(defer_retries=True)
+    settings = get_settings()
+    use_openai = (settings.style_transfer_provider or "openai").strip().lower() == "openai"
+    artistic_suffix = (
+        " Make the result strongly artistic and painterly. Emphasize visible brushwork, "
+        "bold impasto texture, and pronounced brushstrokes. The output must look like a "
+        "real oil painting with thick, expressive paint application—not smooth or digital. "
+        "Paint the subject fully in the style of this artwork: reimagine their clothing, "
+        "setting, lighting, and pose as if they were an original subject of this painting. "
+        "Take full artistic liberties to make the portrait feel authentically part of this "
+        "artistic tradition—do not simply apply a filter, but truly render them as a "
+        "painted subject in this style."
+        if ctx["portrait_mode"] == "artistic" else None
+    )
+    replicate_fallback = get_replicate_service(defer_retries=True) if use_openai else None
+    logger.info("Order %s: generating %d image(s): %s", order_id, len(ctx["jobs"]), [j[1] for j in ctx["jobs"]])
+
+    def cache_key(style_url: str, provider: str) -> Optional[str]:
+        """Result cache key for this order's photo + style + mode on `provider` (None without a stored photo)."""
+        if not ctx["source_sha256"] or not settings.result_cache_enabled:
+            return None
+        if provider == "openai":
+            prompt = _style_url_to_prompt(style_url, ctx["style_id"]) + (artistic_suffix or "")
+            model, quality = f"openai:{settings.openai_stylize_model}", settings.openai_stylize_quality or "low"
+        else:
+            prompt, model, quality = artistic_suffix or "", f"replicate:{ReplicateClient.STYLE_TRANSFER_VERSION}", "default"
+        return result_cache_key(ctx["source_sha256"], style_url, prompt, ctx["portrait_mode"], model, quality)
+
+    # Fan out the claimed images; the fair scheduler hands out slots across orders (then the cluster-wide
+    # cap, if set), and provider limiters (shared by all orders) do the throttling.
+    completed: list[tuple] = []
+
+    async def generate(
+        job_id: int,
+        image_index: int,
+        style_url: str,
+        priority: str,
+        resume: Optional[tuple[str, Optional[datetime]]],
+        attempt: int,
+    ) -> None:
+        # Same photo, style and mode generated before (e.g. re-order, 5-pack → 15-pack): copy it, no provider call.
+        # A job with a prediction still in flight skips this: that prediction is already paid for.
+        keys = [k for k in (cache_key(style_url, service.provider_name), replicate_fallback and cache_key(style_url, "replicate")) if k]
+        if keys and not resume:
+            reused, email = await asyncio.to_thread(_reuse_cached_result_sync, order_id, job_id, image_index, keys)
+            if reused:
+                if email:
+                    completed.append(email)
+                return
+        async with _generation_slot(order_id, priority):
+            result, provider_job_id, pred_detail = await _generate_one_image(
+                order_id,
+                job_id,
+                image_index,
+                ctx["source_image_url"],
+                style_url,
+                ctx["style_id"],
+                artistic_suffix,
+                service,
+                replicate_fallback,
+                use_openai,
+                resume,
+                attempt,
+            )
+        # Checkpoint right away: a crash later in the pack never loses this paid-for image.
+        email = await asyncio.to_thread(
+            _checkpoint_image_sync,
+            order_id,
+            job_id,
+            image_index,
+            result,
+            provider_job_id,
+            pred_detail,
+            cache_key(style_url, pred_detail.get("provider", service.provider_name)),
+        )
+        if email:
+            completed.append(email)
+
+    results = await asyncio.gather(
+        *(generate(*job) for job in ctx["jobs"]),
+        return_exceptions=True,
+    )
+    failures = {job[0]: res for job, res in zip(ctx["jobs"], results) if isinstance(res, BaseException)}
+    result = await asyncio.to_thread(_record_failures_sync, order_id, failures)
+    return result or (completed[0] if completed else None)
+
+
+def _checkpoint_image_sync(
+    order_id: str,
+    job_id: int,
+    image_index: int,
+    result: str | dict,
+    provider_job_id: str,
+    pred_detail: dict,
+    cache_key: Optional[str] = None,
+) -> None | tuple[str, ...]:
+    """Persist one generated image (DB row + file), mark its job done with the permanent URL and mirror progress
+    into the order. Returns the completed-email tuple if this was the order's last outstanding image.
+    Raises ResultPersistError if the image could not be stored."""
+    permanent = _persist_result_images(order_id, [result], indices=[image_index], cache_keys=[cache_key])[0]
+    if not permanent:
+        # Bytes (OpenAI, cache hit) that were not stored have no URL: retry the job rather than finish it without one
+        raise ResultPersistError(f"Result image {image_index} of {order_id} could not be stored")
+    db = SessionLocal()
+    try:
+        job = (
+            db.query(ImageJob)
+            .filter(ImageJob.id == job_id, ImageJob.status == JobStatus.RUNNING.value, ImageJob.locked_by == WORKER_ID)
+            .first()
+        )
+        if not job:
+            logger.warning("Order %s image %d: lease lost before checkpoint; result stored, job left as is", order_id, image_index)
+            return None
+        mark_job_done(job, permanent, provider_job_id, pred_detail)
+        db.commit()
+        order = db.query(Order).filter(Order.order_id == order_id).first()
+        return _complete_order_if_done_sync(db, order) if order else None
     finally:
-        if lock_acquired:
-            _release_order_lock_sync(db, order_id)
         db.close()
 
 
-def _try_acquire_order_lock_sync(db: Session, order_id: str) -> bool:
-    """Cross-process lock using PostgreSQL advisory locks."""
+def _reuse_cached_result_sync(
+    order_id: str, job_id: int, image_index: int, keys: list[str]
+) -> tuple[bool, None | tuple[str, ...]]:
+    """Checkpoint a cached image for this job if one exists under `keys`. Returns (reused, completed-email tuple)."""
+    db = SessionLocal()
     try:
-        row = db.execute(
-            text("SELECT pg_try_advisory_lock(hashtext(:order_key)) AS locked"),
-            {"order_key": order_id},
-        ).first()
-        return bool(row and row[0])
-    except Exception:
-        # If advisory locks are unavailable, continue with in-process guard only.
-        logger.warning("Could not acquire advisory lock for %s; proceeding without DB lock", order_id)
-        return True
+        row = find_cached_result(db, keys, exclude_order_id=order_id)
+        if row is None:
+            return False, None
+        if row.blob_key:
+            if get_blob_store() is None:
+                return False, None
+            cached = {"blob_key": row.blob_key, "content_type": row.content_type}  # shared blob, no copy
+        else:
+            cached = {"content": row.data, "content_type": row.content_type}
+        detail = {
+            "id": None,
+            "status": "succeeded",
+            "cache_hit": {"order_id": row.order_id, "image_index": row.image_index},
+        }
+        key = row.cache_key
+    finally:
+        db.close()
+    logger.info(
+        "Order %s image %d: reusing cached result of %s image %d",
+        order_id, image_index, detail["cache_hit"]["order_id"], detail["cache_hit"]["image_index"],
+    )
+    return True, _checkpoint_image_sync(order_id, job_id, image_index, cached, "cache", detail, key)
 
 
-def _release_order_lock_sync(db: Session, order_id: str) -> None:
+def _record_failures_sync(order_id: str, failures: dict[int, BaseException]) -> None | tuple[str, ...]:
+    """Settle failed jobs (failed / released for retry) and fail or complete the order. Successes were checkpointed already."""
+    db = SessionLocal()
     try:
-        db.execute(
-            text("SELECT pg_advisory_unlock(hashtext(:order_key))"),
-            {"order_key": order_id},
+        order = db.query(Order).filter(Order.order_id == order_id).first()
+        if not order:
+            return None
+        jobs = []
+        if failures:
+            jobs = (
+                db.query(ImageJob)
+                .filter(ImageJob.id.in_(list(failures)), ImageJob.locked_by == WORKER_ID)
+                .order_by(ImageJob.image_index)
+                .all()
+            )
+
+        settings = get_settings()
+        failure: Optional[tuple[str, str]] = None  # (order error, email message)
+        for job in jobs:
+            err = failures[job.id]
+            msg = str(err)
+            if isinstance(err, StyleTransferCircuitOpen):
+                # No healthy provider right now: requeue for when the breaker goes half-open instead of failing the order.
+                logger.warning("Order %s image %d deferred, provider circuit open: %s", order_id, job.image_index, msg)
+                release_job(job, delay_seconds=settings.circuit_breaker_open_seconds, error=msg)
+                continue
+            attempts = job.attempts or 1
+            if (
+                isinstance(err, (StyleTransferTimeout, StyleTransferError, ResultPersistError))
+                and attempts < settings.job_max_attempts
+            ):
+                # Retry from the queue once the backoff has passed; the image's slot serves other work meanwhile.
+                delay = retry_delay(
+                    attempts,
+                    settings.job_retry_base_seconds,
+                    settings.job_retry_max_seconds,
+                    retry_after=getattr(err, "retry_after", None),
+                )
+                logger.warning(
+                    "Order %s image %d attempt %d/%d failed, retrying in %.0fs: %s",
+                    order_id, job.image_index, attempts, settings.job_max_attempts, delay, msg,
+                )
+                release_job(job, delay_seconds=delay, error=msg)
+                continue
+            if isinstance(err, StyleTransferRateLimit):
+                mark_job_failed(job, f"Rate limit: {err}")
+                failure = failure or (f"Rate limit: {err}", msg)
+            elif isinstance(err, (StyleTransferTimeout, StyleTransferError)):
+                # Out of attempts (transient errors, e.g. a catbox/litterbox 504 on the source URL, were retried above)
+                mark_job_failed(job, msg)
+                failure = failure or (msg, msg)
+            else:
+                logger.error("Unexpected error processing order %s image %d", order_id, job.image_index, exc_info=err)
+                mark_job_failed(job, msg)
+                failure = failure or (msg, msg)
+        db.commit()
+
+        if failure:
+            return _fail_order_sync(db, order, failure[0], email_message=failure[1])
+        return _complete_order_if_done_sync(db, order)
+    finally:
+        db.close()
+
+
+def _fail_order_sync(db: Session, order: Order, error: str, email_message: Optional[str] = None) -> None | tuple[str, ...]:
+    """Mark the order failed once (conditional update) and fail its queued jobs. Returns the email tuple for the winner."""
+    updated = (
+        db.query(Order)
+        .filter(
+            Order.order_id == order.order_id,
+            Order.status.in_([OrderStatus.PAID.value, OrderStatus.PROCESSING.value]),
         )
-    except Exception:
-        pass
+        .update(
+            {"status": OrderStatus.FAILED.value, "style_transfer_error": error, "failed_at": datetime.utcnow()},
+            synchronize_session=False,
+        )
+    )
+    fail_pending_jobs(db, order.order_id, f"Order failed: {error}")
+    if updated:
+        notify_order_changed(db, order.order_id)
+    db.commit()
+    if updated != 1:
+        return None
+    return ("failed", order.order_id, order.email, email_message or error)
+
+
+def _complete_order_if_done_sync(db: Session, order: Order) -> None | tuple[str, ...]:
+    """Mirror done jobs into the order's result fields; flip to COMPLETED exactly once when all jobs are done.
+    The lists are index-aligned with the pack (entry i-1 is image i; "" / null while it is not done), so labels and
+    style_image_urls keep pairing by position while a pack is partly done."""
+    jobs = order_jobs(db, order.order_id)
+    done = [job for job in jobs if job.status == JobStatus.DONE.value]
+    prediction_details = []
+    for job in jobs:
+        if job.status != JobStatus.DONE.value:
+            prediction_details.append(None)
+            continue
+        try:
+            detail = json.loads(job.prediction_details) if job.prediction_details else None
+        except (json.JSONDecodeError, TypeError):
+            detail = None
+        prediction_details.append(detail or {"id": job.provider_job_id, "status": "succeeded", "result_url": job.result_url})
+    result_urls_list = [(job.result_url or "") if job.status == JobStatus.DONE.value else "" for job in jobs]
+    values = {
+        "result_urls": json.dumps(result_urls_list),
+        "style_transfer_job_id": ",".join(
+            (job.provider_job_id or "") if job.status == JobStatus.DONE.value else "" for job in jobs
+        ),
+        "replicate_prediction_details": json.dumps(prediction_details),
+    }
+    all_done = bool(jobs) and len(done) == len(jobs)
+    if all_done:
+        values["status"] = OrderStatus.COMPLETED.value
+        values["completed_at"] = datetime.utcnow()
+    # Conditional on the order still being in flight, so a slower worker never overwrites a completed order.
+    updated = (
+        db.query(Order)
+        .filter(
+            Order.order_id == order.order_id,
+            Order.status.in_([OrderStatus.PAID.value, OrderStatus.PROCESSING.value]),
+        )
+        .update(values, synchronize_session=False)
+    )
+    if updated:
+        notify_order_changed(db, order.order_id)
+    db.commit()
+    if not all_done or updated != 1:
+        return None
+    db.refresh(order)
+    logger.info("Order %s completed with %d image(s)", order.order_id, len(result_urls_list))
+    styles = _load_styles_data()
+    result_labels = _build_result_labels(order, result_urls_list, styles)
+    return ("completed", order.order_id, order.email, result_urls_list, order.style_name or None, result_labels)
 
 
 if __name__ == "__main__":
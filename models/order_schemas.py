@@ -34,6 +34,17 @@ class OrderResponse(BaseModel):
     completed_at: Optional[datetime] = None
 
 
+class OrderImageStatus(BaseModel):
+    """One image of an order, available as soon as it is generated."""
+    index: int  # 1-based, same as /api/orders/{id}/result/{index}
+    state: str  # queued | running | done | failed
+    url: Optional[str] = None  # set once done
+    style_image_url: Optional[str] = None
+    label: Optional[list[str]] = None  # [painting title, artist]
+    thumb_url: Optional[str] = None  # small WebP (?variant=thumb) for filmstrips; set once done, if built
+    srcset: Optional[str] = None  # "<url>?variant=thumb 320w, <url>?variant=medium 768w, <url> 1024w"
+
+
 class OrderStatusResponse(BaseModel):
     order_id: str
     status: str
@@ -45,6 +56,7 @@ class OrderStatusResponse(BaseModel):
     style_image_urls: Optional[str] = None
     replicate_prediction_details: Optional[str] = None
     error: Optional[str] = None
+    images: Optional[list[OrderImageStatus]] = None  # per-image progress, in pack (label) order
 
 
 class DashboardOrderSummary(BaseModel):
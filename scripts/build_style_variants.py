@@ -0,0 +1,119 @@
+"""
+Build provider variants of the style reference images.
+
+For every style image the packs reference (PACK_PATHS in main.py) this writes a capped copy to
+static/landing/styles/<pack>/provider/<name>.jpg (long edge <= 1024, progressive JPEG,
+no metadata) and records it in static/landing/styles/provider-variants.json. Orders send
+the variant URLs to providers (services/style_variants.py); the gallery keeps the originals.
+A variant that would not be smaller than its source is skipped, so the original is used.
+Sources whose sha256 is unchanged since the last build are not re-encoded.
+
+Requires: pip install Pillow
+
+Run from repo root: python scripts/build_style_variants.py [--max-side 1024] [--quality 85] [--force]
+"""
+import argparse
+import hashlib
+import io
+import json
+import sys
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    raise SystemExit("Pillow required. Run: pip install Pillow")
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from main import _STYLE_ID_TO_PATHS  # noqa: E402
+from services.style_variants import MANIFEST_PATH, variant_path_for  # noqa: E402
+
+
+def _url_path(path: Path) -> str:
+    return "/" + path.relative_to(REPO_ROOT).as_posix()
+
+
+def _encode(src: Path, max_side: int, quality: int) -> tuple[bytes, tuple[int, int]]:
+    with Image.open(src) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        if max(img.size) > max_side:
+            img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+        return out.getvalue(), img.size
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Build provider variants of the style reference images")
+    p.add_argument("--max-side", type=int, default=1024, help="Longest side of a variant in pixels")
+    p.add_argument("--quality", type=int, default=85, help="JPEG quality of the variants")
+    p.add_argument("--force", action="store_true", help="Re-encode even if the source is unchanged")
+    args = p.parse_args()
+
+    try:
+        previous = json.loads(MANIFEST_PATH.read_text())
+    except (OSError, ValueError):
+        previous = {}
+    params = {"max_side": args.max_side, "quality": args.quality}
+    manifest: dict[str, dict] = {}
+    total_src = total_out = 0
+
+    for paths in _STYLE_ID_TO_PATHS.values():
+        for key in paths:
+            src = REPO_ROOT / key.lstrip("/")
+            if not src.is_file():
+                print(f"Skip {key}: not found")
+                continue
+            data = src.read_bytes()
+            digest = hashlib.sha256(data).hexdigest()
+            dest = REPO_ROOT / variant_path_for(key).lstrip("/")
+            prev = previous.get(key)
+            if (
+                not args.force
+                and prev
+                and prev.get("source_sha256") == digest
+                and prev.get("params") == params
+                and dest.exists()
+            ):
+                manifest[key] = prev
+                total_src += len(data)
+                total_out += prev["bytes"]
+                continue
+            try:
+                encoded, size = _encode(src, args.max_side, args.quality)
+            except (OSError, ValueError) as e:
+                print(f"Skip {key}: {e}")
+                continue
+            if len(encoded) >= len(data):
+                print(f"Skip {key}: variant not smaller ({len(encoded)} >= {len(data)} bytes)")
+                dest.unlink(missing_ok=True)
+                continue
+            dest.parent.mkdir(exist_ok=True)
+            dest.write_bytes(encoded)
+            manifest[key] = {
+                "variant": _url_path(dest),
+                "width": size[0],
+                "height": size[1],
+                "bytes": len(encoded),
+                "source_bytes": len(data),
+                "source_sha256": digest,
+                "params": params,
+            }
+            total_src += len(data)
+            total_out += len(encoded)
+            print(f"{key}: {len(data) // 1024} KB -> {len(encoded) // 1024} KB ({size[0]}x{size[1]})")
+
+    MANIFEST_PATH.write_text(json.dumps(manifest, indent=2, sort_keys=True) + "\n")
+    print(f"{len(manifest)} variants, {total_src // 1024} KB -> {total_out // 1024} KB; manifest: {_url_path(MANIFEST_PATH)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Local stand-in for the Replicate predictions API, for exercising webhook mode without a token.
+
+Implements POST/GET /v1/predictions, GET /v1/predictions/{id} and serves the "output" image.
+Each prediction succeeds after --delay seconds; if it was submitted with a webhook, the finished
+prediction is POSTed there, signed like Replicate (webhook-id / webhook-timestamp / webhook-signature).
+GET /stats shows request counts, e.g. to check that webhook mode stopped the polling.
+
+Run from project root:
+    python scripts/fake_replicate_server.py --port 8090 --webhook-secret whsec_dGVzdHNlY3JldA==
+
+Then start the app with:
+    STYLE_TRANSFER_PROVIDER=replicate REPLICATE_API_TOKEN=fake
+    REPLICATE_BASE_URL=http://127.0.0.1:8090/v1
+    REPLICATE_WEBHOOKS_ENABLED=true REPLICATE_WEBHOOK_SECRET=whsec_dGVzdHNlY3JldA==
+    PUBLIC_BASE_URL=http://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+
+from services.replicate_webhooks import sign_payload
+
+# 1x1 white JPEG returned as every prediction's output
+OUTPUT_JPEG = base64.b64decode(
+    "/9j/4AAQSkZJRgABAQEASABIAAD/2wBDAP//////////////////////////////////////////////////////////"
+    "////////////////////////////wgALCAABAAEBAREA/8QAFBABAAAAAAAAAAAAAAAAAAAAAP/aAAgBAQABPxA="
+)
+
+
+def build_app(delay: float, webhook_secret: str, fail_rate: float, drop_webhook_rate: float, public_url: str) -> FastAPI:
+    app = FastAPI(title="Fake Replicate")
+    predictions: dict[str, dict] = {}
+    webhooks: dict[str, str] = {}
+    stats: Counter = Counter()
+
+    def _now() -> str:
+        return datetime.utcnow().isoformat() + "Z"
+
+    async def _deliver(prediction_id: str) -> None:
+        url = webhooks.get(prediction_id)
+        if not url:
+            return
+        if random.random() < drop_webhook_rate:
+            stats["webhooks_dropped"] += 1
+            return
+        body = json.dumps(predictions[prediction_id]).encode()
+        webhook_id = f"msg_{uuid.uuid4().hex[:16]}"
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            "webhook-id": webhook_id,
+            "webhook-timestamp": timestamp,
+            "webhook-signature": sign_payload(webhook_secret, webhook_id, timestamp, body),
+        }
+        async with httpx.AsyncClient(timeout=10) as client:
+            for attempt in range(3):
+                try:
+                    r = await client.post(url, content=body, headers=headers)
+                    stats[f"webhook_{r.status_code}"] += 1
+                    if r.status_code < 500:
+                        return
+                except httpx.RequestError:
+                    stats["webhook_errors"] += 1
+                await asyncio.sleep(2 ** attempt)
+
+    async def _run(prediction_id: str) -> None:
+        await asyncio.sleep(delay / 3)
+        predictions[prediction_id].update(status="processing", started_at=_now())
+        await asyncio.sleep(delay * 2 / 3)
+        pred = predictions[prediction_id]
+        if random.random() < fail_rate:
+            pred.update(status="failed", error="Fake failure", completed_at=_now())
+        else:
+            pred.update(
+                status="succeeded",
+                output=[f"{public_url}/files/{prediction_id}.jpg"],
+                completed_at=_now(),
+                metrics={"predict_time": delay},
+            )
+        await _deliver(prediction_id)
+
+    @app.post("/v1/predictions", status_code=201)
+    async def create_prediction(request: Request) -> dict:
+        stats["create"] += 1
+        body = await request.json()
+        prediction_id = uuid.uuid4().hex[:20]
+        predictions[prediction_id] = {
+            "id": prediction_id,
+            "version": (body.get("version") or "").split(":")[-1],
+            "model": (body.get("version") or "").split(":")[0],
+            "input": body.get("input") or {},
+            "status": "starting",
+            "output": None,
+            "error": None,
+            "logs": "",
+            "source": "api",
+            "created_at": _now(),
+            "started_at": None,
+            "completed_at": None,
+            "urls": {"get": f"{public_url}/v1/predictions/{prediction_id}"},
+        }
+        if body.get("webhook"):
+            webhooks[prediction_id] = body["webhook"]
+        asyncio.create_task(_run(prediction_id))
+        return predictions[prediction_id]
+
+    @app.get("/v1/predictions/{prediction_id}")
+    async def get_prediction(prediction_id: str) -> dict:
+        stats["get"] += 1
+        if prediction_id not in predictions:
+            raise HTTPException(status_code=404, detail="Not found")
+        return predictions[prediction_id]
+
+    @app.get("/v1/predictions")
+    async def list_predictions() -> dict:
+        stats["list"] += 1
+        recent = sorted(predictions.values(), key=lambda p: p["created_at"], reverse=True)[:100]
+        return {"next": None, "previous": None, "results": recent}
+
+    @app.get("/files/{prediction_id}.jpg")
+    async def output_file(prediction_id: str) -> Response:
+        return Response(content=OUTPUT_JPEG, media_type="image/jpeg")
+
+    @app.get("/stats")
+    async def get_stats() -> JSONResponse:
+        by_status = Counter(p["status"] for p in predictions.values())
+        return JSONResponse({"requests": dict(stats), "predictions": dict(by_status)})
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Replicate predictions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--delay", type=float, default=5.0, help="Seconds until a prediction finishes")
+    parser.add_argument(
+        "--webhook-secret",
+        default=os.environ.get("REPLICATE_WEBHOOK_SECRET") or "whsec_" + base64.b64encode(b"fake-replicate").decode(),
+    )
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of predictions that fail")
+    parser.add_argument("--drop-webhook-rate", type=float, default=0.0, help="Fraction of webhooks never delivered")
+    args = parser.parse_args()
+    public_url = f"http://{args.host}:{args.port}"
+    print(f"Fake Replicate on {public_url}/v1  (webhook secret: {args.webhook_secret})")
+    app = build_app(args.delay, args.webhook_secret, args.fail_rate, args.drop_webhook_rate, public_url)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
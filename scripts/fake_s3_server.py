@@ -0,0 +1,143 @@
+"""
+Local stand-in for an S3-compatible object store (MinIO-style, path-style URLs), for exercising
+BLOB_STORE_BACKEND=s3 without a bucket.
+
+Implements PUT/GET (with Range)/HEAD/DELETE /{bucket}/{key}, keeping objects in memory (or under --data-dir).
+With --access-key/--secret-key it recomputes the SigV4 signature of every request and answers 403
+on a mismatch, so the signing in services/blob_store.py is checked too. GET /stats shows request
+counts and stored bytes.
+
+Run from project root:
+    python scripts/fake_s3_server.py --port 9000 --access-key test --secret-key testsecret
+
+Then start the app (or scripts/migrate_blobs.py) with:
+    BLOB_STORE_BACKEND=s3 BLOB_STORE_S3_ENDPOINT=http://127.0.0.1:9000 BLOB_STORE_S3_BUCKET=artify
+    BLOB_STORE_S3_ACCESS_KEY_ID=test BLOB_STORE_S3_SECRET_ACCESS_KEY=testsecret
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+from services.blob_store import sign_s3_request
+
+_CREDENTIAL = re.compile(r"Credential=([^/]+)/(\d{8})/([^/]+)/s3/aws4_request")
+_RANGE = re.compile(r"bytes=(\d+)-(\d*)")
+
+
+def build_app(data_dir: Optional[Path], access_key: Optional[str], secret_key: Optional[str]) -> FastAPI:
+    app = FastAPI(title="Fake S3")
+    objects: dict[str, bytes] = {}
+    stats: Counter = Counter()
+
+    def _signature_ok(request: Request, path: str) -> bool:
+        if not access_key:
+            return True
+        auth = request.headers.get("authorization", "")
+        m = _CREDENTIAL.search(auth)
+        if not m or m.group(1) != access_key:
+            return False
+        # Re-sign with the request's own date and region, then compare.
+        expected = sign_s3_request(
+            request.method,
+            request.headers.get("host", ""),
+            path,
+            request.headers.get("x-amz-content-sha256", ""),
+            request.headers.get("x-amz-date", ""),
+            access_key,
+            secret_key or "",
+            m.group(3),
+        )["authorization"]
+        return expected == auth
+
+    def _load(key: str) -> Optional[bytes]:
+        if data_dir is None:
+            return objects.get(key)
+        path = data_dir / key
+        return path.read_bytes() if path.is_file() else None
+
+    def _store(key: str, body: bytes) -> None:
+        if data_dir is None:
+            objects[key] = body
+            return
+        path = data_dir / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(body)
+
+    def _delete(key: str) -> None:
+        if data_dir is None:
+            objects.pop(key, None)
+        else:
+            (data_dir / key).unlink(missing_ok=True)
+
+    @app.get("/stats")
+    async def get_stats() -> JSONResponse:
+        return JSONResponse({"requests": dict(stats), "objects": len(objects), "bytes": sum(map(len, objects.values()))})
+
+    @app.api_route("/{bucket}/{key:path}", methods=["PUT", "GET", "HEAD", "DELETE"])
+    async def object_route(bucket: str, key: str, request: Request) -> Response:
+        stats[request.method] += 1
+        if not _signature_ok(request, request.url.path):
+            stats["forbidden"] += 1
+            return Response(status_code=403, content=b"<Error><Code>SignatureDoesNotMatch</Code></Error>")
+        name = f"{bucket}/{key}"
+        if request.method == "PUT":
+            body = await request.body()
+            declared = request.headers.get("x-amz-content-sha256")
+            if declared and declared != "UNSIGNED-PAYLOAD" and declared != hashlib.sha256(body).hexdigest():
+                return Response(status_code=400, content=b"<Error><Code>XAmzContentSHA256Mismatch</Code></Error>")
+            _store(name, body)
+            return Response(status_code=200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+        if request.method == "DELETE":
+            _delete(name)
+            return Response(status_code=204)
+        body = _load(name)
+        if body is None:
+            stats["not_found"] += 1
+            return Response(status_code=404, content=b"<Error><Code>NoSuchKey</Code></Error>")
+        if request.method == "HEAD":
+            return Response(status_code=200, headers={"Content-Length": str(len(body))})
+        m = _RANGE.fullmatch(request.headers.get("range", ""))
+        if m:
+            stats["ranged"] += 1
+            start = int(m.group(1))
+            end = min(int(m.group(2)), len(body) - 1) if m.group(2) else len(body) - 1
+            if start > end:
+                return Response(status_code=416, headers={"Content-Range": f"bytes */{len(body)}"})
+            return Response(
+                status_code=206,
+                content=body[start : end + 1],
+                media_type="application/octet-stream",
+                headers={"Content-Range": f"bytes {start}-{end}/{len(body)}"},
+            )
+        return Response(content=body, media_type="application/octet-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake S3-compatible object store")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--data-dir", help="Keep objects on disk here instead of in memory")
+    parser.add_argument("--access-key", help="Check SigV4 signatures for this access key (default: accept any request)")
+    parser.add_argument("--secret-key", help="Secret for --access-key")
+    args = parser.parse_args()
+    data_dir = Path(args.data_dir) if args.data_dir else None
+    print(f"Fake S3 on http://{args.host}:{args.port}  ({'disk: ' + str(data_dir) if data_dir else 'in memory'})")
+    app = build_app(data_dir, args.access_key, args.secret_key)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
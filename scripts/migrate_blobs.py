@@ -0,0 +1,157 @@
+"""
+Move image bytes from the DB (art_order_result_images.data, art_order_result_variants.data,
+art_order_source_images.data / original_data) into the configured blob store (BLOB_STORE_BACKEND=local or s3, see
+services/blob_store.py). Each row gets its blob_key and its bytea column set to NULL, one batch
+per transaction, so the script can be stopped and rerun at any time. Blobs are content-addressed:
+rows with identical bytes end up sharing one blob.
+
+Afterwards, on PostgreSQL, run VACUUM FULL (or pg_repack) on the three tables to give the space back.
+
+Run from repo root:
+    BLOB_STORE_BACKEND=s3 BLOB_STORE_S3_ENDPOINT=... BLOB_STORE_S3_BUCKET=... python scripts/migrate_blobs.py [--batch-size 50] [--dry-run]
+"""
+import argparse
+import os
+import sys
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import undefer  # noqa: E402
+
+from database import OrderResultImage, OrderResultVariant, OrderSourceImage, SessionLocal, init_db  # noqa: E402
+from services.blob_store import get_blob_store  # noqa: E402
+
+
+def migrate_results(store, batch_size: int, dry_run: bool) -> tuple[int, int]:
+    rows_done = bytes_done = 0
+    last = ("", 0)
+    while True:
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(OrderResultImage)
+                .options(undefer(OrderResultImage.data))
+                .filter(OrderResultImage.data.isnot(None))
+                .filter(
+                    (OrderResultImage.order_id > last[0])
+                    | ((OrderResultImage.order_id == last[0]) & (OrderResultImage.image_index > last[1]))
+                )
+                .order_by(OrderResultImage.order_id, OrderResultImage.image_index)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                return rows_done, bytes_done
+            for row in rows:
+                bytes_done += len(row.data)
+                if not dry_run:
+                    row.byte_size = len(row.data)
+                    row.crc32 = zlib.crc32(row.data)  # for the streamed ZIP download
+                    row.blob_key, row.data = store.put(row.data), None
+                    row.sha256 = row.blob_key
+            if not dry_run:
+                db.commit()
+            rows_done += len(rows)
+            last = (rows[-1].order_id, rows[-1].image_index)
+            print(f"  result images: {rows_done} rows, {bytes_done / 1e6:.1f} MB")
+        finally:
+            db.close()
+
+
+def migrate_variants(store, batch_size: int, dry_run: bool) -> tuple[int, int]:
+    rows_done = bytes_done = 0
+    last = ("", 0, "")
+    v = OrderResultVariant
+    while True:
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(v)
+                .options(undefer(v.data))
+                .filter(v.data.isnot(None))
+                .filter(
+                    (v.order_id > last[0])
+                    | ((v.order_id == last[0]) & (v.image_index > last[1]))
+                    | ((v.order_id == last[0]) & (v.image_index == last[1]) & (v.variant > last[2]))
+                )
+                .order_by(v.order_id, v.image_index, v.variant)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                return rows_done, bytes_done
+            for row in rows:
+                bytes_done += len(row.data)
+                if not dry_run:
+                    row.blob_key, row.data = store.put(row.data), None
+            if not dry_run:
+                db.commit()
+            rows_done += len(rows)
+            last = (rows[-1].order_id, rows[-1].image_index, rows[-1].variant)
+            print(f"  result variants: {rows_done} rows, {bytes_done / 1e6:.1f} MB")
+        finally:
+            db.close()
+
+
+def migrate_sources(store, batch_size: int, dry_run: bool) -> tuple[int, int]:
+    rows_done = bytes_done = 0
+    last = ""
+    while True:
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(OrderSourceImage)
+                .options(undefer(OrderSourceImage.data), undefer(OrderSourceImage.original_data))
+                .filter(OrderSourceImage.data.isnot(None) | OrderSourceImage.original_data.isnot(None))
+                .filter(OrderSourceImage.order_id > last)
+                .order_by(OrderSourceImage.order_id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                return rows_done, bytes_done
+            for row in rows:
+                bytes_done += len(row.data or b"") + len(row.original_data or b"")
+                if dry_run:
+                    continue
+                if row.data is not None:
+                    row.byte_size = len(row.data)
+                    row.blob_key, row.data = store.put(row.data), None
+                    row.sha256 = row.blob_key
+                if row.original_data is not None:
+                    row.original_blob_key, row.original_data = store.put(row.original_data), None
+            if not dry_run:
+                db.commit()
+            rows_done += len(rows)
+            last = rows[-1].order_id
+            print(f"  source images: {rows_done} rows, {bytes_done / 1e6:.1f} MB")
+        finally:
+            db.close()
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Move image bytes from the DB into the blob store")
+    p.add_argument("--batch-size", type=int, default=50, help="Rows per transaction")
+    p.add_argument("--dry-run", action="store_true", help="Only count rows and bytes that would move")
+    args = p.parse_args()
+
+    store = get_blob_store()
+    if store is None:
+        print("BLOB_STORE_BACKEND is 'db'; set it to 'local' or 's3' (and its settings) first.")
+        return 1
+    init_db()  # adds the blob_key columns on existing databases
+    print(f"Migrating to blob store: {store.name}{' (dry run)' if args.dry_run else ''}")
+    results = migrate_results(store, args.batch_size, args.dry_run)
+    variants = migrate_variants(store, args.batch_size, args.dry_run)
+    sources = migrate_sources(store, args.batch_size, args.dry_run)
+    print(
+        f"Done: {results[0]} result images ({results[1] / 1e6:.1f} MB), "
+        f"{variants[0]} variants ({variants[1] / 1e6:.1f} MB), "
+        f"{sources[0]} source images ({sources[1] / 1e6:.1f} MB)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,316 @@
+"""
+Blob store for result and source image bytes.
+
+Blobs are content-addressed: the key is the sha256 hex of the bytes, so storing the same image
+twice (a result-cache hit, a re-sent upload) keeps one copy and rows can share a key. The DB rows
+(art_order_result_images, art_order_result_variants, art_order_source_images) keep only blob_key
+and metadata; their bytea columns are NULL for rows written through a store. BLOB_STORE_BACKEND
+picks where new bytes go:
+
+- "db" (default): no store, bytes stay in the DB columns as before.
+- "local": files under BLOB_STORE_DIR as <key[:2]>/<key>. Only for a persistent disk.
+- "s3": any S3-compatible service (AWS S3, R2, MinIO, scripts/fake_s3_server.py), path-style
+  requests signed with SigV4 over httpx.
+
+scripts/migrate_blobs.py moves existing bytea rows into the configured store.
+"""
+import hashlib
+import hmac
+import logging
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+from urllib.parse import quote, urlparse
+
+import httpx
+from sqlalchemy.orm import Session
+
+from config import get_blob_store_dir, get_settings
+from database import OrderResultImage, OrderResultVariant, OrderSourceImage
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+
+class BlobNotFoundError(Exception):
+    pass
+
+
+def blob_key(data: bytes) -> str:
+    """Content address of data (sha256 hex, same digest as services.result_cache.source_digest)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore(ABC):
+    """put/get/open/size/delete by key. open() raises BlobNotFoundError before returning, so callers can 404."""
+
+    name = ""
+
+    @abstractmethod
+    def put(self, data: bytes) -> str:
+        """Store data (idempotent) and return its key."""
+
+    @abstractmethod
+    def open(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Chunks of bytes start..end (inclusive; end None = to the end of the blob). The iterator releases its
+        file/connection when exhausted or closed."""
+
+    @abstractmethod
+    def size(self, key: str) -> int:
+        """Byte length of the blob. Raises BlobNotFoundError if it is missing."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove the blob; missing blobs are ignored."""
+
+    def get(self, key: str) -> bytes:
+        return b"".join(self.open(key))
+
+
+class LocalBlobStore(BlobStore):
+    name = "local"
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def _path(self, key: str) -> Path:
+        if len(key) != 64 or not all(c in "0123456789abcdef" for c in key):
+            raise BlobNotFoundError(key)
+        return self.root / key[:2] / key
+
+    def put(self, data: bytes) -> str:
+        key = blob_key(data)
+        path = self._path(key)
+        if path.is_file():
+            return key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)  # atomic: readers never see a partial blob
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        return key
+
+    def open(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        try:
+            f = open(self._path(key), "rb")
+        except FileNotFoundError:
+            raise BlobNotFoundError(key) from None
+        f.seek(start)
+        remaining = None if end is None else end - start + 1
+
+        def chunks() -> Iterator[bytes]:
+            nonlocal remaining
+            with f:
+                while remaining is None or remaining > 0:
+                    chunk = f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        return
+                    if remaining is not None:
+                        remaining -= len(chunk)
+                    yield chunk
+
+        return chunks()
+
+    def size(self, key: str) -> int:
+        try:
+            return self._path(key).stat().st_size
+        except FileNotFoundError:
+            raise BlobNotFoundError(key) from None
+
+    def delete(self, key: str) -> None:
+        try:
+            self._path(key).unlink(missing_ok=True)
+        except BlobNotFoundError:
+            pass
+
+
+def sign_s3_request(
+    method: str,
+    host: str,
+    path: str,
+    payload_sha256: str,
+    amz_date: str,
+    access_key_id: str,
+    secret_access_key: str,
+    region: str,
+) -> dict[str, str]:
+    """SigV4 headers (x-amz-date, x-amz-content-sha256, authorization) for a request without query string.
+    path must already be URI-encoded. Host is signed but not returned: httpx sends it from the URL."""
+    day = amz_date[:8]
+    headers = {"host": host, "x-amz-content-sha256": payload_sha256, "x-amz-date": amz_date}
+    signed = ";".join(sorted(headers))
+    canonical = "\n".join([
+        method,
+        path,
+        "",  # no query string
+        "".join(f"{name}:{headers[name]}\n" for name in sorted(headers)),
+        signed,
+        payload_sha256,
+    ])
+    scope = f"{day}/{region}/s3/aws4_request"
+    to_sign = "\n".join(["AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical.encode()).hexdigest()])
+    signing_key = ("AWS4" + secret_access_key).encode()
+    for part in (day, region, "s3", "aws4_request"):
+        signing_key = hmac.new(signing_key, part.encode(), hashlib.sha256).digest()
+    signature = hmac.new(signing_key, to_sign.encode(), hashlib.sha256).hexdigest()
+    headers["authorization"] = (
+        f"AWS4-HMAC-SHA256 Credential={access_key_id}/{scope}, SignedHeaders={signed}, Signature={signature}"
+    )
+    del headers["host"]
+    return headers
+
+
+class S3BlobStore(BlobStore):
+    """Path-style S3 API (PUT/GET/DELETE object) with SigV4 headers; one pooled httpx client per process."""
+
+    name = "s3"
+
+    def __init__(self, endpoint: str, bucket: str, access_key_id: str, secret_access_key: str, region: str, prefix: str = ""):
+        self.endpoint = endpoint.rstrip("/")
+        self.host = urlparse(self.endpoint).netloc
+        self.bucket = bucket
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.region = region
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self._client = httpx.Client(timeout=httpx.Timeout(60, connect=10))
+
+    def _object_path(self, key: str) -> str:
+        return "/" + quote(f"{self.bucket}/{self.prefix}{key[:2]}/{key}", safe="/")
+
+    def _request(
+        self,
+        method: str,
+        key: str,
+        content: bytes = b"",
+        payload_sha256: str = EMPTY_SHA256,
+        stream: bool = False,
+        byte_range: Optional[str] = None,
+    ) -> httpx.Response:
+        path = self._object_path(key)
+        amz_date = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        headers = sign_s3_request(
+            method, self.host, path, payload_sha256, amz_date, self.access_key_id, self.secret_access_key, self.region
+        )
+        if byte_range:
+            headers["range"] = byte_range  # not part of the signature
+        request = self._client.build_request(method, self.endpoint + path, content=content or None, headers=headers)
+        return self._client.send(request, stream=stream)
+
+    def put(self, data: bytes) -> str:
+        key = blob_key(data)
+        r = self._request("PUT", key, content=data, payload_sha256=key)  # key is the payload's sha256
+        if r.status_code >= 300:
+            raise RuntimeError(f"S3 PUT {key} failed: {r.status_code} {r.text[:200]}")
+        return key
+
+    def open(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        byte_range = None
+        if start or end is not None:
+            byte_range = f"bytes={start}-{'' if end is None else end}"
+        r = self._request("GET", key, stream=True, byte_range=byte_range)
+        if r.status_code >= 300:
+            r.read()
+            r.close()
+            if r.status_code == 404:
+                raise BlobNotFoundError(key)
+            raise RuntimeError(f"S3 GET {key} failed: {r.status_code} {r.text[:200]}")
+
+        def chunks() -> Iterator[bytes]:
+            try:
+                yield from r.iter_bytes(CHUNK_SIZE)
+            finally:
+                r.close()
+
+        return chunks()
+
+    def size(self, key: str) -> int:
+        r = self._request("HEAD", key)
+        if r.status_code == 404:
+            raise BlobNotFoundError(key)
+        if r.status_code >= 300:
+            raise RuntimeError(f"S3 HEAD {key} failed: {r.status_code}")
+        return int(r.headers["content-length"])
+
+    def delete(self, key: str) -> None:
+        r = self._request("DELETE", key)
+        if r.status_code >= 300 and r.status_code != 404:
+            raise RuntimeError(f"S3 DELETE {key} failed: {r.status_code} {r.text[:200]}")
+
+
+@lru_cache(maxsize=1)
+def get_blob_store() -> Optional[BlobStore]:
+    """Store for new image bytes, or None when BLOB_STORE_BACKEND=db (bytes stay in the DB columns)."""
+    s = get_settings()
+    backend = (s.blob_store_backend or "db").strip().lower()
+    if backend == "db":
+        return None
+    if backend == "local":
+        return LocalBlobStore(get_blob_store_dir())
+    if backend == "s3":
+        if not (s.blob_store_s3_endpoint and s.blob_store_s3_bucket):
+            raise RuntimeError("BLOB_STORE_BACKEND=s3 needs BLOB_STORE_S3_ENDPOINT and BLOB_STORE_S3_BUCKET")
+        return S3BlobStore(
+            s.blob_store_s3_endpoint,
+            s.blob_store_s3_bucket,
+            s.blob_store_s3_access_key_id or "",
+            s.blob_store_s3_secret_access_key or "",
+            s.blob_store_s3_region,
+            s.blob_store_s3_prefix,
+        )
+    raise RuntimeError(f"Unknown BLOB_STORE_BACKEND: {backend!r} (db, local or s3)")
+
+
+def _store_for(key: str) -> BlobStore:
+    store = get_blob_store()
+    if store is None:
+        logger.warning("Row references blob %s but BLOB_STORE_BACKEND=db; rows were migrated to a store", key)
+        raise BlobNotFoundError(key)
+    return store
+
+
+def open_blob(key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+    """Chunks of a stored blob (optionally bytes start..end). Raises BlobNotFoundError if it is missing or no store
+    is configured."""
+    return _store_for(key).open(key, start, end)
+
+
+def blob_size(key: str) -> int:
+    return _store_for(key).size(key)
+
+
+def read_blob(key: str) -> bytes:
+    return b"".join(open_blob(key))
+
+
+def delete_unreferenced_blobs(db: Session, keys: Iterable[Optional[str]]) -> int:
+    """After rows were deleted (and committed): remove the blobs no remaining row points at. Returns count removed."""
+    store = get_blob_store()
+    keys = {k for k in keys if k}
+    if store is None or not keys:
+        return 0
+    wanted = list(keys)
+    referenced = {k for (k,) in db.query(OrderResultImage.blob_key).filter(OrderResultImage.blob_key.in_(wanted))}
+    referenced |= {k for (k,) in db.query(OrderResultVariant.blob_key).filter(OrderResultVariant.blob_key.in_(wanted))}
+    referenced |= {k for (k,) in db.query(OrderSourceImage.blob_key).filter(OrderSourceImage.blob_key.in_(wanted))}
+    referenced |= {
+        k for (k,) in db.query(OrderSourceImage.original_blob_key).filter(OrderSourceImage.original_blob_key.in_(wanted))
+    }
+    removed = 0
+    for key in keys - referenced:
+        try:
+            store.delete(key)
+            removed += 1
+        except Exception as e:
+            logger.warning("Blob %s: delete failed: %s", key, e)
+    return removed
@@ -0,0 +1,197 @@
+"""
+Per-provider circuit breaker shared by every order in the process.
+
+Closed: calls go through; the last CIRCUIT_BREAKER_WINDOW outcomes are kept. Once at least
+CIRCUIT_BREAKER_MIN_CALLS are in the window and the failure rate (429/5xx/network errors, failed
+or timed-out predictions) or the slow-call rate crosses its threshold, the breaker opens.
+Open: calls are refused at once with StyleTransferCircuitOpen and clients stop their backoff
+retries, so images fail over to the other provider instead of sleeping. After
+CIRCUIT_BREAKER_OPEN_SECONDS it goes half-open.
+Half-open: up to CIRCUIT_BREAKER_HALF_OPEN_PROBES calls are let through as probes; that many
+successes close the breaker, any failure opens it again.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from clients.replicate_client import StyleTransferCircuitOpen
+from config import get_settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Thread-safe breaker over a sliding window of call outcomes."""
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 120.0,
+        slow_call_rate: float = 0.8,
+        open_seconds: float = 60.0,
+        half_open_probes: int = 2,
+    ):
+        self.name = name
+        self.min_calls = max(1, min_calls)
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self._outcomes: deque[tuple[bool, bool]] = deque(maxlen=max(self.min_calls, window))  # (failed, slow)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+        self._stats = {"trips": 0, "rejected": 0, "failures": 0, "successes": 0}
+        self._last_trip_reason: Optional[str] = None
+
+    def _current_state(self) -> str:
+        """State with the open → half-open timeout applied. Caller holds self._lock."""
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+        return self._state
+
+    def _trip(self, reason: str) -> None:
+        """Caller holds self._lock."""
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._stats["trips"] += 1
+        self._last_trip_reason = reason
+
+    def _rates(self) -> tuple[float, float]:
+        n = len(self._outcomes)
+        if not n:
+            return 0.0, 0.0
+        return sum(f for f, _ in self._outcomes) / n, sum(s for _, s in self._outcomes) / n
+
+    def _evaluate(self) -> None:
+        """Open the breaker if the window crossed a threshold. Caller holds self._lock."""
+        if len(self._outcomes) < self.min_calls:
+            return
+        failed, slow = self._rates()
+        if failed >= self.failure_rate:
+            self._trip(f"failure rate {failed:.0%} over last {len(self._outcomes)} calls")
+        elif slow >= self.slow_call_rate:
+            self._trip(f"{slow:.0%} of last {len(self._outcomes)} calls slower than {self.slow_call_seconds:.0f}s")
+
+    def is_open(self) -> bool:
+        """True while calls are refused (half-open counts as not open: probes are running)."""
+        with self._lock:
+            return self._current_state() == OPEN
+
+    def accepting(self) -> bool:
+        """Whether a new call would be admitted right now (does not take a probe slot)."""
+        with self._lock:
+            state = self._current_state()
+            return state == CLOSED or (state == HALF_OPEN and self._probes_in_flight < self.half_open_probes)
+
+    @contextmanager
+    def call(self) -> Iterator[None]:
+        """Admit one call or raise StyleTransferCircuitOpen. In half-open the call is a probe
+        and holds one of the probe slots until it exits; outcomes are reported separately."""
+        with self._lock:
+            state = self._current_state()
+            probe = state == HALF_OPEN
+            if state == OPEN or (probe and self._probes_in_flight >= self.half_open_probes):
+                self._stats["rejected"] += 1
+                raise StyleTransferCircuitOpen(f"{self.name} circuit open: {self._last_trip_reason}")
+            if probe:
+                self._probes_in_flight += 1
+        try:
+            yield
+        finally:
+            if probe:
+                with self._lock:
+                    self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def record_success(self, seconds: float) -> None:
+        slow = seconds >= self.slow_call_seconds
+        with self._lock:
+            self._stats["successes"] += 1
+            state = self._current_state()
+            if state == HALF_OPEN:
+                if slow:
+                    self._trip(f"half-open probe took {seconds:.0f}s")
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                return
+            self._outcomes.append((False, slow))
+            if state == CLOSED:
+                self._evaluate()
+
+    def record_failure(self, reason: str = "") -> None:
+        with self._lock:
+            self._stats["failures"] += 1
+            state = self._current_state()
+            if state == HALF_OPEN:
+                self._trip(f"half-open probe failed: {reason}"[:200])
+                return
+            self._outcomes.append((True, False))
+            if state == CLOSED:
+                self._evaluate()
+
+    def stats(self) -> dict:
+        with self._lock:
+            state = self._current_state()
+            failed, slow = self._rates()
+            reopen_in = max(0.0, self._opened_at + self.open_seconds - time.monotonic()) if state == OPEN else None
+            return {
+                "provider": self.name,
+                "state": state,
+                "window_calls": len(self._outcomes),
+                "failure_rate": round(failed, 3),
+                "slow_call_rate": round(slow, 3),
+                "half_open_in_seconds": round(reopen_in, 1) if reopen_in is not None else None,
+                "last_trip_reason": self._last_trip_reason,
+                **self._stats,
+            }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(provider: str) -> Optional[CircuitBreaker]:
+    """Process-wide breaker for "openai" or "replicate" (created lazily), or None when CIRCUIT_BREAKER_ENABLED is off."""
+    s = get_settings()
+    if not s.circuit_breaker_enabled:
+        return None
+    with _breakers_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                provider,
+                window=s.circuit_breaker_window,
+                min_calls=s.circuit_breaker_min_calls,
+                failure_rate=s.circuit_breaker_failure_rate,
+                slow_call_seconds=s.replicate_slow_call_seconds if provider == "replicate" else s.openai_slow_call_seconds,
+                slow_call_rate=s.circuit_breaker_slow_call_rate,
+                open_seconds=s.circuit_breaker_open_seconds,
+                half_open_probes=s.circuit_breaker_half_open_probes,
+            )
+            _breakers[provider] = breaker
+        return breaker
+
+
+def provider_accepting(provider: str) -> bool:
+    """False while the provider's breaker refuses new calls."""
+    breaker = get_circuit_breaker(provider)
+    return breaker is None or breaker.accepting()
+
+
+def circuit_breaker_stats() -> list[dict]:
+    return [breaker.stats() for breaker in list(_breakers.values())]
@@ -0,0 +1,136 @@
+"""
+Cluster-wide cap on concurrent image generations, shared by every web and worker process.
+
+The cap is GLOBAL_MAX_CONCURRENT_IMAGES leases named slot:images:<n> on art_leases
+(services/leases.py). An image takes a free or expired slot after its per-process scheduler slot and
+gives it back when the provider call ends. The job lease heartbeat renews the slots a process holds,
+so the slots of a process that died free themselves after JOB_LEASE_SECONDS. Waiters poll every
+GLOBAL_SLOT_POLL_SECONDS, or sooner when a slot is released in the same process. A cap of 0 (the
+default) turns this off, and only the per-process FairScheduler limits generation.
+"""
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from database import Lease, SessionLocal
+from services.leases import acquire_lease, release_lease, renew_lease
+
+logger = logging.getLogger(__name__)
+
+
+class GlobalSlots:
+    """`limit` slots named slot:<pool>:<n>, held as art_leases rows by this process's WORKER_ID."""
+
+    def __init__(self, pool: str, limit: int, ttl_seconds: float, poll_seconds: float = 2.0):
+        self.pool = pool
+        self.limit = limit
+        self.ttl_seconds = ttl_seconds
+        self.poll_seconds = poll_seconds
+        self._prefix = f"slot:{pool}:"
+        self._held: set[str] = set()
+        self._released = asyncio.Event()
+        self._waiting = 0
+        self._acquired = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+    def _try_acquire_sync(self) -> Optional[str]:
+        db = SessionLocal()
+        try:
+            taken = {
+                name
+                for (name,) in db.query(Lease.name).filter(
+                    Lease.name.like(self._prefix + "%"),
+                    Lease.expires_at >= datetime.utcnow(),
+                )
+            }
+            db.commit()
+            free = [f"{self._prefix}{n}" for n in range(self.limit) if f"{self._prefix}{n}" not in taken]
+            random.shuffle(free)  # processes racing for the last slots rarely pick the same one
+            for name in free[:3]:
+                if acquire_lease(db, name, self.ttl_seconds):
+                    return name
+            return None
+        finally:
+            db.close()
+
+    def _release_sync(self, name: str) -> None:
+        db = SessionLocal()
+        try:
+            release_lease(db, name)
+        finally:
+            db.close()
+
+    async def acquire(self) -> Optional[str]:
+        """Wait for a cluster slot; returns its name (None when the cap is off)."""
+        if not self.enabled:
+            return None
+        started = time.monotonic()
+        self._waiting += 1
+        try:
+            while True:
+                name = await asyncio.to_thread(self._try_acquire_sync)
+                if name:
+                    self._held.add(name)
+                    break
+                self._released.clear()
+                try:
+                    await asyncio.wait_for(self._released.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._waiting -= 1
+        waited = time.monotonic() - started
+        self._acquired += 1
+        self._total_wait += waited
+        self._max_wait = max(self._max_wait, waited)
+        return name
+
+    async def release(self, name: Optional[str]) -> None:
+        if name is None:
+            return
+        self._held.discard(name)
+        try:
+            await asyncio.to_thread(self._release_sync, name)
+        except Exception as e:  # the lease lapses on its own after ttl_seconds
+            logger.warning("Releasing global slot %s failed: %s", name, e)
+        self._released.set()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        name = await self.acquire()
+        try:
+            yield
+        finally:
+            # Shielded: a cancelled image must still hand its slot back.
+            await asyncio.shield(self.release(name))
+
+    def renew_sync(self) -> list[str]:
+        """Heartbeat (blocking, run in a thread): renew held slots. Returns the ones lost to another process."""
+        held = list(self._held)
+        if not held:
+            return []
+        db = SessionLocal()
+        try:
+            return [name for name in held if not renew_lease(db, name, self.ttl_seconds)]
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        return {
+            "pool": self.pool,
+            "limit": self.limit,
+            "held_here": len(self._held),
+            "waiting_here": self._waiting,
+            "acquired": self._acquired,
+            "avg_wait_seconds": round(self._total_wait / self._acquired, 2) if self._acquired else 0.0,
+            "max_wait_seconds": round(self._max_wait, 2),
+        }
@@ -0,0 +1,126 @@
+"""
+Hedged requests: if the primary provider has not answered within a learned latency percentile,
+start the same image on the secondary provider and keep whichever succeeds first.
+
+LatencyTracker keeps a sliding window of recent primary latencies; the hedge delay is
+their HEDGING_LATENCY_PERCENTILE (clamped to HEDGING_MIN_DELAY_SECONDS), or
+HEDGING_DEFAULT_DELAY_SECONDS until HEDGING_MIN_SAMPLES calls have been seen. A primary that is
+cancelled (it lost the hedge) is recorded at the time it had run, a lower bound of its latency:
+sampling only primaries that won would bias the percentile low and make hedges ever more frequent.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from config import get_settings
+
+
+class LatencyTracker:
+    """Thread-safe sliding window of latencies (seconds)."""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        k = max(0, min(len(samples) - 1, math.ceil(p / 100.0 * len(samples)) - 1))
+        return samples[k]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+_trackers: dict[str, LatencyTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def get_latency_tracker(provider: str) -> LatencyTracker:
+    with _trackers_lock:
+        tracker = _trackers.get(provider)
+        if tracker is None:
+            tracker = _trackers[provider] = LatencyTracker()
+        return tracker
+
+
+def hedge_delay(provider: str) -> float:
+    """Seconds to wait on `provider` before hedging, from its recent latencies."""
+    s = get_settings()
+    tracker = get_latency_tracker(provider)
+    learned = tracker.percentile(s.hedging_latency_percentile) if len(tracker) >= s.hedging_min_samples else None
+    delay = learned if learned is not None else float(s.hedging_default_delay_seconds)
+    return max(float(s.hedging_min_delay_seconds), delay)
+
+
+def hedging_stats() -> dict:
+    s = get_settings()
+    out = {"enabled": s.hedging_enabled, "percentile": s.hedging_latency_percentile, "providers": {}}
+    for name, tracker in list(_trackers.items()):
+        out["providers"][name] = {
+            "samples": len(tracker),
+            "p50_seconds": tracker.percentile(50),
+            "p90_seconds": tracker.percentile(90),
+            "hedge_after_seconds": round(hedge_delay(name), 1),
+        }
+    return out
+
+
+async def hedged_call(
+    primary_name: str,
+    primary: Callable[[], Awaitable[Any]],
+    secondary_name: str,
+    secondary: Callable[[], Awaitable[Any]],
+    delay: float,
+    decisions: Optional[list] = None,
+) -> Tuple[Any, str, dict]:
+    """Run primary(); if it is still running after `delay` seconds, also run secondary().
+    The first success wins and the other is cancelled. Returns (value, winner name, decision).
+    Raises the primary's error if every started call fails. Primary latencies are recorded when it succeeds, and
+    as the time it ran when it is cancelled.
+    The decision dict is also appended to `decisions` (failed attempts included)."""
+    started = time.monotonic()
+    decision: dict = {"primary": primary_name, "hedge_after_seconds": round(delay, 1), "hedged": False}
+    if decisions is not None:
+        decisions.append(decision)
+    primary_task = asyncio.ensure_future(primary())
+    tasks = {primary_task: primary_name}
+    errors: dict[str, BaseException] = {}
+    try:
+        done, _ = await asyncio.wait({primary_task}, timeout=delay)
+        if not done:
+            decision["hedged"] = True
+            decision["secondary"] = secondary_name
+            tasks[asyncio.ensure_future(secondary())] = secondary_name
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = tasks[task]
+                if task.exception() is not None:
+                    errors[name] = task.exception()
+                    continue
+                elapsed = time.monotonic() - started
+                if task is primary_task:
+                    get_latency_tracker(primary_name).record(elapsed)
+                decision.update(winner=name, latency_seconds=round(elapsed, 1))
+                if pending:
+                    decision["cancelled"] = [tasks[t] for t in pending]
+                return task.result(), name, decision
+    finally:
+        if not primary_task.done():
+            get_latency_tracker(primary_name).record(time.monotonic() - started)  # censored: took at least this long
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+    decision["errors"] = {name: str(err)[:200] for name, err in errors.items()}
+    raise errors.get(primary_name) or next(iter(errors.values()))
@@ -0,0 +1,60 @@
+"""
+HTTP validators for the image endpoints (/api/orders/{id}/result/{i}, /source-image).
+
+ETags are strong and content-derived: the sha256 stored with each image row (equal to its blob
+key), so a 304 is decided from row metadata without reading the bytes. Finished results never
+change, so they are sent with a long immutable Cache-Control. It is private: these are customers'
+portraits, and a shared cache would keep them past the retention window. Only a single byte range
+is served (multi-range requests get the whole image, which RFC 9110 allows).
+"""
+from typing import Optional
+
+PRIVATE_IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"  # may still change (image of an order in flight): always revalidate via ETag
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def strong_etag(digest: str) -> str:
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison: W/"x" matches "x"; "*" matches anything."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def parse_byte_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """(start, end) inclusive for a single `bytes=` range, None to serve the whole body (no, malformed or multi-range
+    header). Raises RangeNotSatisfiable when the range lies outside the body."""
+    if not header or size <= 0:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if not first:  # suffix range: last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    if start < 0 or end < start:
+        return None
+    return start, min(end, size - 1)
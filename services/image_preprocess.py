@@ -0,0 +1,136 @@
+"""
+Upload preprocessing: turn the customer's photo into the provider-facing source image.
+
+Decodes the upload, applies EXIF orientation, drops metadata (EXIF/GPS, ICC, comments),
+flattens transparency onto white and downscales so the longest side is at most
+PROVIDER_IMAGE_MAX_SIDE (providers work at ~1024px; OpenAI edits run at 1024x1024), then
+re-encodes as JPEG. Decoding and resizing are CPU-bound, so they run in a small process pool
+(UPLOAD_PREPROCESS_WORKERS) instead of on the event loop. The original upload is kept as-is.
+
+The same pool builds the gallery variants of each generated result (result_variants_sync):
+WebP copies capped at RESULT_THUMB_MAX_SIDE / RESULT_MEDIUM_MAX_SIDE.
+
+Requires Pillow; without it preprocess_upload() and result_variants_sync() return None and the
+originals are used.
+"""
+import asyncio
+import io
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from config import get_settings
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional: uploads are then passed through unchanged
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_IMAGE_FILENAME = "provider.jpg"  # derivative stored next to photo{ext} in the upload dir
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()  # result variants are requested from worker threads
+
+
+class UnreadableImage(ValueError):
+    """The upload is not a decodable image."""
+
+
+def prepare_provider_image(data: bytes, max_side: int, quality: int) -> Tuple[bytes, str]:
+    """Return (jpeg bytes, "image/jpeg") for the provider. Raises UnreadableImage. Runs in a worker process."""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.load()
+            img = ImageOps.exif_transpose(img)
+            if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+                rgba = img.convert("RGBA")
+                img = Image.new("RGB", rgba.size, (255, 255, 255))
+                img.paste(rgba, mask=rgba.getchannel("A"))
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+            if max(img.size) > max_side:
+                img.thumbnail((max_side, max_side), Image.LANCZOS)
+            out = io.BytesIO()
+            # A fresh save without exif/icc_profile arguments writes no metadata.
+            img.save(out, format="JPEG", quality=quality, optimize=True)
+            return out.getvalue(), "image/jpeg"
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        raise UnreadableImage(str(e)) from e
+
+
+def build_result_variants(
+    data: bytes, max_sides: dict[str, int], quality: int
+) -> Tuple[Tuple[int, int], dict[str, Tuple[bytes, int, int]]]:
+    """((width, height) of the result, {variant: (webp bytes, width, height)}). A variant at least as large as the
+    result is skipped (no upscaling). Raises UnreadableImage. Runs in a worker process."""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.load()
+            size = img.size
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if img.mode in ("LA", "PA") or "transparency" in img.info else "RGB")
+            variants = {}
+            for name, max_side in max_sides.items():
+                if max(size) <= max_side:
+                    continue
+                copy = img.copy()
+                copy.thumbnail((max_side, max_side), Image.LANCZOS)
+                out = io.BytesIO()
+                copy.save(out, format="WEBP", quality=quality, method=4)
+                variants[name] = (out.getvalue(), copy.width, copy.height)
+            return size, variants
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        raise UnreadableImage(str(e)) from e
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: the web process runs threads (DB init, to_thread calls); forking those is unsafe.
+            _executor = ProcessPoolExecutor(
+                max_workers=max(1, get_settings().upload_preprocess_workers),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+async def preprocess_upload(data: bytes) -> Optional[Tuple[bytes, str]]:
+    """Provider-facing (bytes, content_type) for an upload, computed in the process pool.
+    None when Pillow is not installed. Raises UnreadableImage for files that are not images."""
+    if Image is None:
+        return None
+    s = get_settings()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_executor(), prepare_provider_image, data, s.provider_image_max_side, s.provider_image_jpeg_quality
+    )
+
+
+def result_variants_sync(
+    data: bytes,
+) -> Optional[Tuple[Tuple[int, int], dict[str, Tuple[bytes, int, int]]]]:
+    """Gallery variants of a result image (see build_result_variants), computed in the process pool. Blocking: call
+    from a worker thread. None when disabled, without Pillow, or if the image cannot be decoded."""
+    s = get_settings()
+    if Image is None or not s.result_variants_enabled:
+        return None
+    max_sides = {"thumb": s.result_thumb_max_side, "medium": s.result_medium_max_side}
+    try:
+        return _get_executor().submit(build_result_variants, data, max_sides, s.result_variant_webp_quality).result()
+    except Exception as e:
+        logger.warning("Result variants failed, serving the original only: %s", e)
+        return None
+
+
+def shutdown_preprocess_pool() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
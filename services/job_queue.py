@@ -0,0 +1,300 @@
+"""
+Durable per-image job queue on the art_jobs table.
+
+One row per (order, style image). Workers claim due rows with SELECT … FOR UPDATE SKIP LOCKED
+on PostgreSQL, or with per-row conditional UPDATEs on SQLite, so several workers/processes can
+drain the queue without duplicate work. Polling cost depends on queued work, not order history.
+"""
+import json
+import logging
+import os
+import random
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from database import ImageJob, JobStatus
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process in art_jobs.locked_by
+WORKER_ID = f"{socket.gethostname()[:32]}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def _due_filter(now: datetime):
+    """Queued jobs whose next_attempt_at has passed, or running jobs whose lease expired."""
+    return or_(
+        and_(ImageJob.status == JobStatus.QUEUED.value, ImageJob.next_attempt_at <= now),
+        and_(ImageJob.status == JobStatus.RUNNING.value, ImageJob.locked_until < now),
+    )
+
+
+def enqueue_order_jobs(
+    db: Session,
+    order_id: str,
+    style_urls: list[str],
+    done_urls: Optional[list[str]] = None,
+) -> int:
+    """Insert missing jobs for an order (idempotent). done_urls marks legacy results as done. Caller commits."""
+    existing = {
+        idx for (idx,) in db.query(ImageJob.image_index).filter(ImageJob.order_id == order_id).all()
+    }
+    done_urls = done_urls or []
+    now = datetime.utcnow()
+    added = 0
+    for i, style_url in enumerate(style_urls, start=1):
+        if i in existing:
+            continue
+        done_url = done_urls[i - 1] if i <= len(done_urls) else None
+        is_done = bool(done_url) and done_url.startswith(("http://", "https://"))
+        db.add(ImageJob(
+            order_id=order_id,
+            image_index=i,
+            style_image_url=style_url,
+            status=JobStatus.DONE.value if is_done else JobStatus.QUEUED.value,
+            result_url=done_url if is_done else None,
+            next_attempt_at=now,
+            created_at=now,
+            updated_at=now,
+        ))
+        added += 1
+    return added
+
+
+def claim_jobs(
+    db: Session,
+    limit: int,
+    lease_seconds: int,
+    worker_id: str = WORKER_ID,
+    per_order_limit: Optional[int] = None,
+    held: Optional[dict[str, int]] = None,
+    max_running_orders: Optional[int] = None,
+) -> list[ImageJob]:
+    """Atomically claim up to `limit` due jobs for this worker and commit. Returns the claimed rows.
+
+    With per_order_limit, no order ends up holding more than that many jobs in this worker
+    (held = jobs per order it already runs) and candidates are taken round-robin across orders,
+    so one large pack cannot fill the whole claim window. Within an order the lowest image_index
+    goes first ("best-5-first": a pack's first five are the paintings a 5-pack gets), so a retried
+    headline image is claimed before the rest of a 15-pack.
+    With max_running_orders (cluster-wide cap), jobs of orders not yet running on any worker are only
+    claimed while fewer than that many orders run. Soft: workers claiming at the same instant can each
+    start one order over the cap.
+    """
+    if limit <= 0:
+        return []
+    now = datetime.utcnow()
+    values = {
+        "status": JobStatus.RUNNING.value,
+        "locked_by": worker_id,
+        "locked_until": now + timedelta(seconds=lease_seconds),
+        "updated_at": now,
+    }
+    candidates = (
+        db.query(ImageJob.id, ImageJob.order_id, ImageJob.image_index)
+        .filter(_due_filter(now))
+        .order_by(ImageJob.next_attempt_at, ImageJob.order_id, ImageJob.image_index)
+        .limit(limit if per_order_limit is None else limit * 4)
+        .all()
+    )
+    if max_running_orders:
+        candidates = _within_order_cap(db, candidates, max_running_orders, now)
+    job_ids = [job_id for job_id, _, _ in candidates]
+    if per_order_limit is not None:
+        by_order: dict[str, list[tuple[int, int]]] = {}
+        for job_id, order_id, image_index in candidates:
+            by_order.setdefault(order_id, []).append((image_index, job_id))
+        rank: dict[str, int] = dict(held or {})
+        ranked = []
+        for pos, (order_id, jobs) in enumerate(by_order.items()):
+            for _, job_id in sorted(jobs):
+                rank[order_id] = rank.get(order_id, 0) + 1
+                if rank[order_id] <= per_order_limit:
+                    ranked.append((rank[order_id], pos, job_id))
+        job_ids = [job_id for _, _, job_id in sorted(ranked)[:limit]]
+    if not job_ids:
+        db.commit()
+        return []
+    if db.get_bind().dialect.name == "postgresql":
+        rows = (
+            db.query(ImageJob)
+            .filter(ImageJob.id.in_(job_ids), _due_filter(now))
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        for row in rows:
+            for key, value in values.items():
+                setattr(row, key, value)
+            row.attempts = (row.attempts or 0) + 1
+        db.commit()
+        return rows
+    # SQLite (no row locks): claim each candidate with a conditional UPDATE; losers see rowcount 0.
+    claimed_ids = []
+    for job_id in job_ids:
+        updated = (
+            db.query(ImageJob)
+            .filter(ImageJob.id == job_id, _due_filter(now))
+            .update({**values, "attempts": ImageJob.attempts + 1}, synchronize_session=False)
+        )
+        if updated == 1:
+            claimed_ids.append(job_id)
+    db.commit()
+    if not claimed_ids:
+        return []
+    return db.query(ImageJob).filter(ImageJob.id.in_(claimed_ids)).all()
+
+
+def _within_order_cap(db: Session, candidates: list, max_running_orders: int, now: datetime) -> list:
+    """Candidates whose order already runs somewhere, plus new orders while the cluster is under the cap."""
+    running = {
+        order_id
+        for (order_id,) in db.query(ImageJob.order_id)
+        .filter(ImageJob.status == JobStatus.RUNNING.value, ImageJob.locked_until >= now)
+        .distinct()
+    }
+    room = max_running_orders - len(running)
+    admitted: set[str] = set()
+    kept = []
+    for candidate in candidates:
+        order_id = candidate[1]
+        if order_id not in running and order_id not in admitted:
+            if len(admitted) >= room:
+                continue
+            admitted.add(order_id)
+        kept.append(candidate)
+    return kept
+
+
+def renew_job_leases(db: Session, job_ids: list[int], lease_seconds: int, worker_id: str = WORKER_ID) -> list[int]:
+    """Heartbeat: extend the leases worker_id still holds among job_ids and commit. Returns the ids that
+    another worker has meanwhile claimed (their lease lapsed before this renewal)."""
+    if not job_ids:
+        return []
+    now = datetime.utcnow()
+    db.query(ImageJob).filter(
+        ImageJob.id.in_(job_ids),
+        ImageJob.status == JobStatus.RUNNING.value,
+        ImageJob.locked_by == worker_id,
+    ).update({"locked_until": now + timedelta(seconds=lease_seconds)}, synchronize_session=False)
+    lost = [
+        job_id
+        for (job_id,) in db.query(ImageJob.id).filter(
+            ImageJob.id.in_(job_ids),
+            ImageJob.status == JobStatus.RUNNING.value,
+            ImageJob.locked_by != worker_id,
+        )
+    ]
+    db.commit()
+    return lost
+
+
+def mark_job_done(
+    job: ImageJob,
+    result_url: str,
+    provider_job_id: Optional[str],
+    prediction_details: Optional[dict],
+) -> None:
+    """Caller commits."""
+    job.status = JobStatus.DONE.value
+    job.result_url = result_url
+    job.provider_job_id = provider_job_id
+    job.prediction_details = json.dumps(prediction_details) if prediction_details is not None else None
+    job.error = None
+    job.locked_by = None
+    job.locked_until = None
+    job.updated_at = datetime.utcnow()
+
+
+def mark_job_failed(job: ImageJob, error: str) -> None:
+    """Caller commits."""
+    job.status = JobStatus.FAILED.value
+    job.error = error
+    job.locked_by = None
+    job.locked_until = None
+    job.updated_at = datetime.utcnow()
+
+
+def retry_delay(attempts: int, base_seconds: float, max_seconds: float, retry_after: Optional[float] = None) -> float:
+    """Backoff before a job that failed its attempts-th claim is due again: base × 2^(attempts-1) capped at
+    max_seconds, jittered to 50-100% so images that failed together do not come back together. Never sooner
+    than the provider's Retry-After."""
+    ceiling = min(max_seconds, base_seconds * 2 ** max(0, attempts - 1))
+    return max(random.uniform(ceiling / 2, ceiling), retry_after or 0.0)
+
+
+def release_job(job: ImageJob, delay_seconds: float = 0, error: Optional[str] = None) -> None:
+    """Put a claimed job back in the queue, due after delay_seconds. Caller commits."""
+    now = datetime.utcnow()
+    job.status = JobStatus.QUEUED.value
+    job.next_attempt_at = now + timedelta(seconds=delay_seconds)
+    job.error = error
+    job.locked_by = None
+    job.locked_until = None
+    job.updated_at = now
+
+
+def fail_pending_jobs(db: Session, order_id: str, error: str) -> int:
+    """Fail the order's not-yet-started jobs (order failed elsewhere). Caller commits."""
+    return (
+        db.query(ImageJob)
+        .filter(ImageJob.order_id == order_id, ImageJob.status == JobStatus.QUEUED.value)
+        .update(
+            {"status": JobStatus.FAILED.value, "error": error, "updated_at": datetime.utcnow()},
+            synchronize_session=False,
+        )
+    )
+
+
+def requeue_order_jobs(db: Session, order_id: str) -> int:
+    """Make the order's failed/queued jobs due now (order retry); running leases are left alone. Caller commits."""
+    now = datetime.utcnow()
+    return (
+        db.query(ImageJob)
+        .filter(
+            ImageJob.order_id == order_id,
+            ImageJob.status.in_([JobStatus.FAILED.value, JobStatus.QUEUED.value]),
+        )
+        .update(
+            {
+                "status": JobStatus.QUEUED.value,
+                "next_attempt_at": now,
+                "error": None,
+                "locked_by": None,
+                "locked_until": None,
+                "updated_at": now,
+            },
+            synchronize_session=False,
+        )
+    )
+
+
+def order_jobs(db: Session, order_id: str) -> list[ImageJob]:
+    return (
+        db.query(ImageJob)
+        .filter(ImageJob.order_id == order_id)
+        .order_by(ImageJob.image_index)
+        .all()
+    )
+
+
+def release_worker_jobs(db: Session, worker_id: str = WORKER_ID) -> int:
+    """Return every job leased to worker_id to the queue (worker shutting down). Caller commits."""
+    now = datetime.utcnow()
+    return (
+        db.query(ImageJob)
+        .filter(ImageJob.status == JobStatus.RUNNING.value, ImageJob.locked_by == worker_id)
+        .update(
+            {
+                "status": JobStatus.QUEUED.value,
+                "next_attempt_at": now,
+                "locked_by": None,
+                "locked_until": None,
+                "updated_at": now,
+            },
+            synchronize_session=False,
+        )
+    )
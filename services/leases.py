@@ -0,0 +1,89 @@
+"""
+Named leases on the art_leases table: a cross-process lock with an owner, an expiry and a heartbeat.
+
+A lease is taken with one conditional UPDATE that only matches an expired row (renew_lease is the
+heartbeat of a held one), so two callers with the same owner id still exclude each other. A missing
+row is created with an INSERT and the primary key decides between concurrent creators. That gives the
+same exclusivity on PostgreSQL and SQLite, and no connection is held while the lease is: a holder
+that dies stops renewing and its lease lapses after ttl_seconds.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import Lease
+from services.job_queue import WORKER_ID
+
+
+def acquire_lease(db: Session, name: str, ttl_seconds: float, owner: str = WORKER_ID) -> bool:
+    """Take `name` for owner if nobody holds it (held by owner itself counts as held). Commits. True on success."""
+    now = datetime.utcnow()
+    updated = (
+        db.query(Lease)
+        .filter(Lease.name == name, Lease.expires_at < now)
+        .update(
+            {
+                "acquired_at": now,
+                "owner": owner,
+                "heartbeat_at": now,
+                "expires_at": now + timedelta(seconds=ttl_seconds),
+            },
+            synchronize_session=False,
+        )
+    )
+    if updated == 1:
+        db.commit()
+        return True
+    if db.query(Lease.name).filter(Lease.name == name).first() is not None:
+        db.commit()  # held
+        return False
+    db.add(Lease(
+        name=name,
+        owner=owner,
+        acquired_at=now,
+        heartbeat_at=now,
+        expires_at=now + timedelta(seconds=ttl_seconds),
+    ))
+    try:
+        db.commit()
+        return True
+    except IntegrityError:  # another process created it first
+        db.rollback()
+        return False
+
+
+def renew_lease(db: Session, name: str, ttl_seconds: float, owner: str = WORKER_ID) -> bool:
+    """Heartbeat: push expires_at out if owner still holds `name`. Commits. False if the lease was taken over."""
+    now = datetime.utcnow()
+    updated = (
+        db.query(Lease)
+        .filter(Lease.name == name, Lease.owner == owner)
+        .update(
+            {"heartbeat_at": now, "expires_at": now + timedelta(seconds=ttl_seconds)},
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    return updated == 1
+
+
+def release_lease(db: Session, name: str, owner: str = WORKER_ID) -> bool:
+    """Give `name` up if owner holds it. Commits."""
+    deleted = (
+        db.query(Lease)
+        .filter(Lease.name == name, Lease.owner == owner)
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted == 1
+
+
+def lease_holder(db: Session, name: str) -> Optional[Lease]:
+    """The unexpired lease on `name`, or None when it is free."""
+    return (
+        db.query(Lease)
+        .filter(Lease.name == name, Lease.expires_at >= datetime.utcnow())
+        .first()
+    )
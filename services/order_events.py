@@ -0,0 +1,153 @@
+"""
+Order change notifications for the SSE status stream (GET /api/orders/{order_id}/events).
+
+Code that changes an order's status or results calls notify_order_changed(db, order_id) before
+committing. After the commit, every subscriber of that order in this process is woken. Subscribers
+are asyncio.Events, so a burst of changes coalesces into one re-read. On PostgreSQL the same call
+also queues a NOTIFY on ORDER_EVENTS_CHANNEL in the caller's transaction, which is delivered only if
+that transaction commits. A listener thread in every process (start_listener) turns those notifications
+into local wakeups, so a change made by the standalone worker reaches a stream served by a web process.
+SQLite has no NOTIFY; there the local wakeup is all there is (single-process deploys).
+"""
+import asyncio
+import logging
+import select
+import threading
+from typing import Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+ORDER_EVENTS_CHANNEL = "artify_order_events"
+_PENDING_KEY = "order_events_pending"  # Session.info key: order ids to publish after commit
+
+
+class OrderEventHub:
+    """In-process pub/sub keyed by order id. publish() is thread-safe; subscribe() runs on the event loop."""
+
+    def __init__(self) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: dict[str, set[asyncio.Event]] = {}
+        self._published = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def subscribe(self, order_id: str) -> asyncio.Event:
+        """Event that is set on every change of order_id until unsubscribe(). Clear it after handling."""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        self._subscribers.setdefault(order_id, set()).add(changed)
+        return changed
+
+    def unsubscribe(self, order_id: str, changed: asyncio.Event) -> None:
+        subs = self._subscribers.get(order_id)
+        if subs is not None:
+            subs.discard(changed)
+            if not subs:
+                del self._subscribers[order_id]
+
+    def publish(self, order_id: str) -> None:
+        self._published += 1
+        if self._loop is None or order_id not in self._subscribers:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wake, order_id)
+        except RuntimeError:  # loop closed (shutdown)
+            pass
+
+    def _wake(self, order_id: str) -> None:
+        for changed in self._subscribers.get(order_id, ()):
+            changed.set()
+
+    def stats(self) -> dict:
+        return {
+            "orders_watched": len(self._subscribers),
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            "published": self._published,
+        }
+
+
+hub = OrderEventHub()
+
+
+def notify_order_changed(db: Session, order_id: str) -> None:
+    """Announce a change of order_id once db's transaction commits. Call before db.commit()."""
+    db.info.setdefault(_PENDING_KEY, set()).add(order_id)
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_notify(:channel, :order_id)"), {"channel": ORDER_EVENTS_CHANNEL, "order_id": order_id})
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _publish_after_commit(session: Session) -> None:
+    for order_id in session.info.pop(_PENDING_KEY, ()):
+        hub.publish(order_id)
+
+
+@event.listens_for(SessionLocal, "after_soft_rollback")
+def _drop_after_rollback(session: Session, previous_transaction) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+class _PgListener(threading.Thread):
+    """LISTEN on a dedicated connection (detached from the pool) and republish notifications locally."""
+
+    def __init__(self, engine: Engine) -> None:
+        super().__init__(name="order-events-listener", daemon=True)
+        self._engine = engine
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._engine.raw_connection()
+                conn.detach()  # held for the life of the process; don't count it against the pool
+                dbapi_conn = conn.dbapi_connection
+                dbapi_conn.autocommit = True
+                with dbapi_conn.cursor() as cur:
+                    cur.execute(f"LISTEN {ORDER_EVENTS_CHANNEL}")
+                logger.info("Listening for order events on %s", ORDER_EVENTS_CHANNEL)
+                while not self._stop.is_set():
+                    if select.select([dbapi_conn], [], [], 5)[0]:
+                        dbapi_conn.poll()
+                        while dbapi_conn.notifies:
+                            hub.publish(dbapi_conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.warning("Order event listener error, reconnecting in 5s: %s", e)
+                self._stop.wait(5)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+
+_listener: Optional[_PgListener] = None
+
+
+def start_listener(engine: Engine, loop: asyncio.AbstractEventLoop) -> None:
+    """Bind the hub to loop and, on PostgreSQL, start the LISTEN thread (once per process)."""
+    global _listener
+    hub.bind(loop)
+    if engine.dialect.name != "postgresql" or _listener is not None:
+        return
+    _listener = _PgListener(engine)
+    _listener.start()
+
+
+def stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
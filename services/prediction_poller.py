@@ -0,0 +1,155 @@
+"""
+Central poller for outstanding Replicate predictions.
+
+Instead of one polling loop per image, every waiter registers its prediction id here and a
+single task per process refreshes them all each POLLING_INTERVAL_SECONDS on one pooled
+connection: with many outstanding ids it reads the recent-predictions list (one request
+covers up to 100), and only ids not found there get individual GETs, at most
+max_parallel_gets at a time. Request volume grows with poll ticks, not in-flight images.
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import httpx
+
+from clients.replicate_client import TERMINAL_STATUSES, ReplicateClient, StyleTransferTimeout
+
+logger = logging.getLogger(__name__)
+
+RECENT_RESOLVED_MAX = 500  # terminal payloads kept so callers need no extra GET for prediction details
+
+
+class PredictionPoller:
+    """Batch status refresh for one Replicate account/base URL on the current event loop."""
+
+    def __init__(
+        self,
+        client: ReplicateClient,
+        max_parallel_gets: int = 8,
+        list_threshold: int = 10,
+        list_pages: int = 2,
+    ):
+        self.client = client
+        self.max_parallel_gets = max(1, max_parallel_gets)
+        self.list_threshold = list_threshold  # use the list endpoint once this many ids are outstanding
+        self.list_pages = list_pages
+        self.loop = asyncio.get_running_loop()
+        self._pending: dict[str, asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._resolved: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._stats = {"ticks": 0, "list_requests": 0, "get_requests": 0, "resolved": 0, "errors": 0}
+
+    async def wait(self, prediction_id: str) -> str:
+        """Wait until the prediction finishes and return its output URL (same errors as poll_result)."""
+        fut = self._pending.get(prediction_id)
+        if fut is None:
+            fut = self.loop.create_future()
+            self._pending[prediction_id] = fut
+        if self._task is None:
+            self._task = self.loop.create_task(self._run())
+        try:
+            payload = await asyncio.wait_for(asyncio.shield(fut), timeout=self.client.polling_timeout)
+        except asyncio.TimeoutError:
+            # Replicate didn't finish the job within the limit: server busy, cold start, or job stuck.
+            raise StyleTransferTimeout(f"Polling timed out after {self.client.polling_timeout}s")
+        finally:
+            if self._pending.get(prediction_id) is fut and not fut.done():
+                self._pending.pop(prediction_id, None)
+        return self.client.terminal_output(payload)
+
+    async def _run(self) -> None:
+        limits = httpx.Limits(max_connections=self.max_parallel_gets, max_keepalive_connections=self.max_parallel_gets)
+        async with httpx.AsyncClient(timeout=self.client.timeout_seconds, limits=limits) as http:
+            while self._pending:
+                await asyncio.sleep(self.client.polling_interval)
+                try:
+                    await self._refresh(http)
+                except Exception as e:
+                    self._stats["errors"] += 1
+                    logger.warning("Replicate batch poll failed: %s", e)
+            # Cleared before the client closes, so a waiter arriving now starts a fresh task.
+            self._task = None
+
+    async def _refresh(self, http: httpx.AsyncClient) -> None:
+        self._stats["ticks"] += 1
+        outstanding = set(self._pending)
+        if len(outstanding) >= self.list_threshold:
+            url = None
+            for _ in range(self.list_pages):
+                self._stats["list_requests"] += 1
+                page = await self.client.alist_predictions_page(http, url)
+                for pred in page.get("results") or []:
+                    pid = pred.get("id")
+                    if pid in outstanding:
+                        outstanding.discard(pid)
+                        self._settle(pred)
+                url = page.get("next")
+                if not outstanding or not url:
+                    break
+        if not outstanding:
+            return
+        semaphore = asyncio.Semaphore(self.max_parallel_gets)
+
+        async def refresh_one(prediction_id: str) -> None:
+            async with semaphore:
+                self._stats["get_requests"] += 1
+                try:
+                    pred = await self.client.aget_prediction(prediction_id, http=http)
+                except Exception as e:
+                    self._stats["errors"] += 1
+                    logger.warning("Replicate poll for %s failed: %s; retrying next tick", prediction_id, e)
+                    return
+                self._settle(pred)
+
+        await asyncio.gather(*(refresh_one(pid) for pid in outstanding))
+
+    def _settle(self, pred: Dict[str, Any]) -> None:
+        status = pred.get("status")
+        if status not in TERMINAL_STATUSES:
+            return
+        if status == "succeeded" and not pred.get("output"):
+            return  # list entries can lag; the next GET has the output
+        fut = self._pending.pop(pred.get("id"), None)
+        self._resolved[pred.get("id")] = pred
+        while len(self._resolved) > RECENT_RESOLVED_MAX:
+            self._resolved.popitem(last=False)
+        if fut is not None and not fut.done():
+            fut.set_result(pred)
+            self._stats["resolved"] += 1
+
+    def recent(self, prediction_id: str) -> Optional[Dict[str, Any]]:
+        return self._resolved.get(prediction_id)
+
+    def stats(self) -> dict:
+        return {"outstanding": len(self._pending), **self._stats}
+
+
+_pollers: dict[tuple[str, str, int], PredictionPoller] = {}
+
+
+def get_prediction_poller(client: ReplicateClient) -> PredictionPoller:
+    """Process-wide poller for the client's account on the running loop (created lazily)."""
+    loop = asyncio.get_running_loop()
+    key = (client.base_url, client.api_token, id(loop))
+    poller = _pollers.get(key)
+    if poller is None:
+        for stale in [k for k, p in _pollers.items() if p.loop.is_closed()]:
+            del _pollers[stale]
+        poller = PredictionPoller(client)
+        _pollers[key] = poller
+    return poller
+
+
+def recent_prediction(prediction_id: str) -> Optional[Dict[str, Any]]:
+    """Terminal payload the poller already fetched for prediction_id, if still cached."""
+    for poller in _pollers.values():
+        pred = poller.recent(prediction_id)
+        if pred is not None:
+            return pred
+    return None
+
+
+def poller_stats() -> list[dict]:
+    return [{"base_url": key[0], **poller.stats()} for key, poller in _pollers.items() if not poller.loop.is_closed()]
@@ -0,0 +1,145 @@
+"""
+Shared per-provider rate limiter: token bucket (requests per minute) plus a cap on
+concurrent in-flight requests. Every order in the process draws from the same limiter,
+so fanning out a pack's images cannot exceed the provider quota.
+"""
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator, Optional
+
+from config import get_settings
+
+
+class ProviderRateLimiter:
+    """Thread-safe token bucket + concurrency cap. requests_per_minute <= 0 disables the bucket.
+
+    acquire()/slot() block the calling thread; acquire_async()/aslot() wait on the event loop
+    instead, so coroutines can share the same budget without holding a thread while queued.
+    """
+
+    def __init__(self, name: str, requests_per_minute: int, max_concurrent: int):
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrent = max(1, max_concurrent)
+        # Burst is capped at the concurrency limit so a cold bucket does not fire a full minute at once.
+        self._capacity = float(max(1, min(requests_per_minute, self.max_concurrent))) if requests_per_minute > 0 else 0.0
+        self._rate = requests_per_minute / 60.0 if requests_per_minute > 0 else 0.0
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._in_flight = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._async_waiters: set[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = set()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self._rate > 0:
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def _try_take(self) -> tuple[bool, Optional[float]]:
+        """Take a slot if possible. Otherwise return (False, seconds until a token, or None to wait for a release).
+        Caller holds self._cond."""
+        self._refill()
+        if self._in_flight >= self.max_concurrent:
+            return False, None
+        if self._rate > 0:
+            if self._tokens < 1.0:
+                return False, (1.0 - self._tokens) / self._rate
+            self._tokens -= 1.0
+        self._in_flight += 1
+        return True, None
+
+    def acquire(self) -> None:
+        """Block until a concurrency slot and a token are available."""
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    taken, wait = self._try_take()
+                    if taken:
+                        return
+                    self._cond.wait(wait)
+            finally:
+                self._waiting -= 1
+
+    async def acquire_async(self) -> None:
+        """Like acquire(), but waits on the running event loop instead of blocking a thread."""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                taken, wait = self._try_take()
+                if taken:
+                    return
+                waiter = (loop, loop.create_future())
+                self._async_waiters.add(waiter)
+                self._waiting += 1
+            try:
+                await asyncio.wait({waiter[1]}, timeout=wait)
+            finally:
+                with self._cond:
+                    self._async_waiters.discard(waiter)
+                    self._waiting -= 1
+
+    def release(self) -> None:
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._cond.notify_all()
+            for loop, fut in self._async_waiters:
+                try:
+                    loop.call_soon_threadsafe(_set_done, fut)
+                except RuntimeError:  # waiter's loop already closed
+                    pass
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self) -> AsyncIterator[None]:
+        await self.acquire_async()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        with self._cond:
+            self._refill()
+            return {
+                "provider": self.name,
+                "requests_per_minute": self.requests_per_minute,
+                "max_concurrent": self.max_concurrent,
+                "in_flight": self._in_flight,
+                "waiting": self._waiting,
+                "tokens": round(self._tokens, 2),
+            }
+
+
+def _set_done(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(None)
+
+
+_limiters: dict[str, ProviderRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_provider_limiter(provider: str) -> ProviderRateLimiter:
+    """Process-wide limiter for "openai" or "replicate", created lazily from settings."""
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            s = get_settings()
+            if provider == "replicate":
+                limiter = ProviderRateLimiter(provider, s.replicate_requests_per_minute, s.replicate_max_concurrent_requests)
+            else:
+                limiter = ProviderRateLimiter(provider, s.openai_requests_per_minute, s.openai_max_concurrent_requests)
+            _limiters[provider] = limiter
+        return limiter
@@ -0,0 +1,134 @@
+"""
+Webhook-driven Replicate completion.
+
+With REPLICATE_WEBHOOKS_ENABLED and REPLICATE_WEBHOOK_SECRET, predictions are submitted with a `webhook` URL pointing at
+/api/replicate/webhook. Replicate signs each delivery (webhook-id, webhook-timestamp and
+webhook-signature headers; HMAC-SHA256 over "id.timestamp.body" with the whsec_ secret).
+The endpoint stores the terminal prediction on its art_jobs row and wakes any waiter in this
+process. Waiters in other processes (standalone worker) see the stored payload on their next
+cheap DB check. A real GET to Replicate only happens every REPLICATE_WEBHOOK_SAFETY_POLL_SECONDS
+as a safety net for lost deliveries.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from clients.replicate_client import TERMINAL_STATUSES, ReplicateClient, StyleTransferTimeout
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = "/api/replicate/webhook"
+
+# Reads a webhook-delivered prediction payload stored for prediction_id (None if not delivered yet).
+StoredPredictionLookup = Callable[[str], Awaitable[Optional[Dict[str, Any]]]]
+
+
+def webhook_url() -> Optional[str]:
+    """Public webhook URL when webhook mode is on and PUBLIC_BASE_URL and REPLICATE_WEBHOOK_SECRET are set, else
+    None (poll only). Without a secret deliveries cannot be verified, so the endpoint rejects them."""
+    s = get_settings()
+    base = (s.public_base_url or "").rstrip("/")
+    if not s.replicate_webhooks_enabled or not base or not (s.replicate_webhook_secret or "").strip():
+        return None
+    return f"{base}{WEBHOOK_PATH}"
+
+
+def sign_payload(secret: str, webhook_id: str, timestamp: str, body: bytes) -> str:
+    """Signature value for the webhook-signature header ("v1,<base64>")."""
+    key = base64.b64decode(secret.split("_", 1)[1] if secret.startswith("whsec_") else secret)
+    signed = f"{webhook_id}.{timestamp}.".encode() + body
+    return "v1," + base64.b64encode(hmac.new(key, signed, hashlib.sha256).digest()).decode()
+
+
+def verify_signature(secret: str, headers: Any, body: bytes, tolerance_seconds: int = 300) -> bool:
+    """Check Replicate's webhook signature headers against the body. Rejects stale timestamps (replays)."""
+    webhook_id = headers.get("webhook-id", "")
+    timestamp = headers.get("webhook-timestamp", "")
+    signatures = headers.get("webhook-signature", "")
+    if not (webhook_id and timestamp and signatures):
+        return False
+    try:
+        if abs(time.time() - int(timestamp)) > tolerance_seconds:
+            return False
+        expected = sign_payload(secret, webhook_id, timestamp, body)
+    except (ValueError, TypeError):
+        return False
+    # Header may carry several space-separated signatures during secret rotation.
+    return any(hmac.compare_digest(expected, candidate) for candidate in signatures.split())
+
+
+class PredictionWaiters:
+    """In-process futures keyed by prediction id; resolve() is safe to call from any thread."""
+
+    def __init__(self) -> None:
+        self._waiters: dict[str, tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+
+    def register(self, prediction_id: str) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._waiters[prediction_id] = (loop, fut)
+        return fut
+
+    def discard(self, prediction_id: str) -> None:
+        self._waiters.pop(prediction_id, None)
+
+    def resolve(self, prediction_id: str, payload: Dict[str, Any]) -> bool:
+        """Hand a terminal payload to a local waiter. Returns False if nobody in this process waits for it."""
+        entry = self._waiters.get(prediction_id)
+        if not entry:
+            return False
+        loop, fut = entry
+
+        def _set() -> None:
+            if not fut.done():
+                fut.set_result(payload)
+
+        try:
+            loop.call_soon_threadsafe(_set)
+        except RuntimeError:  # waiter's loop closed
+            return False
+        return True
+
+
+waiters = PredictionWaiters()
+
+
+async def wait_for_prediction(
+    client: ReplicateClient,
+    prediction_id: str,
+    lookup_stored: Optional[StoredPredictionLookup] = None,
+) -> str:
+    """Wait for a webhook-completed prediction and return its output URL.
+    Between deliveries: DB check every JOB_POLL_INTERVAL_SECONDS (if lookup_stored), Replicate GET every
+    REPLICATE_WEBHOOK_SAFETY_POLL_SECONDS. Gives up after the client's polling timeout."""
+    s = get_settings()
+    check_every = max(1, s.job_poll_interval_seconds)
+    safety_every = max(check_every, s.replicate_webhook_safety_poll_seconds)
+    start = time.monotonic()
+    last_safety_poll = start
+    fut = waiters.register(prediction_id)
+    try:
+        while True:
+            if time.monotonic() - start > client.polling_timeout:
+                raise StyleTransferTimeout(f"Webhook wait timed out after {client.polling_timeout}s")
+            try:
+                payload = await asyncio.wait_for(asyncio.shield(fut), timeout=check_every)
+            except asyncio.TimeoutError:
+                payload = await lookup_stored(prediction_id) if lookup_stored else None
+            if payload is None and time.monotonic() - last_safety_poll >= safety_every:
+                last_safety_poll = time.monotonic()
+                try:
+                    payload = await client.aget_prediction(prediction_id)
+                except Exception as e:
+                    logger.warning("Replicate safety poll for %s failed: %s", prediction_id, e)
+            if payload is not None and payload.get("status") in TERMINAL_STATUSES:
+                result_url = client.terminal_output(payload)
+                if result_url:
+                    return result_url
+    finally:
+        waiters.discard(prediction_id)
@@ -0,0 +1,69 @@
+"""
+Content-addressed cache of generated images.
+
+Key: sha256 over (sha256 of the source photo bytes, style image path, prompt fingerprint, portrait
+mode, provider + model, quality). Every stored result row (art_order_result_images) carries its key
+in cache_key, so a new order for the same photo finds earlier outputs by key and copies them
+instead of calling a provider. Eviction follows RESULT_IMAGE_TTL_DAYS: lookups ignore rows older
+than that and the TTL cleanup deletes them; a reused image is stored again for the new order,
+which keeps frequently re-ordered photos warm. Rows within REUSE_MARGIN of the TTL are not reused:
+the cleanup could delete them (and their blob, shared with the new order) before the new row is
+committed.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Optional
+from urllib.parse import urlparse
+
+from sqlalchemy.orm import Session
+
+from config import get_settings
+from database import OrderResultImage
+
+REUSE_MARGIN = timedelta(days=1)  # one TTL cleanup interval (main.TTL_CLEANUP_INTERVAL_SECONDS)
+
+
+def source_digest(data: bytes) -> str:
+    """sha256 hex of the customer's photo bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def result_cache_key(
+    source_sha256: str,
+    style_url: str,
+    prompt: str,
+    portrait_mode: str,
+    provider: str,
+    quality: str,
+) -> str:
+    """Cache key for one generated image. style_url is reduced to its path so a PUBLIC_BASE_URL change keeps hits."""
+    parts = [
+        source_sha256,
+        urlparse(style_url).path or style_url,
+        hashlib.sha256(prompt.encode()).hexdigest(),
+        portrait_mode,
+        provider,
+        quality,
+    ]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+
+def find_cached_result(db: Session, keys: list[str], exclude_order_id: str) -> Optional[OrderResultImage]:
+    """Newest result stored under the first key that has one (keys in order of preference), if it will outlive the
+    next TTL cleanup."""
+    cutoff = datetime.utcnow() - timedelta(days=get_settings().result_image_ttl_days) + REUSE_MARGIN
+    for key in keys:
+        row = (
+            db.query(OrderResultImage)
+            .filter(
+                OrderResultImage.cache_key == key,
+                OrderResultImage.created_at >= cutoff,
+                OrderResultImage.order_id != exclude_order_id,
+            )
+            .order_by(OrderResultImage.created_at.desc())
+            .first()
+        )
+        if row is not None:
+            return row
+    return None
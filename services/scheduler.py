@@ -0,0 +1,173 @@
+"""
+Image-level fair scheduler for generation slots.
+
+Every image waits for a slot here before calling a provider. Waiters are grouped into flows
+(one per order, one per marketing request) and served by weighted fair queuing:
+each image gets a virtual finish tag (flow start + 1/weight), and the waiter with the smallest
+finish tag goes next. A 5-pack therefore interleaves with a running 15-pack instead
+of queueing behind it, and higher priority classes get proportionally more slots.
+Aging subtracts waiting time from the finish tag so low classes are never starved.
+
+Single event loop only (asyncio); create it inside the loop that uses it.
+"""
+import asyncio
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+PRIORITY_FRESH = "fresh"  # first attempt of a newly paid order
+PRIORITY_RESUMED = "resumed"  # job reclaimed after a crash / lease expiry / worker shutdown
+PRIORITY_RETRY = "retry"  # order auto-retry or job retried after a transient error
+PRIORITY_MARKETING = "marketing"  # /api/marketing/style-transfer previews
+
+# Relative share of slots per class when all are backlogged (fresh > resumed > retry > marketing).
+CLASS_WEIGHTS = {
+    PRIORITY_FRESH: 8.0,
+    PRIORITY_RESUMED: 4.0,
+    PRIORITY_RETRY: 2.0,
+    PRIORITY_MARKETING: 1.0,
+}
+
+
+class _Waiter:
+    __slots__ = ("flow", "priority", "start_tag", "finish_tag", "seq", "enqueued_at", "future")
+
+    def __init__(self, flow: str, priority: str, start_tag: float, seq: int, future: asyncio.Future):
+        self.flow = flow
+        self.priority = priority
+        self.start_tag = start_tag
+        self.finish_tag = start_tag + 1.0 / CLASS_WEIGHTS[priority]
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.future = future
+
+
+class _ClassStats:
+    __slots__ = ("waiting", "in_service", "dispatched", "total_wait", "max_wait")
+
+    def __init__(self) -> None:
+        self.waiting = 0
+        self.in_service = 0
+        self.dispatched = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class FairScheduler:
+    """Weighted fair queuing over `slots` concurrent images, at most `per_flow_limit` per flow.
+
+    aging_seconds: waiting this long is worth one weight-1 quantum of virtual time.
+    """
+
+    def __init__(self, slots: int, per_flow_limit: int, aging_seconds: float = 60.0):
+        self.slots = max(1, slots)
+        self.per_flow_limit = max(1, per_flow_limit)
+        self.aging_seconds = max(1.0, aging_seconds)
+        self._vtime = 0.0
+        self._flow_finish: dict[str, float] = {}
+        self._flow_in_service: dict[str, int] = {}
+        self._waiters: list[_Waiter] = []
+        self._in_service = 0
+        self._seq = itertools.count()
+        self._stats = {name: _ClassStats() for name in CLASS_WEIGHTS}
+
+    async def acquire(self, flow: str, priority: str = PRIORITY_FRESH) -> None:
+        """Wait until the scheduler grants this flow a slot."""
+        if priority not in CLASS_WEIGHTS:
+            priority = PRIORITY_FRESH
+        start = max(self._vtime, self._flow_finish.get(flow, 0.0))
+        waiter = _Waiter(flow, priority, start, next(self._seq), asyncio.get_running_loop().create_future())
+        self._flow_finish[flow] = waiter.finish_tag
+        self._waiters.append(waiter)
+        self._stats[priority].waiting += 1
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted and cancelled in the same tick: give the slot back.
+                self.release(flow, priority)
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._stats[priority].waiting -= 1
+                self._forget_flow_if_idle(flow)
+            raise
+
+    def release(self, flow: str, priority: str = PRIORITY_FRESH) -> None:
+        if priority not in CLASS_WEIGHTS:
+            priority = PRIORITY_FRESH
+        self._in_service = max(0, self._in_service - 1)
+        self._flow_in_service[flow] = max(0, self._flow_in_service.get(flow, 0) - 1)
+        self._stats[priority].in_service = max(0, self._stats[priority].in_service - 1)
+        self._forget_flow_if_idle(flow)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, flow: str, priority: str = PRIORITY_FRESH) -> AsyncIterator[None]:
+        await self.acquire(flow, priority)
+        try:
+            yield
+        finally:
+            self.release(flow, priority)
+
+    def _forget_flow_if_idle(self, flow: str) -> None:
+        if self._flow_in_service.get(flow, 0) == 0 and not any(w.flow == flow for w in self._waiters):
+            self._flow_in_service.pop(flow, None)
+            self._flow_finish.pop(flow, None)
+
+    def _next_waiter(self, now: float) -> Optional[_Waiter]:
+        best, best_key = None, None
+        for waiter in self._waiters:
+            if self._flow_in_service.get(waiter.flow, 0) >= self.per_flow_limit:
+                continue
+            key = (waiter.finish_tag - (now - waiter.enqueued_at) / self.aging_seconds, waiter.seq)
+            if best_key is None or key < best_key:
+                best, best_key = waiter, key
+        return best
+
+    def _dispatch(self) -> None:
+        now = time.monotonic()
+        while self._in_service < self.slots:
+            waiter = self._next_waiter(now)
+            if waiter is None:
+                return
+            self._waiters.remove(waiter)
+            if waiter.future.done():  # cancelled while queued
+                self._stats[waiter.priority].waiting -= 1
+                continue
+            self._vtime = max(self._vtime, waiter.start_tag)
+            self._in_service += 1
+            self._flow_in_service[waiter.flow] = self._flow_in_service.get(waiter.flow, 0) + 1
+            stats = self._stats[waiter.priority]
+            waited = now - waiter.enqueued_at
+            stats.waiting -= 1
+            stats.in_service += 1
+            stats.dispatched += 1
+            stats.total_wait += waited
+            stats.max_wait = max(stats.max_wait, waited)
+            waiter.future.set_result(None)
+
+    def stats(self) -> dict:
+        """Queue depth, in-service count and wait times per priority class."""
+        now = time.monotonic()
+        classes = {}
+        for name, st in self._stats.items():
+            oldest = max((now - w.enqueued_at for w in self._waiters if w.priority == name), default=0.0)
+            classes[name] = {
+                "weight": CLASS_WEIGHTS[name],
+                "queued": st.waiting,
+                "in_service": st.in_service,
+                "dispatched": st.dispatched,
+                "avg_wait_seconds": round(st.total_wait / st.dispatched, 2) if st.dispatched else 0.0,
+                "max_wait_seconds": round(st.max_wait, 2),
+                "oldest_queued_seconds": round(oldest, 2),
+            }
+        return {
+            "slots": self.slots,
+            "per_flow_limit": self.per_flow_limit,
+            "in_service": self._in_service,
+            "queued": len(self._waiters),
+            "flows": len(self._flow_finish),
+            "classes": classes,
+        }
@@ -4,17 +4,88 @@ Supports OpenAI (prompt-based) and Replicate (reference-image) providers.
 """
 import asyncio
 import logging
-from typing import Optional, Tuple, Union
+import time
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, ContextManager, Optional, Tuple, Union
+
+import httpx
 
 from clients.openai_stylize_client import OpenAIStylizeClient
-from clients.replicate_client import ReplicateClient
+from clients.replicate_client import (
+    TERMINAL_STATUSES,
+    ReplicateClient,
+    StyleTransferCircuitOpen,
+    StyleTransferError,
+    StyleTransferTimeout,
+)
+from services.prediction_poller import get_prediction_poller
+from services.rate_limiter import get_provider_limiter
+from services.replicate_webhooks import StoredPredictionLookup, wait_for_prediction, webhook_url
 
 logger = logging.getLogger(__name__)
 
+# Fire-and-forget cancels of abandoned Replicate predictions (kept referenced until done)
+_CANCEL_TASKS: set[asyncio.Task] = set()
+
+# Replicate deletes output files of API predictions after an hour; older outputs cannot be fetched.
+REPLICATE_OUTPUT_RETENTION_SECONDS = 3600
+
+
+def _output_expired(prediction: dict) -> bool:
+    if prediction.get("data_removed"):
+        return True
+    completed = prediction.get("completed_at")
+    if not completed:
+        return False
+    try:
+        completed_at = datetime.fromisoformat(str(completed).replace("Z", "+00:00"))
+    except ValueError:
+        return False
+    if completed_at.tzinfo is None:
+        completed_at = completed_at.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - completed_at).total_seconds() > REPLICATE_OUTPUT_RETENTION_SECONDS
+
 
 class StyleTransferService:
-    def __init__(self, provider: Union[ReplicateClient, OpenAIStylizeClient]):
+    def __init__(
+        self,
+        provider: Union[ReplicateClient, OpenAIStylizeClient],
+        prediction_lookup: Optional[StoredPredictionLookup] = None,
+    ):
         self.provider = provider
+        # Webhook mode: reads predictions delivered to another process's /api/replicate/webhook
+        self.prediction_lookup = prediction_lookup
+
+    @property
+    def provider_name(self) -> str:
+        return "openai" if isinstance(self.provider, OpenAIStylizeClient) else "replicate"
+
+    def _admit(self) -> ContextManager[None]:
+        """Pass the provider's circuit breaker (raises StyleTransferCircuitOpen while it is open)."""
+        breaker = self.provider.circuit_breaker
+        return breaker.call() if breaker is not None else nullcontext()
+
+    def _cancel_in_background(self, prediction_id: str) -> None:
+        task = asyncio.get_running_loop().create_task(self.provider.acancel_prediction(prediction_id))
+        _CANCEL_TASKS.add(task)
+        task.add_done_callback(_CANCEL_TASKS.discard)
+
+    async def _wait_for_result(self, prediction_id: str, hook: Optional[str]) -> str:
+        if hook:
+            return await wait_for_prediction(self.provider, prediction_id, self.prediction_lookup)
+        # Shared batch poller: one refresh per tick for all in-flight predictions of the process
+        return await get_prediction_poller(self.provider).wait(prediction_id)
+
+    def _record_outcome(self, started: float, error: Optional[StyleTransferError] = None) -> None:
+        """Report a finished call to the breaker. HTTP-level transient errors are reported by the client itself."""
+        breaker = self.provider.circuit_breaker
+        if breaker is None or isinstance(error, StyleTransferCircuitOpen):
+            return
+        if error is None:
+            breaker.record_success(time.monotonic() - started)
+        else:
+            breaker.record_failure(str(error)[:200])
 
     def _transfer_style_sync(
         self,
@@ -26,14 +97,18 @@ class StyleTransferService:
         quality: Optional[str] = None,
         output_quality: Optional[int] = None,
     ) -> Tuple[Union[str, dict], str]:
-        """Blocking provider calls. Returns (result_url or {content, content_type}, job_id)."""
+        """Blocking provider calls. Returns (result_url or {content, content_type}, job_id).
+        Each call holds a slot of the process-wide limiter for its provider."""
         if isinstance(self.provider, OpenAIStylizeClient):
             if not style_prompt:
                 raise ValueError("style_prompt required when using OpenAI provider")
             full_prompt = style_prompt + (prompt_suffix or "")
-            content, content_type = self.provider.stylize(
-                image_url, full_prompt, input_fidelity="high", quality=quality
-            )
+            with self._admit(), get_provider_limiter(self.provider_name).slot():
+                started = time.monotonic()
+                content, content_type = self.provider.stylize(
+                    image_url, full_prompt, input_fidelity="high", quality=quality
+                )
+                self._record_outcome(started)
             logger.info(
                 "OpenAI style transfer completed",
                 extra={"image_url": image_url[:80]},
@@ -42,14 +117,21 @@ class StyleTransferService:
         else:
             if not style_image_url:
                 raise ValueError("style_image_url required when using Replicate provider")
-            job_id = self.provider.submit_style_transfer(
-                image_url, style_image_url, structure_denoising_strength, prompt_suffix=prompt_suffix, output_quality=output_quality
-            )
-            logger.info(
-                "Style transfer submitted",
-                extra={"job_id": job_id, "image_url": image_url[:80]},
-            )
-            result_url = self.provider.poll_result(job_id)
+            with self._admit(), get_provider_limiter(self.provider_name).slot():
+                started = time.monotonic()
+                job_id = self.provider.submit_style_transfer(
+                    image_url, style_image_url, structure_denoising_strength, prompt_suffix=prompt_suffix, output_quality=output_quality
+                )
+                logger.info(
+                    "Style transfer submitted",
+                    extra={"job_id": job_id, "image_url": image_url[:80]},
+                )
+                try:
+                    result_url = self.provider.poll_result(job_id)
+                except StyleTransferError as e:
+                    self._record_outcome(started, e)
+                    raise
+                self._record_outcome(started)
             logger.info(
                 "Style transfer completed",
                 extra={"job_id": job_id, "result_url": result_url[:80]},
@@ -86,15 +168,105 @@ class StyleTransferService:
         prompt_suffix: Optional[str] = None,
         quality: Optional[str] = None,
         output_quality: Optional[int] = None,
-    ) -> Tuple[str, str]:
-        """Run style transfer without blocking event loop."""
-        return await asyncio.to_thread(
-            self._transfer_style_sync,
-            image_url,
-            style_image_url,
-            structure_denoising_strength,
-            style_prompt,
-            prompt_suffix,
-            quality,
-            output_quality,
+        on_submit: Optional[Callable[[str], Awaitable[None]]] = None,
+    ) -> Tuple[Union[str, dict], str]:
+        """Async provider calls on the event loop (no worker threads). Same return shape as transfer_style_sync.
+        on_submit(prediction_id) runs right after a Replicate submit, before waiting for the result."""
+        limiter = get_provider_limiter(self.provider_name)
+        if isinstance(self.provider, OpenAIStylizeClient):
+            if not style_prompt:
+                raise ValueError("style_prompt required when using OpenAI provider")
+            full_prompt = style_prompt + (prompt_suffix or "")
+            with self._admit():
+                async with limiter.aslot():
+                    started = time.monotonic()
+                    content, content_type = await self.provider.astylize(
+                        image_url, full_prompt, input_fidelity="high", quality=quality
+                    )
+                    self._record_outcome(started)
+            logger.info(
+                "OpenAI style transfer completed",
+                extra={"image_url": image_url[:80]},
+            )
+            return {"content": content, "content_type": content_type}, "openai"
+        if not style_image_url:
+            raise ValueError("style_image_url required when using Replicate provider")
+        hook = webhook_url()
+        with self._admit():
+            started = time.monotonic()
+            # The limiter slot covers only the submit request: waiting goes through the shared poller or a webhook,
+            # which make no per-prediction API calls, so in-flight predictions are not capped by the slot count.
+            async with limiter.aslot():
+                job_id = await self.provider.asubmit_style_transfer(
+                    image_url,
+                    style_image_url,
+                    structure_denoising_strength,
+                    prompt_suffix=prompt_suffix,
+                    output_quality=output_quality,
+                    webhook=hook,
+                )
+            logger.info(
+                "Style transfer submitted",
+                extra={"job_id": job_id, "image_url": image_url[:80], "webhook": bool(hook)},
+            )
+            try:
+                if on_submit:
+                    await on_submit(job_id)
+                result_url = await self._wait_for_result(job_id, hook)
+            except asyncio.CancelledError:
+                # Abandoned (e.g. lost a hedge): stop paying for the prediction.
+                self._cancel_in_background(job_id)
+                raise
+            except StyleTransferError as e:
+                self._record_outcome(started, e)
+                raise
+            self._record_outcome(started)
+        logger.info(
+            "Style transfer completed",
+            extra={"job_id": job_id, "result_url": result_url[:80]},
         )
+        return result_url, job_id
+
+    async def resume_prediction(
+        self, prediction_id: str, submitted_at: Optional[datetime] = None
+    ) -> Optional[Tuple[str, str]]:
+        """Pick up a Replicate prediction submitted before a restart instead of paying for a new one.
+        Returns (result_url, prediction_id) once it succeeds, or None when it failed, was canceled or is gone,
+        its output has expired, or it has run past the polling timeout (the caller then submits a new one)."""
+        if not isinstance(self.provider, ReplicateClient):
+            return None
+        try:
+            async with get_provider_limiter(self.provider_name).aslot():
+                prediction = await self.provider.aget_prediction(prediction_id)
+        except (StyleTransferError, httpx.HTTPError) as e:
+            logger.warning("Cannot resume prediction %s: %s", prediction_id, e)
+            return None
+        status = prediction.get("status")
+        if status == "succeeded":
+            if _output_expired(prediction):
+                return None
+            try:
+                return self.provider.terminal_output(prediction), prediction_id
+            except StyleTransferError:
+                return None
+        if status in TERMINAL_STATUSES:
+            return None
+        age = (datetime.utcnow() - submitted_at).total_seconds() if submitted_at else 0.0
+        remaining = self.provider.polling_timeout - age
+        if remaining <= 0:
+            self._cancel_in_background(prediction_id)
+            return None
+        # No limiter slot while waiting (see transfer_style): the poller / webhook does the API calls
+        try:
+            result_url = await asyncio.wait_for(self._wait_for_result(prediction_id, webhook_url()), remaining)
+        except asyncio.CancelledError:
+            self._cancel_in_background(prediction_id)
+            raise
+        except (asyncio.TimeoutError, StyleTransferTimeout):
+            self._cancel_in_background(prediction_id)
+            return None
+        except StyleTransferError as e:
+            logger.info("Resumed prediction %s did not succeed: %s", prediction_id, e)
+            return None
+        logger.info("Resumed style transfer completed", extra={"job_id": prediction_id, "result_url": result_url[:80]})
+        return result_url, prediction_id
@@ -0,0 +1,62 @@
+"""
+Provider variants of the style reference images.
+
+scripts/build_style_variants.py (run at build time) writes a capped copy of every pack image
+(long edge <= 1024, progressive JPEG) next to it as <pack>/provider/<name>.jpg and lists them in
+static/landing/styles/provider-variants.json. Providers re-download the style image for every
+prediction, so orders send the variant URL instead of the multi-MB original. The registry is the
+manifest as loaded once per process; an entry whose variant file is missing or whose source has
+changed size since the build is ignored and the original path is used.
+"""
+import json
+import logging
+import posixpath
+from functools import lru_cache
+from pathlib import Path
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = Path(__file__).resolve().parent.parent  # URL paths "/static/..." resolve against this
+MANIFEST_PATH = REPO_ROOT / "static" / "landing" / "styles" / "provider-variants.json"
+VARIANT_DIRNAME = "provider"
+
+
+def variant_path_for(style_path: str) -> str:
+    """URL path where the build step writes the variant of style_path (same stem, .jpg)."""
+    folder, name = posixpath.split(style_path)
+    return posixpath.join(folder, VARIANT_DIRNAME, posixpath.splitext(name)[0] + ".jpg")
+
+
+@lru_cache(maxsize=1)
+def _registry() -> dict[str, dict]:
+    try:
+        manifest = json.loads(MANIFEST_PATH.read_text())
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning("Style variant manifest unreadable, using original style images: %s", e)
+        return {}
+    registry = {}
+    for path, entry in manifest.items():
+        source = REPO_ROOT / path.lstrip("/")
+        variant = REPO_ROOT / str(entry.get("variant", "")).lstrip("/")
+        try:
+            if variant.is_file() and source.stat().st_size == entry.get("source_bytes"):
+                registry[path] = entry
+        except OSError:
+            continue
+    stale = len(manifest) - len(registry)
+    if stale:
+        logger.warning("%d style variants missing or stale; rerun scripts/build_style_variants.py", stale)
+    return registry
+
+
+def provider_style_path(style_path: str) -> str:
+    """Path of the provider variant for a pack image, or style_path itself when there is none."""
+    if not style_path or not get_settings().style_variants_enabled:
+        return style_path
+    entry = _registry().get(style_path)
+    return entry["variant"] if entry else style_path
+
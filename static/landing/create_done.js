@@ -79,36 +79,43 @@
       pollTimer = setTimeout(fetchStatus, 8000);
     }
 
+    // Returns true once the order reached a final state (nothing more to wait for).
+    function handleStatus(data) {
+      var status = (data.status || '').toLowerCase();
+      var resultUrls = data.result_urls;
+      var urls = [];
+      if (resultUrls) {
+        try { urls = typeof resultUrls === 'string' ? JSON.parse(resultUrls) : (resultUrls || []); } catch (e) {}
+      }
+
+      // result_urls fills in image by image while processing; the gallery is ready once the order completed
+      if (status === 'completed' && urls.length > 0) {
+        onGalleryReady();
+        return true;
+      }
+
+      if (status === 'failed' && data.error) {
+        if (doneMessageText) doneMessageText.textContent = 'Ceva nu a mers bine: ' + (data.error || 'Eroare necunoscută') + '. Contactează-ne la artify.system@gmail.com cu ID-ul comenzii: ' + orderId;
+        if (doneTitle) doneTitle.textContent = 'Eroare la procesare';
+        return true;
+      }
+
+      // Payment is confirmed (paid or processing)
+      if ((status === 'paid' || status === 'processing') && !paymentConfirmedAt) {
+        paymentConfirmedAt = Date.now();
+        onPaymentConfirmed();
+      }
+      return false;
+    }
+
     function fetchStatus() {
       fetch('/api/orders/' + encodeURIComponent(orderId) + '/status')
         .then(function (r) { return r.json(); })
         .then(function (data) {
-          var status = (data.status || '').toLowerCase();
-          var resultUrls = data.result_urls;
-          var urls = [];
-          if (resultUrls) {
-            try { urls = typeof resultUrls === 'string' ? JSON.parse(resultUrls) : (resultUrls || []); } catch (e) {}
-          }
-
-          if (urls.length > 0) {
-            onGalleryReady();
+          if (handleStatus(data)) {
             stopPolling();
             return;
           }
-
-          if (status === 'failed' && data.error) {
-            if (doneMessageText) doneMessageText.textContent = 'Ceva nu a mers bine: ' + (data.error || 'Eroare necunoscută') + '. Contactează-ne la artify.system@gmail.com cu ID-ul comenzii: ' + orderId;
-            if (doneTitle) doneTitle.textContent = 'Eroare la procesare';
-            stopPolling();
-            return;
-          }
-
-          // Payment is confirmed (paid or processing)
-          if ((status === 'paid' || status === 'processing') && !paymentConfirmedAt) {
-            paymentConfirmedAt = Date.now();
-            onPaymentConfirmed();
-          }
-
           scheduleNextPoll();
         })
         .catch(function () {
@@ -116,6 +123,34 @@
         });
     }
 
-    fetchStatus();
+    // Server-Sent Events push every status change; polling is the fallback (no EventSource, stream refused).
+    function listen() {
+      var events = new EventSource('/api/orders/' + encodeURIComponent(orderId) + '/events');
+      var closeTimer = setTimeout(function () {
+        events.close();
+        if (paymentConfirmedAt) onPaymentConfirmed();
+      }, maxPollMs);
+      events.addEventListener('status', function (e) {
+        var data;
+        try { data = JSON.parse(e.data); } catch (err) { return; }
+        if (handleStatus(data)) {
+          events.close();
+          clearTimeout(closeTimer);
+        }
+      });
+      events.addEventListener('error', function () {
+        // CLOSED: the server refused the stream; the browser retries by itself otherwise
+        if (events.readyState === EventSource.CLOSED) {
+          clearTimeout(closeTimer);
+          fetchStatus();
+        }
+      });
+    }
+
+    if (window.EventSource) {
+      listen();
+    } else {
+      fetchStatus();
+    }
   }
 })();
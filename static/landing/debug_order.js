@@ -83,6 +83,7 @@
           } catch (e) {}
         }
         if (!Array.isArray(urls)) urls = [];
+        urls = urls.filter(Boolean); // "" marks images of the pack that are not done yet
         if (urls.length === 0 && data.replicate_prediction_details) {
           var details = data.replicate_prediction_details;
           try {
@@ -18,6 +18,8 @@
   var globalUrls = [];
   var globalStyleUrls = [];
   var globalLabels = [];
+  var globalThumbs = [];
+  var globalSrcsets = [];
   var currentIndex = 0;
 
   if (idEl) idEl.textContent = orderId || '—';
@@ -203,6 +205,9 @@
     currentIndex = index;
     
     var imgUrl = globalUrls[currentIndex];
+    // Let the browser pick the thumb/medium WebP or the original for the hero's width (srcset from the status API)
+    var srcsetAttr = globalSrcsets[currentIndex] ?
+      ' srcset="' + globalSrcsets[currentIndex] + '" sizes="(max-width: 640px) 100vw, 600px"' : '';
     var styleImgUrl = null;
     
     if (globalStyleUrls && globalStyleUrls.length > currentIndex) {
@@ -217,7 +222,7 @@
             '<span class="museum-compare-label museum-compare-label-right">Original</span>' +
           '</div>' +
           '<div class="museum-compare-after">' +
-            '<img src="' + imgUrl + '" alt="Portretul tău" />' +
+            '<img src="' + imgUrl + '"' + srcsetAttr + ' alt="Portretul tău" />' +
             '<span class="museum-compare-label museum-compare-label-left">Tu</span>' +
           '</div>' +
           '<div class="museum-compare-divider" id="museum-compare-divider">' +
@@ -234,7 +239,7 @@
       }
     } else {
       var loadingAttr = (currentIndex === 0) ? ' loading="eager" fetchpriority="high"' : '';
-      heroWrap.innerHTML = '<img src="' + imgUrl + '" class="museum-hero-img" alt="Operă"' + loadingAttr + ' />';
+      heroWrap.innerHTML = '<img src="' + imgUrl + '"' + srcsetAttr + ' class="museum-hero-img" alt="Operă"' + loadingAttr + ' />';
     }
     
     // Update caption
@@ -280,6 +285,98 @@
     });
   }
 
+  function nudgeFilmstrip() {
+    // Nudge filmstrip to hint it's scrollable
+    var el = filmstripEl;
+    if (!el) return;
+    var distance = 120;
+    var duration = 600;
+    setTimeout(function() {
+      var start = null;
+      var startLeft = 0;
+      function stepFwd(ts) {
+        if (!start) start = ts;
+        var p = Math.min((ts - start) / duration, 1);
+        var e = p < 0.5 ? 2*p*p : -1 + (4 - 2*p)*p;
+        el.scrollLeft = startLeft + distance * e;
+        if (p < 1) { requestAnimationFrame(stepFwd); }
+        else {
+          var start2 = null; var fromLeft = el.scrollLeft;
+          function stepBack(ts2) {
+            if (!start2) start2 = ts2;
+            var p2 = Math.min((ts2 - start2) / duration, 1);
+            var e2 = p2 < 0.5 ? 2*p2*p2 : -1 + (4 - 2*p2)*p2;
+            el.scrollLeft = fromLeft - distance * e2;
+            if (p2 < 1) requestAnimationFrame(stepBack);
+          }
+          requestAnimationFrame(stepBack);
+        }
+      }
+      requestAnimationFrame(stepFwd);
+    }, 800);
+  }
+
+  // Gallery of data.urls / data.styleUrls / data.labels (+ data.thumbs / data.srcsets when variants exist). Called again as more portraits arrive: the filmstrip grows,
+  // the portrait being viewed stays put. The ZIP download only appears once the whole pack is done (final).
+  var galleryShown = false;
+  function showGallery(data, final) {
+    var packNameEl = document.getElementById('museum-pack-name');
+    if (packNameEl) {
+      if (data.style_name) {
+        packNameEl.textContent = data.style_name;
+        packNameEl.style.display = '';
+      } else {
+        packNameEl.style.display = 'none';
+      }
+    }
+
+    var grew = !galleryShown || data.urls.join('\n') !== globalUrls.join('\n');
+    globalUrls = data.urls;
+    globalStyleUrls = data.styleUrls;
+    globalLabels = data.labels;
+    globalThumbs = data.thumbs || [];
+    globalSrcsets = data.srcsets || [];
+
+    if (grew) {
+      filmstripEl.innerHTML = '';
+      globalUrls.forEach(function (url, i) {
+        var btn = document.createElement('button');
+        btn.className = 'filmstrip-item';
+        btn.onclick = function() { showImage(i); };
+
+        var img = document.createElement('img');
+        img.src = globalThumbs[i] || url;
+        img.alt = 'Thumbnail ' + (i + 1);
+        img.loading = 'lazy';
+
+        btn.appendChild(img);
+        filmstripEl.appendChild(btn);
+      });
+    }
+
+    if (!galleryShown) {
+      currentIndex = 0;
+      showImage(0);
+      nudgeFilmstrip();
+      if (shareWrapEl) {
+        shareWrapEl.style.display = 'block';
+      }
+      galleryShown = true;
+    } else if (grew) {
+      showImage(Math.min(currentIndex, globalUrls.length - 1));
+    }
+
+    if (downloadBtn) {
+      if (final && orderId) {
+        downloadBtn.href = '/api/orders/' + encodeURIComponent(orderId) + '/download-all';
+        downloadBtn.style.display = '';
+      } else {
+        downloadBtn.style.display = 'none';
+      }
+    }
+    resultsEl.style.display = 'block';
+  }
+
   function render(state, data) {
     console.log('Render called with state:', state, 'data:', data);
     if (!stateEl) {
@@ -307,107 +404,102 @@
       document.body.classList.remove('museum-mode');
       return;
     }
+    if (state === 'partial') {
+      // Some portraits are ready while the rest of the pack is still generating: show them now, keep the note on top.
+      stateEl.innerHTML = '<p class="order-status-processing">' + data.ready + ' din ' + data.total +
+        ' portrete sunt gata. Restul apar aici pe măsură ce se creează.</p>';
+      if (infoCardEl) infoCardEl.style.display = 'none';
+      document.body.classList.add('museum-mode');
+      showGallery(data, false);
+      return;
+    }
     if (state === 'completed' && data.result_urls) {
       if (infoCardEl) infoCardEl.style.display = 'none';
       if (orderStatusWrap) orderStatusWrap.style.display = 'none'; // Hide "Se încarcă" div
       document.body.classList.add('museum-mode');
 
       try {
-        globalUrls = typeof data.result_urls === 'string' ? JSON.parse(data.result_urls) : (data.result_urls || []);
+        data.urls = typeof data.result_urls === 'string' ? JSON.parse(data.result_urls) : (data.result_urls || []);
       } catch (e) {
         console.error('Error parsing result_urls:', e, data.result_urls);
-        globalUrls = [];
+        data.urls = [];
       }
       try {
-        globalStyleUrls = typeof data.style_image_urls === 'string' ? JSON.parse(data.style_image_urls) : (data.style_image_urls || []);
+        data.styleUrls = typeof data.style_image_urls === 'string' ? JSON.parse(data.style_image_urls) : (data.style_image_urls || []);
       } catch (e) {
         console.error('Error parsing style_image_urls:', e, data.style_image_urls);
-        globalStyleUrls = [];
+        data.styleUrls = [];
       }
-      globalLabels = data.result_labels || [];
+      data.labels = data.result_labels || [];
+      var byUrl = {};
+      (data.images || []).forEach(function (img) { if (img.url) byUrl[img.url] = img; });
+      data.thumbs = data.urls.map(function (url) { return byUrl[url] ? byUrl[url].thumb_url : null; });
+      data.srcsets = data.urls.map(function (url) { return byUrl[url] ? byUrl[url].srcset : null; });
 
-      if (!globalUrls || globalUrls.length === 0) {
+      if (!data.urls || data.urls.length === 0) {
         console.error('No result URLs found for completed order:', data);
         render('failed', { error: 'Comanda este completă dar nu are imagini rezultate. Contactează-ne la artify.system@gmail.com cu ID-ul: ' + orderId });
         return;
       }
-
-      if (globalUrls.length) {
-        var packNameEl = document.getElementById('museum-pack-name');
-        if (packNameEl) {
-          if (data.style_name) {
-            packNameEl.textContent = data.style_name;
-            packNameEl.style.display = '';
-          } else {
-            packNameEl.style.display = 'none';
-          }
-        }
-
-        filmstripEl.innerHTML = '';
-        
-        globalUrls.forEach(function (url, i) {
-          var btn = document.createElement('button');
-          btn.className = 'filmstrip-item';
-          btn.onclick = function() { showImage(i); };
-          
-          var img = document.createElement('img');
-          img.src = url;
-          img.alt = 'Thumbnail ' + (i + 1);
-          img.loading = 'lazy';
-          
-          btn.appendChild(img);
-          filmstripEl.appendChild(btn);
-        });
-
-        // Initialize first image
-        currentIndex = 0;
-        showImage(0);
-
-        // Nudge filmstrip to hint it's scrollable
-        (function nudgeFilmstrip() {
-          var el = filmstripEl;
-          if (!el) return;
-          var distance = 120;
-          var duration = 600;
-          setTimeout(function() {
-            var start = null;
-            var startLeft = 0;
-            function stepFwd(ts) {
-              if (!start) start = ts;
-              var p = Math.min((ts - start) / duration, 1);
-              var e = p < 0.5 ? 2*p*p : -1 + (4 - 2*p)*p;
-              el.scrollLeft = startLeft + distance * e;
-              if (p < 1) { requestAnimationFrame(stepFwd); }
-              else {
-                var start2 = null; var fromLeft = el.scrollLeft;
-                function stepBack(ts2) {
-                  if (!start2) start2 = ts2;
-                  var p2 = Math.min((ts2 - start2) / duration, 1);
-                  var e2 = p2 < 0.5 ? 2*p2*p2 : -1 + (4 - 2*p2)*p2;
-                  el.scrollLeft = fromLeft - distance * e2;
-                  if (p2 < 1) requestAnimationFrame(stepBack);
-                }
-                requestAnimationFrame(stepBack);
-              }
-            }
-            requestAnimationFrame(stepFwd);
-          }, 800);
-        })();
-
-        if (shareWrapEl) {
-          shareWrapEl.style.display = 'block';
-        }
-
-        if (downloadBtn && orderId) {
-          downloadBtn.href = '/api/orders/' + encodeURIComponent(orderId) + '/download-all';
-        }
-        resultsEl.style.display = 'block';
-      }
+      showGallery(data, true);
       return;
     }
     stateEl.innerHTML = '<p class="order-status-loading">Status necunoscut.</p>';
   }
 
+  function handleStatus(data) {
+    var status = (data.status || '').toLowerCase();
+    if (status === 'completed') {
+      if (!data.result_urls) {
+        console.warn('Order completed but no result_urls:', data);
+        render('failed', { error: 'Comanda este completă dar nu are imagini rezultate. Contactează-ne la artify.system@gmail.com' });
+        return;
+      }
+      render('completed', data);
+    } else if (status === 'failed') {
+      render('failed', { error: data.error || 'Comanda a eșuat.' });
+    } else if (status === 'processing' || status === 'paid' || status === 'pending') {
+      var ready = readyImages(data);
+      if (ready) render('partial', ready);
+      else if (!galleryShown) render('processing');
+      listen();
+    } else {
+      console.warn('Unknown order status:', status, data);
+      render('failed', { error: data.detail || 'Status necunoscut pentru comandă: ' + status });
+    }
+  }
+
+  // Finished portraits of an order still in flight, in pack order (data.images, one entry per image), or null.
+  function readyImages(data) {
+    var images = data.images || [];
+    var done = images.filter(function (img) { return img.state === 'done' && img.url; });
+    if (!done.length) return null;
+    return {
+      style_name: data.style_name,
+      urls: done.map(function (img) { return img.url; }),
+      styleUrls: done.map(function (img) { return img.style_image_url; }),
+      labels: done.map(function (img) { return img.label || []; }),
+      thumbs: done.map(function (img) { return img.thumb_url; }),
+      srcsets: done.map(function (img) { return img.srcset; }),
+      ready: done.length,
+      total: images.length
+    };
+  }
+
+  // While the order is in flight, the server pushes every change (SSE); show the gallery as soon as it completes.
+  var events = null;
+  function listen() {
+    if (events || !window.EventSource) return;
+    events = new EventSource('/api/orders/' + encodeURIComponent(orderId) + '/events');
+    events.addEventListener('status', function (e) {
+      var data;
+      try { data = JSON.parse(e.data); } catch (err) { return; }
+      var status = (data.status || '').toLowerCase();
+      if (status === 'completed' || status === 'failed') events.close();
+      handleStatus(data);
+    });
+  }
+
   function check() {
     if (!orderId) {
       render('failed', { error: 'Lipsă ID comandă în URL.' });
@@ -435,22 +527,7 @@
       .then(function (data) {
         if (!data) return; // Already handled error case
         console.log('Order status response:', data);
-        var status = (data.status || '').toLowerCase();
-        if (status === 'completed') {
-          if (!data.result_urls) {
-            console.warn('Order completed but no result_urls:', data);
-            render('failed', { error: 'Comanda este completă dar nu are imagini rezultate. Contactează-ne la artify.system@gmail.com' });
-            return;
-          }
-          render('completed', data);
-        } else if (status === 'failed') {
-          render('failed', { error: data.error || 'Comanda a eșuat.' });
-        } else if (status === 'processing' || status === 'paid' || status === 'pending') {
-          render('processing');
-        } else {
-          console.warn('Unknown order status:', status, data);
-          render('failed', { error: data.detail || 'Status necunoscut pentru comandă: ' + status });
-        }
+        handleStatus(data);
       })
       .catch(function (err) {
         console.error('Error fetching order status:', err);
@@ -0,0 +1,122 @@
+"""
+Standalone generation worker: drains the art_jobs queue outside the Uvicorn web process,
+so web and generation capacity scale separately and web redeploys don't kill in-flight orders.
+
+Run with:
+    python -m worker [--max-concurrent-orders N] [--health-port PORT]
+
+Set EMBEDDED_WORKER=false on the web service so it only enqueues work.
+On SIGTERM/SIGINT the worker stops claiming, waits up to WORKER_SHUTDOWN_GRACE_SECONDS for
+in-flight jobs, then returns any still-leased jobs to the queue and exits.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+
+import main
+from config import get_settings
+from database import SessionLocal
+from services.job_queue import WORKER_ID, release_worker_jobs
+
+logger = logging.getLogger("worker")
+
+
+async def _serve_health(port: int, stop_event: asyncio.Event) -> asyncio.AbstractServer:
+    """Minimal HTTP health probe: 200 while dispatching normally, 503 when stale or draining."""
+    poll = get_settings().job_poll_interval_seconds
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            writer.close()
+            return
+        status = main._dispatch_status()
+        age = status["last_tick_age_seconds"]
+        healthy = not stop_event.is_set() and age is not None and age <= poll * 3 + 30
+        status["status"] = "ok" if healthy else ("draining" if stop_event.is_set() else "stale")
+        body = json.dumps(status).encode()
+        head = (
+            f"HTTP/1.1 {'200 OK' if healthy else '503 Service Unavailable'}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(head.encode() + body)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host="0.0.0.0", port=port)
+
+
+def _release_leases_sync() -> int:
+    db = SessionLocal()
+    try:
+        released = release_worker_jobs(db)
+        db.commit()
+        return released
+    finally:
+        db.close()
+
+
+async def run(max_concurrent_orders: int, health_port: int, grace_seconds: int) -> None:
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:  # Windows
+            signal.signal(sig, lambda *_: loop.call_soon_threadsafe(stop_event.set))
+
+    health_server = await _serve_health(health_port, stop_event) if health_port else None
+    logger.info(
+        "Worker %s started (max_concurrent_orders=%d, health_port=%s)",
+        WORKER_ID, max_concurrent_orders, health_port or "off",
+    )
+    dispatcher = asyncio.create_task(main._job_dispatch_loop(max_concurrent_orders, stop_event))
+    # Keeps renewing leases while in-flight jobs drain after the dispatcher stops
+    heartbeat = asyncio.create_task(main._job_lease_heartbeat_loop())
+    await stop_event.wait()
+    logger.info("Shutdown requested; no new jobs will be claimed")
+    main._wake_dispatcher()
+    await dispatcher
+
+    deadline = time.monotonic() + grace_seconds
+    while main._DISPATCHED_TASKS and time.monotonic() < deadline:
+        logger.info("Waiting for %d in-flight job(s) to finish", len(main._ACTIVE_JOB_IDS))
+        await asyncio.wait(set(main._DISPATCHED_TASKS), timeout=min(10, max(0.1, deadline - time.monotonic())))
+    heartbeat.cancel()
+    main.shutdown_preprocess_pool()  # result variants are built in this pool
+    if health_server:
+        health_server.close()
+    if main._DISPATCHED_TASKS:
+        released = await asyncio.to_thread(_release_leases_sync)
+        logger.warning("Grace period over; returned %d job(s) to the queue, exiting", released)
+        # Remaining tasks are abandoned; their leases were just released so another worker picks them up.
+        logging.shutdown()
+        os._exit(0)
+    logger.info("Worker %s stopped cleanly", WORKER_ID)
+
+
+def parse_args() -> argparse.Namespace:
+    s = get_settings()
+    parser = argparse.ArgumentParser(description="Artify generation worker")
+    parser.add_argument(
+        "--max-concurrent-orders",
+        type=int,
+        default=s.worker_max_concurrent_orders or s.max_concurrent_orders,
+    )
+    parser.add_argument("--health-port", type=int, default=s.worker_health_port, help="0 disables the probe")
+    parser.add_argument("--grace-seconds", type=int, default=s.worker_shutdown_grace_seconds)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(run(args.max_concurrent_orders, args.health_port, args.grace_seconds))